@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains batched versions of the nodal load observer for many scenarios of the same network, e.g.,
+Monte Carlo draws of pseudo-measurements or different days of measurement data.
+
+All scenarios share topology, measurement locations and dynamic model; they differ in measured values,
+pseudo-measurements, uncertainties and slack voltages. Scenario data are given as stacked arrays with the scenario
+index as first axis. In each time step prediction, gain and correction are carried out for all scenarios at once
+by broadcasting, and the admittance matrix is factorized only once. Hence, the Python overhead per time step is
+paid once for all scenarios.
+
+The quasi-linear Kalman filter and the iterated extended Kalman filter are batched. The iterated filter linearizes
+at the voltages of each scenario, hence Jacobians are evaluated per scenario, while gain and correction of all
+scenarios are computed by stacked solves. Scenarios which have converged are masked out of further iterations, so
+each scenario carries out the same iterations as with `IteratedExtendedKalman`. `NLOextended` is not batched;
+its scenarios are evaluated one after the other (e.g. distributed over processes, see parallel.py).
+
+"""
+
+import numpy as np
+from scipy.sparse import issparse
+
+from tools.data_tools import separate_Yslack, makeYbus
+from NLO.factorization import factorize
+from NLO.convergence import Criterion, criteria
+from NLO.nodal_load_observer import get_system_matrices, amph_phase_to_real_imag_batch, jacobian, JacobianPattern, \
+	_solve
+
+
+def _stacked(a, nS, shape):
+	"""Broadcast a (float, (n,), (n,nT) or (nS,n,nT) shaped array) to shape (n,nT,nS)"""
+	a = np.asarray(a, dtype=float)
+	if a.ndim == 1:
+		a = a[:, np.newaxis]
+	return np.transpose(np.broadcast_to(a, (nS,) + shape), (1, 2, 0))
+
+
+def _apply_M(V, x):
+	"""Calculate M(V)*x for each scenario (columns of V and x), cf. calcM in nodal_load_observer.py"""
+	n = V.shape[0]//2
+	divisor = 3*(V[:n]**2 + V[n:]**2)
+	a = V[:n]/divisor
+	b = V[n:]/divisor
+	return np.r_[a*x[:n] + b*x[n:], b*x[:n] - a*x[n:]], a, b
+
+
+def _forecast_unc(model, P):
+	"""One step ahead prediction of the error covariances P of shape (nS,n,n) for all scenarios at once"""
+	if not hasattr(model, "return_pars"):
+		return np.array([model.forecast_unc(Ps) for Ps in P])
+	A, Q = model.return_pars()
+	PAt = np.dot(P, A.T)	# P*A' for all scenarios
+	return np.transpose(np.dot(np.transpose(PAt, (0,2,1)), A.T), (0,2,1)) + Q
+
+
+def BatchLinearKalmanFilter(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
+							Vs, slack_idx=0, Y=None, sparse=None, convergence=None):
+	"""
+	Quasi-Linear Kalman filter for the nodal load observer (see `LinearKalmanFilter` in nodal_load_observer.py)
+	for nS scenarios at once. For each scenario the results are the same as those of `LinearKalmanFilter`.
+
+	:param topology: dict containing information on bus, branch, ... in PyPower format
+	:param meas: dict containing measurements "Pk", "Qk", "Vm" and "Va"; each of shape (nS,n_key,nT) or (n_key,nT)
+	:param meas_unc: dict containing associated uncertainties; each of shape (nS,n_key,nT), (n_key,nT), (n_key,) or float
+	:param meas_idx: dict containing the corresponding indices (same for all scenarios)
+	:param pseudo_meas: dict containing the corresponding pseudo-measurements; each of shape (nS,n_key,nT) or (n_key,nT)
+	:param model: DynamicModel object as defined in dynamic_models.py
+	:param V0: initial estimate of nodal voltages (magnitude and phase)
+	:param Vs: voltages at slack node (magnitude and phase) of shape (nS,2,nT) or (2,nT)
+	:param slack_idx: index of slack node
+	:param Y: (optional) user defined admittance matrix
+	:param sparse: (optional) if True, admittance matrices are kept in sparse format
+	:param convergence: (optional) dict with a Criterion object (see convergence.py) for the loop "voltage"
+			(fix point iteration for Ks), applied to each scenario separately; default is an absolute
+			tolerance of 1e-12 and 20 iterations
+
+	:return: S_est, V_est, UncS, DeltaS_est, UncDeltaS with scenario index as first axis
+	"""
+	if not (isinstance(Y,np.ndarray) or issparse(Y)):
+		Y = makeYbus(topology["baseMVA"],topology["bus"],topology["branch"])
+	if sparse is None:
+		sparse = issparse(Y)
+	Yadm, Y_slack = separate_Yslack(Y,slack_idx,sparse=sparse)
+
+	nK = len(V0)//2
+	pmeas = np.zeros(nK,dtype = bool); pmeas[meas_idx["Pk"]] = True
+	qmeas = np.zeros(nK,dtype = bool); qmeas[meas_idx["Qk"]] = True
+	vmeas = np.zeros(nK,dtype = bool); vmeas[meas_idx["Vm"]] = True
+	Cm,Dnm,Dm = get_system_matrices(pmeas,qmeas,vmeas)
+
+	# number of scenarios and time steps
+	data = [meas[key] for key in ["Pk","Qk","Vm","Va"]] + [pseudo_meas[key] for key in ["Pk","Qk"]] + [Vs]
+	nS = max([np.shape(a)[0] if np.ndim(a)==3 else 1 for a in data])
+	t_f = np.shape(meas["Vm"])[-1]
+	nv = len(meas_idx["Vm"])
+
+	# all arrays below are of shape (..., nT, nS)
+	Vs = np.asarray(Vs, dtype=float)
+	Vs = _stacked(Vs if Vs.ndim == 3 else Vs[np.newaxis], nS, (2,t_f))
+	Vs_ri = np.r_[Vs[:1]*np.cos(Vs[1:]), Vs[:1]*np.sin(Vs[1:])]
+	# Yadm is constant, hence it is factorized only once for all scenarios and time steps
+	Yfac = factorize(Yadm)
+	Slack = Yfac.solve(Y_slack.dot(Vs_ri.reshape(2,-1))).reshape(2*nK,t_f,nS)
+	CmYinv = Yfac.solve(Cm.T.toarray(), trans=True).T
+	A1 = CmYinv[:,:nK]; A2 = CmYinv[:,nK:]
+
+	Sm = np.r_[_stacked(meas["Pk"], nS, (len(meas_idx["Pk"]),t_f)), _stacked(meas["Qk"], nS, (len(meas_idx["Qk"]),t_f))]
+	Sfc = np.r_[_stacked(pseudo_meas["Pk"], nS, (nK-len(meas_idx["Pk"]),t_f)),
+				_stacked(pseudo_meas["Qk"], nS, (nK-len(meas_idx["Qk"]),t_f))]
+	S = Dm.dot(Sm) + Dnm.dot(Sfc)
+	Dnm = model.adjust_Dnm(Dnm)
+
+	yRe, yIm, URI = amph_phase_to_real_imag_batch(_stacked(meas["Vm"], nS, (nv,t_f)),
+												  np.radians(_stacked(meas["Va"], nS, (nv,t_f))),
+												  _stacked(meas_unc["Vm"], nS, (nv,t_f))**2,
+												  _stacked(meas_unc["Va"], nS, (nv,t_f))**2)
+
+	nx = model.dim
+	idx = np.arange(nv)
+	crits = criteria({"voltage": Criterion(atol=1e-12, maxiter=20)}, convergence)
+
+	V_est = np.zeros((2*nK,t_f+1,nS))
+	V_est[:nK,0] = (V0[:nK]*np.cos(V0[nK:]))[:,np.newaxis]
+	x_est = np.zeros((nx,t_f+1,nS))
+	x_est[:,0] = model.forecast_state()[:,np.newaxis]
+	DeltaS_est = np.zeros((nx,t_f,nS))
+	UncDeltaS = np.zeros_like(DeltaS_est)
+	P = np.tile(model.forecast_unc(), (nS,1,1))
+
+	for k in range(1,t_f+1):
+		y = np.r_[yRe[:,k-1],yIm[:,k-1]] + Cm.dot(Slack[:,k-1])
+	# fix point iteration for the voltages of all scenarios; each scenario stops by its own criterion
+		rhs = Dnm.dot(x_est[:,k-1]) + S[:,k-1]
+		Vn = V_est[:,k-1].copy()
+		a = np.zeros((nK,nS)); b = np.zeros((nK,nS))
+		active = np.arange(nS)
+		crit = [crits["voltage"].start() for s in range(nS)]
+		while len(active) > 0:
+			MS, a[:,active], b[:,active] = _apply_M(Vn[:,active], rhs[:,active])
+			Vnew = Yfac.solve(MS) - Slack[:,k-1,active]
+			fp_diff = np.sqrt(np.sum((Vnew - Vn[:,active])**2, axis=0))
+			V_norm = np.sqrt(np.sum(Vnew**2, axis=0))
+			Vn[:,active] = Vnew
+			stop = [crit[s].check(d, v) for s, d, v in zip(active, fp_diff, V_norm)]
+			active = active[~np.array(stop, dtype=bool)]
+	# state space system matrices D = Cm*Ks and C = D*Dnm for all scenarios, shape (nS,nm,.)
+		aT = a.T[:,np.newaxis,:]; bT = b.T[:,np.newaxis,:]
+		D = np.concatenate((A1*aT + A2*bT, A1*bT - A2*aT), axis=2)
+		C = Dnm.premultiply(D)
+	# Kalman filter forecast step
+		xf = model.forecast_state(x_est[:,k-1])
+		Pf = _forecast_unc(model, P)
+	# Kalman gain matrix K
+		CPf = np.matmul(C, Pf)
+		Sinn = np.matmul(CPf, np.transpose(C, (0,2,1)))
+		U11, U12, U22 = [U[:,k-1].T for U in URI]
+		Sinn[:,idx,idx] += U11
+		Sinn[:,idx+nv,idx+nv] += U22
+		Sinn[:,idx,idx+nv] += U12
+		Sinn[:,idx+nv,idx] += U12
+		K = np.transpose(np.linalg.solve(Sinn, np.matmul(C, P)), (0,2,1))
+	# corrected state estimate
+		innovation = y - np.einsum("sij,js->is", C, xf) - np.einsum("sij,js->is", D, S[:,k-1])
+		x_est[:,k] = xf + np.einsum("sij,js->is", K, innovation)
+	# corrected error covariance matrix
+		P = Pf - np.matmul(K, CPf)	# = (I - K*C)*Pf
+	# calculate voltage from estimated power
+		MS = np.r_[a*rhs[:nK] + b*rhs[nK:], b*rhs[:nK] - a*rhs[nK:]]
+		V_est[:,k] = Yfac.solve(MS) - Slack[:,k-1]
+		DeltaS_est[:,k-1] = x_est[:,k]
+		UncDeltaS[:,k-1] = np.sqrt(np.diagonal(P, axis1=1, axis2=2)).T
+
+	S_est = S + Dnm.dot(DeltaS_est)
+	UncS = np.zeros_like(S) + Dnm.dot(UncDeltaS)
+	scenario_first = lambda X: np.transpose(X, (2,0,1))
+	return scenario_first(S_est), scenario_first(V_est[:,1:]), scenario_first(UncS), \
+		   scenario_first(DeltaS_est), scenario_first(UncDeltaS)
+
+
+def _matmul(A, B):
+	"""Matrix products A[s]*B[s] of stacked matrices; np.dot for each scenario uses BLAS, which np.matmul does not
+	for stacked matrices in older numpy versions"""
+	return np.array([np.dot(a, b) for a, b in zip(A, B)])
+
+
+def _voltages(Yfac, V, rhs, Slack, criterion):
+	"""
+	Fix point iteration V = inv(Y00)*M(V)*rhs - Slack for each scenario (columns of V, rhs and Slack), starting from
+	the image of V as `fixed_point` with method "picard" in nodal_load_observer.py; each scenario stops by its own
+	copy of the criterion
+	:return: V
+	"""
+	V = Yfac.solve(_apply_M(V, rhs)[0]) - Slack
+	active = np.arange(V.shape[1])
+	crit = [criterion.start() for s in active]
+	while len(active) > 0:
+		Vnew = Yfac.solve(_apply_M(V[:,active], rhs[:,active])[0]) - Slack[:,active]
+		steps = np.sqrt(np.sum((Vnew - V[:,active])**2, axis=0))
+		norms = np.sqrt(np.sum(Vnew**2, axis=0))
+		V[:,active] = Vnew
+		stop = [crit[s].check(d, v) for s, d, v in zip(active, steps, norms)]
+		active = active[~np.array(stop, dtype=bool)]
+	return V
+
+
+def BatchIteratedExtendedKalman(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
+								Vs, slack_idx=0, Y=None, accuracy=1e-9, maxiter=50, sparse=None, convergence=None):
+	"""
+	Iterated Extended Kalman filter for the nodal load observer (see `IteratedExtendedKalman` in
+	nodal_load_observer.py with the exact Jacobian and the fix point iteration for the voltages) for nS scenarios at
+	once. For each scenario the results are the same as those of `IteratedExtendedKalman`.
+
+	In each iteration voltages, gain and correction are calculated for all scenarios which have not converged yet.
+	The Jacobians of all these scenarios are solved at once for a dense admittance matrix; for a sparse admittance
+	matrix each Jacobian is factorized separately.
+
+	:param topology: dict containing information on bus, branch, ... in PyPower format
+	:param meas: dict containing measurements "Pk", "Qk", "Vm" and "Va"; each of shape (nS,n_key,nT) or (n_key,nT)
+	:param meas_unc: dict containing associated uncertainties; each of shape (nS,n_key,nT), (n_key,nT), (n_key,) or float
+	:param meas_idx: dict containing the corresponding indices (same for all scenarios)
+	:param pseudo_meas: dict containing the corresponding pseudo-measurements; each of shape (nS,n_key,nT) or (n_key,nT)
+	:param model: DynamicModel object as defined in dynamic_models.py
+	:param V0: initial estimate of nodal voltages (magnitude and phase)
+	:param Vs: voltage amplitude and phase (in degrees) at slack node of shape (nS,2,nT) or (2,nT)
+	:param slack_idx: index of slack node
+	:param Y: (optional) user defined admittance matrix
+	:param accuracy: threshold for inner iteration of the iterated EKF
+	:param maxiter: maximum number of inner iterations of the iterated EKF
+	:param sparse: (optional) if True, admittance matrices and Jacobians are kept in sparse format; default is True
+			if Y is a scipy.sparse matrix
+	:param convergence: (optional) dict with Criterion objects (see convergence.py) for the loops "voltage" and
+			"iekf" replacing the defaults given by `accuracy` and `maxiter`, applied to each scenario separately
+
+	Missing readings (NaN) are not supported.
+
+	:return: Shat, Vhat, uShat, DeltaS, uDeltaS with scenario index as first axis
+	"""
+	if not (isinstance(Y,np.ndarray) or issparse(Y)):
+		Y = makeYbus(topology["baseMVA"],topology["bus"],topology["branch"])
+	if sparse is None:
+		sparse = issparse(Y)
+	Y00, Ys = separate_Yslack(Y,slack_idx,sparse=sparse)
+
+	nK = len(V0)//2
+	pmeas = np.zeros(nK,dtype = bool); pmeas[meas_idx["Pk"]] = True
+	qmeas = np.zeros(nK,dtype = bool); qmeas[meas_idx["Qk"]] = True
+	vmeas = np.zeros(nK,dtype = bool); vmeas[meas_idx["Vm"]] = True
+	Cm,Dnm,Dm = get_system_matrices(pmeas,qmeas,vmeas)
+
+	# number of scenarios and time steps
+	data = [meas[key] for key in ["Pk","Qk","Vm","Va"]] + [pseudo_meas[key] for key in ["Pk","Qk"]] + [Vs]
+	nS = max([np.shape(a)[0] if np.ndim(a)==3 else 1 for a in data])
+	nT = np.shape(meas["Vm"])[-1]
+	nv = len(meas_idx["Vm"])
+
+	# all arrays below are of shape (..., nT, nS)
+	Vs = np.asarray(Vs, dtype=float)
+	Vs = _stacked(Vs if Vs.ndim == 3 else Vs[np.newaxis], nS, (2,nT))
+	Vs_ri = np.r_[Vs[:1]*np.cos(np.radians(Vs[1:])), Vs[:1]*np.sin(np.radians(Vs[1:]))]
+	# Y00 is constant, hence it is factorized only once for all scenarios, time steps and iterations
+	Yfac = factorize(Y00)
+	Slack = Yfac.solve(Ys.dot(Vs_ri.reshape(2,-1))).reshape(2*nK,nT,nS)
+	jac_pattern = JacobianPattern(Y00,Ys) if sparse else None
+
+	Sm = np.r_[_stacked(meas["Pk"], nS, (len(meas_idx["Pk"]),nT)), _stacked(meas["Qk"], nS, (len(meas_idx["Qk"]),nT))]
+	Sfc = np.r_[_stacked(pseudo_meas["Pk"], nS, (nK-len(meas_idx["Pk"]),nT)),
+				_stacked(pseudo_meas["Qk"], nS, (nK-len(meas_idx["Qk"]),nT))]
+	u = Dm.dot(Sm) + Dnm.dot(Sfc)
+	Dnm = model.adjust_Dnm(Dnm)
+	Dnm_full = Dnm.toarray()
+
+	yRe, yIm, URI = amph_phase_to_real_imag_batch(_stacked(meas["Vm"], nS, (nv,nT)),
+												  np.radians(_stacked(meas["Va"], nS, (nv,nT))),
+												  _stacked(meas_unc["Vm"], nS, (nv,nT))**2,
+												  _stacked(meas_unc["Va"], nS, (nv,nT))**2)
+	y = np.r_[yRe, yIm]
+	if np.any(np.isnan(u)) or np.any(np.isnan(y)):
+		raise ValueError("Missing readings are not supported by the batched filter.")
+
+	n = model.dim
+	idx = np.arange(nv)
+	crits = criteria({"voltage": Criterion(atol=accuracy, maxiter=maxiter-1),
+					  "iekf": Criterion(atol=accuracy, maxiter=maxiter-1)}, convergence)
+
+	mu = np.tile(np.r_[V0[:nK]*np.cos(V0[nK:]), V0[:nK]*np.sin(V0[nK:])][:,np.newaxis], (1,nS))
+	xhat = None
+	Shat = np.zeros((2*nK,nT,nS))
+	Vhat = np.zeros((2*nK,nT,nS))
+	DeltaS = np.zeros((n,nT,nS))
+	uDeltaS = np.zeros_like(DeltaS)
+	H = np.zeros((nS,2*nv,n))
+	K = np.zeros((nS,n,2*nv))
+
+	for k in range(nT):
+	# Kalman filter forecast step
+		if xhat is None:
+			xhatfc = np.tile(model.forecast_state()[:,np.newaxis], (1,nS))
+			Pfc = np.tile(model.forecast_unc(), (nS,1,1))
+		else:
+			xhatfc = model.forecast_state(xhat)
+			Pfc = _forecast_unc(model, P)
+		U11, U12, U22 = [U[:,k].T for U in URI]
+		eta = xhatfc.copy()
+		active = np.arange(nS)
+		outer = [crits["iekf"].start() for s in range(nS)]
+		while len(active) > 0:
+		# voltages from nodal power, starting from the previous iterate
+			rhs = u[:,k,active] + Dnm.dot(eta[:,active])
+			mu[:,active] = _voltages(Yfac, mu[:,active], rhs, Slack[:,k,active], crits["voltage"])
+		# observation matrices H = Cm*inv(Dh)*Dnm at the voltages of each scenario
+			Dh = [jacobian(Y00,Ys,mu[:,s],Vs_ri[:,k,s],jac_pattern) for s in active]
+			if sparse:
+				dVdeta = np.array([_solve(J, Dnm_full) for J in Dh])
+			else:
+				dVdeta = np.linalg.solve(np.array(Dh), np.broadcast_to(Dnm_full, (len(active),) + Dnm_full.shape))
+			H[active] = np.transpose(Cm.dot(np.transpose(dVdeta, (1,0,2))), (1,0,2))
+		# Kalman gain for all active scenarios
+			Ha, Pa = H[active], Pfc[active]
+			PHt = _matmul(Pa, np.transpose(Ha, (0,2,1)))
+			Sinn = _matmul(Ha, PHt)
+			Sinn[:,idx,idx] += U11[active]
+			Sinn[:,idx+nv,idx+nv] += U22[active]
+			Sinn[:,idx,idx+nv] += U12[active]
+			Sinn[:,idx+nv,idx] += U12[active]
+			K[active] = np.transpose(np.linalg.solve(Sinn, np.transpose(PHt, (0,2,1))), (0,2,1))
+		# corrected state estimate
+			innovation = y[:,k,active] - Cm.dot(mu[:,active]) \
+						 - np.einsum("sij,js->is", Ha, xhatfc[:,active] - eta[:,active])
+			eta_new = xhatfc[:,active] + np.einsum("sij,js->is", K[active], innovation)
+			steps = np.sqrt(np.sum((eta_new - eta[:,active])**2, axis=0))
+			norms = np.sqrt(np.sum(eta_new**2, axis=0))
+			eta[:,active] = eta_new
+			stop = [outer[s].check(d, v) for s, d, v in zip(active, steps, norms)]
+			active = active[~np.array(stop, dtype=bool)]
+	# corrected error covariance matrix
+		P = Pfc - _matmul(K, _matmul(H, Pfc))	# = (I - K*H)*Pfc
+		xhat = eta
+		Shat[:,k] = u[:,k] + Dnm.dot(eta)
+		Vhat[:,k] = mu
+		# the estimate of time step k is stored in column k-1 as by IteratedExtendedKalman
+		DeltaS[:,k-1] = eta
+		uDeltaS[:,k-1] = np.sqrt(np.diagonal(P, axis1=1, axis2=2)).T
+
+	uS = Dnm.dot(uDeltaS)
+	scenario_first = lambda X: np.transpose(X, (2,0,1))
+	return scenario_first(Shat), scenario_first(Vhat), scenario_first(uS), \
+		   scenario_first(DeltaS), scenario_first(uDeltaS)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the convergence control for the iterative loops of the nodal load observer, i.e., the
+calculation of voltages from power (fix point iteration or Newton's method) and the iterations of the iterated
+extended Kalman filters.
+
+A `Criterion` defines when a loop stops:
+	- the norm of the step is below atol + rtol * norm of the iterate ("converged")
+	- the norm of the mismatch (e.g., of bus power) is below mismatch_tol ("mismatch")
+	- the norm of the step did not decrease significantly over the last iterations, while it is already close to
+	  the tolerance or to the round-off level ("stagnation")
+	- the number of iterations reached maxiter ("maxiter")
+
+The first three reasons count as convergence (see `Criterion.converged`). A loop which stagnates far from the
+tolerance is not stopped for stagnation; it ends as "converged" or "maxiter".
+
+The estimators accept a dict `convergence` with criteria for their loops, which replace the default ones. Each
+criterion serves as a template; the estimators call `start()` to obtain a fresh copy for every loop.
+
+"""
+
+import copy
+
+import numpy as np
+
+
+class Criterion(object):
+	"""
+	Stopping rule of an iterative loop
+
+	:param atol: absolute tolerance for the norm of the step
+	:param rtol: tolerance for the norm of the step relative to the norm of the iterate
+	:param mismatch_tol: (optional) tolerance for the norm of the mismatch
+	:param maxiter: maximum number of iterations
+	:param stagnation_window: (optional) number of iterations for the detection of stagnation; 0 switches it off
+	:param stagnation_ratio: the iteration stagnates if the step is larger than stagnation_ratio times the step
+			stagnation_window iterations before
+	:param stagnation_factor: stagnation stops the loop only if the step is below stagnation_factor times the
+			tolerance atol + rtol * norm of the iterate or times the round-off level eps * norm of the iterate
+	"""
+	def __init__(self, atol=0.0, rtol=0.0, mismatch_tol=None, maxiter=20, stagnation_window=0,
+				 stagnation_ratio=0.9, stagnation_factor=100.0):
+		self.atol = atol
+		self.rtol = rtol
+		self.mismatch_tol = mismatch_tol
+		self.maxiter = maxiter
+		self.stagnation_window = stagnation_window
+		self.stagnation_ratio = stagnation_ratio
+		self.stagnation_factor = stagnation_factor
+		self.reset()
+
+	def reset(self):
+		"""Reset the history of the criterion"""
+		self.history = []
+		self.mismatch_history = []
+		self.reason = None
+
+	def start(self):
+		"""Return a copy of the criterion with empty history for a new loop"""
+		crit = copy.copy(self)
+		crit.reset()
+		return crit
+
+	@property
+	def iterations(self):
+		return len(self.history)
+
+	@property
+	def converged(self):
+		"""True if the loop stopped for convergence, mismatch or stagnation close to the tolerance"""
+		return self.reason in ["converged", "mismatch", "stagnation"]
+
+	def check(self, step, x_norm=0.0, mismatch=None):
+		"""
+		Record an iteration and decide whether the loop stops
+		:param step: norm of the step of the iterate
+		:param x_norm: norm of the iterate (required for rtol > 0)
+		:param mismatch: (optional) norm of the mismatch
+		:return: True if the loop stops; the reason is stored in `reason`
+		"""
+		self.history.append(step)
+		if mismatch is not None:
+			self.mismatch_history.append(mismatch)
+		w = self.stagnation_window
+		tol = self.atol + self.rtol*x_norm
+		if step <= tol:
+			self.reason = "converged"
+		elif self.mismatch_tol is not None and mismatch is not None and mismatch <= self.mismatch_tol:
+			self.reason = "mismatch"
+		elif w > 0 and len(self.history) > w and step > self.stagnation_ratio*self.history[-1-w] \
+				and step <= self.stagnation_factor*max(tol, np.finfo(float).eps*x_norm):
+			self.reason = "stagnation"
+		elif len(self.history) >= self.maxiter:
+			self.reason = "maxiter"
+		else:
+			self.reason = None
+		return self.reason is not None
+
+	def info(self):
+		"""dict with the number of "iterations", the "history" of step norms and the "reason" for stopping"""
+		info = {"iterations": self.iterations, "history": list(self.history), "reason": self.reason}
+		if self.mismatch_history:
+			info["mismatch"] = list(self.mismatch_history)
+		return info
+
+
+def criteria(defaults, convergence=None):
+	"""Combine default criteria with user defined ones
+	:param defaults: dict of Criterion objects for each loop
+	:param convergence: (optional) dict of Criterion objects replacing the defaults
+	:return: dict of Criterion objects
+	"""
+	crits = dict(defaults)
+	if convergence is not None:
+		unknown = set(convergence) - set(defaults)
+		if unknown:
+			raise ValueError("Unknown loop(s) %s. Available loops are %s." % (sorted(unknown), sorted(defaults)))
+		crits.update(convergence)
+	return crits
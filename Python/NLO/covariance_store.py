@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains containers for the posterior error covariance matrices of the nodal load observer.
+
+The estimators need only the covariance of the previous time step, and the returned uncertainties require only its
+diagonal. Keeping the full matrix of every time step requires O(nT*n^2) memory, which is prohibitive for long time
+series. If the full matrices are required, one of the following containers can be passed to the estimator:
+
+	- a list: all matrices in memory
+	- `LastCovariances`: the last k matrices in memory
+	- `DiskCovariances`: all matrices in chunks of .npy files on disk; only the current chunk is held in memory
+
+"""
+
+import os
+from collections import deque
+
+import numpy as np
+
+
+class LastCovariances(object):
+	"""
+	Keeps the covariance matrices of the last k time steps
+	:param k: number of time steps
+	"""
+	def __init__(self, k=1):
+		self.matrices = deque(maxlen=k)
+		self.count = 0
+
+	def append(self, P):
+		self.matrices.append(P)
+		self.count += 1
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, t):
+		"""Covariance matrix of time index t; only the last k time steps are available"""
+		if t < 0:
+			t += self.count
+		first = self.count - len(self.matrices)
+		if not first <= t < self.count:
+			raise IndexError("Covariance of time index %d is not retained." % t)
+		return self.matrices[t - first]
+
+
+class DiskCovariances(object):
+	"""
+	Stores the covariance matrices of all time steps in files "chunk_<number>.npy" of `chunk_size` matrices each
+	in `directory`. Chunks are read as memory maps.
+
+	:param directory: directory for the chunk files; created if it does not exist
+	:param chunk_size: number of matrices per file
+	"""
+	def __init__(self, directory, chunk_size=100):
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.directory = directory
+		self.chunk_size = chunk_size
+		self.buffer = []
+		self.count = 0
+
+	def _filename(self, chunk):
+		return os.path.join(self.directory, "chunk_%06d.npy" % chunk)
+
+	def append(self, P):
+		self.buffer.append(P)
+		self.count += 1
+		if len(self.buffer) == self.chunk_size:
+			self.flush()
+
+	def flush(self):
+		"""Write the matrices which are not yet on disk"""
+		if self.buffer:
+			chunk = (self.count - 1)//self.chunk_size
+			np.save(self._filename(chunk), np.array(self.buffer))
+			if len(self.buffer) == self.chunk_size:
+				self.buffer = []
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, t):
+		"""Covariance matrix of time index t"""
+		if t < 0:
+			t += self.count
+		if not 0 <= t < self.count:
+			raise IndexError("Time index %d out of range." % t)
+		chunk, i = divmod(t, self.chunk_size)
+		if chunk == (self.count - 1)//self.chunk_size and self.buffer:
+			return self.buffer[i]
+		return np.load(self._filename(chunk), mmap_mode="r")[i]
@@ -4,6 +4,8 @@ import numpy as np
 import statsmodels.api as sm
 import scipy as sp
 
+from NLO.selectors import Selector
+
 class DynamicModel(object):
 	"""
 	This is the base class for the nodal load observer state evolution model.
@@ -91,6 +93,8 @@ class AR2Model_single(DynamicModel):
 			self.setQ(noise)
 
 	def adjust_Dnm(self, Dnm):
+		if isinstance(Dnm,Selector):	# equivalent to Dnm*Dtilde below
+			return Selector(Dnm.rows, 2*Dnm.cols, (Dnm.shape[0],self.dim))
 		Dtilde = np.zeros((Dnm.shape[1],self.dim))
 		for i in range(Dnm.shape[1]):
 			Dtilde[i,2*i] = 1.0
@@ -130,3 +134,5 @@ class AR2Model_single(DynamicModel):
 		else:
 			raise NotImplementedError("The model parameters have not been determined yet.")
 
+	def return_pars(self):
+		return self.A, self.Q
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains a persistent on-disk cache for the symbolic network equations of the extended nodal load observer.
+
+The symbolic set up of the network equations and their Jacobians is expensive for larger networks. The generated
+evaluators are therefore stored as compiled Python code, identified by a hash of the admittance data, the number of
+buses and the measurement indices. Any process using the same topology and measurement layout loads the compiled
+evaluators instead of repeating the symbolic calculations. The total size of the cache directory is bounded; least
+recently used entries are removed first.
+
+The cache directory defaults to ~/.gridsens_cache and can be set by the environment variable GRIDSENS_CACHE, by
+changing `cache_dir` or by the argument `directory` of the functions below.
+
+Entries are executed as code when loaded. They are therefore only read from and written to directories which are
+owned by the current user and not writable by others. Each entry starts with the bytecode magic number of the
+running interpreter and the cache version, followed by a SHA-256 digest of the marshalled code, such that entries
+of other Python versions and incomplete or corrupted entries are ignored.
+
+"""
+
+import os
+import sys
+import imp
+import stat
+import marshal
+import hashlib
+import tempfile
+
+import numpy as np
+from scipy.sparse import issparse
+
+CACHE_VERSION = 1
+cache_dir = os.environ.get("GRIDSENS_CACHE", os.path.join(os.path.expanduser("~"), ".gridsens_cache"))
+max_cache_size = 256*1024**2 	# maximum size of cache directory in bytes
+
+function_names = ["J_dSdV", "J_dHdV", "f_hSK", "f_hSl"]
+
+header = imp.get_magic() + ("%08d" % CACHE_VERSION).encode()
+
+
+def equations_key(Y, y, cap, nK, meas_idx):
+	"""Hash identifying the network equations for the given admittance data and measurement indices
+	:param Y: nodal admittance matrix
+	:param y: line admittances
+	:param cap: line capacitances
+	:param nK: number of buses
+	:param meas_idx: dict containing the measurement indices
+	:return: key as hex string
+	"""
+	h = hashlib.sha1()
+	h.update(("%d;%d.%d;%d;" % (CACHE_VERSION, sys.version_info[0], sys.version_info[1], nK)).encode())
+	for A in (Y, y, cap):
+		if issparse(A):
+			A = A.toarray()
+		A = np.ascontiguousarray(A, dtype=complex)
+		h.update(str(A.shape).encode())
+		h.update(A.tobytes())
+	for key in ["Pl", "Ql", "Vm"]:
+		inds = np.ascontiguousarray(meas_idx.get(key, []), dtype=np.int64)
+		h.update(("%s%s" % (key, inds.shape)).encode())
+		h.update(inds.tobytes())
+	return h.hexdigest()
+
+
+def generate_source(name, expr, nK):
+	"""Python source code of a function evaluating the symbolic matrix `expr` for the voltage vector V = [e, f].
+	Column vectors are returned as flat arrays.
+	"""
+	args = ["e%d" % (i + 1) for i in range(nK)] + ["f%d" % (i + 1) for i in range(nK)]
+	lines = ["def %s(V):" % name, "\t%s, = V" % ", ".join(args)]
+	if expr is None:
+		if name.startswith("J"):
+			lines.append("\treturn zeros((0, %d))" % (2*nK - 2))
+		else:
+			lines.append("\treturn array([])")
+	elif expr.shape[1] == 1:
+		lines.append("\treturn array([%s])" % ", ".join(str(ex) for ex in expr))
+	else:
+		rows = ["[%s]" % ", ".join(str(expr[i, j]) for j in range(expr.shape[1])) for i in range(expr.shape[0])]
+		lines.append("\treturn array([%s], dtype=float)" % ",\n\t\t".join(rows))
+	return "\n".join(lines) + "\n"
+
+
+def _evaluators(code):
+	namespace = {"array": np.array, "zeros": np.zeros, "sqrt": np.sqrt}
+	exec(code, namespace)
+	return [namespace[name] for name in function_names]
+
+
+def _entry(key, directory):
+	return os.path.join(directory, key + ".eqc")
+
+
+def trusted(directory):
+	"""True if the directory is owned by the current user and not writable by group or others"""
+	try:
+		st = os.stat(directory)
+	except OSError:
+		return False
+	if hasattr(os, "getuid") and st.st_uid != os.getuid():
+		return False
+	return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def load(key, directory=None):
+	"""Load compiled evaluators from the cache
+	:param key: key as returned by `equations_key`
+	:param directory: (optional) cache directory
+	:return: list of functions J_dSdV, J_dHdV, f_hSK, f_hSl or None if not in cache
+	"""
+	if directory is None:
+		directory = cache_dir
+	if not trusted(directory):
+		return None
+	fname = _entry(key, directory)
+	try:
+		with open(fname, "rb") as f:
+			data = f.read()
+		n = len(header)
+		digest, payload = data[n:n + 32], data[n + 32:]
+		if data[:n] != header or hashlib.sha256(payload).digest() != digest:
+			return None
+		code = marshal.loads(payload)
+		os.utime(fname, None) 	# mark as recently used
+	except (IOError, OSError, ValueError, EOFError, TypeError):
+		return None
+	return _evaluators(code)
+
+
+def store(key, sources, directory=None, max_size=None):
+	"""Compile the generated source code, store it in the cache and return the evaluators
+	:param key: key as returned by `equations_key`
+	:param sources: dict of source code for each of the functions J_dSdV, J_dHdV, f_hSK, f_hSl
+	:param directory: (optional) cache directory
+	:param max_size: (optional) maximum size of cache directory in bytes
+	:return: list of functions J_dSdV, J_dHdV, f_hSK, f_hSl
+	"""
+	if directory is None:
+		directory = cache_dir
+	code = compile("\n".join(sources[name] for name in function_names), "<network equations %s>" % key, "exec")
+	payload = marshal.dumps(code)
+	tmpname = None
+	try:
+		if not os.path.isdir(directory):
+			os.makedirs(directory, 0o700)
+		if not trusted(directory):
+			print "Cache directory %s is writable by others or not owned by the user; it is not used." % directory
+			return _evaluators(code)
+		# write to temporary file first such that concurrent processes never read incomplete entries
+		fd, tmpname = tempfile.mkstemp(dir=directory, suffix=".tmp")
+		with os.fdopen(fd, "wb") as f:
+			f.write(header + hashlib.sha256(payload).digest() + payload)
+		fname = _entry(key, directory)
+		if os.path.exists(fname):
+			os.remove(fname)
+		os.rename(tmpname, fname)
+		tmpname = None
+		evict(directory, max_size)
+	except (IOError, OSError):
+		print "Could not write network equations to cache directory %s" % directory
+	finally:
+		if tmpname is not None and os.path.exists(tmpname):
+			os.remove(tmpname)
+	return _evaluators(code)
+
+
+def evict(directory=None, max_size=None):
+	"""Remove least recently used cache entries until the total size of the cache is below max_size
+	"""
+	if directory is None:
+		directory = cache_dir
+	if max_size is None:
+		max_size = max_cache_size
+	entries = []
+	for fname in os.listdir(directory):
+		if fname.endswith(".eqc"):
+			stat = os.stat(os.path.join(directory, fname))
+			entries.append((stat.st_mtime, stat.st_size, fname))
+	entries.sort()
+	total = sum(size for _, size, _ in entries)
+	for _, size, fname in entries:
+		if total <= max_size:
+			break
+		try:
+			os.remove(os.path.join(directory, fname))
+			total -= size
+		except OSError:
+			pass
+
+
+def clear(directory=None):
+	"""Remove all entries from the cache
+	"""
+	evict(directory, max_size=0)
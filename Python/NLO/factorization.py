@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the factorization of the (constant) network matrices used by the nodal load observer.
+The admittance matrix w/o slack node does not change during a run. It is therefore factorized once and all
+subsequent linear systems are solved by forward and backward substitution.
+
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import issparse, csc_matrix
+
+
+class Factorization(object):
+	"""
+	LU factorization of a square dense or scipy.sparse matrix A.
+	Dense matrices are factorized with LAPACK (scipy.linalg.lu_factor), sparse matrices with SuperLU.
+	"""
+	def __init__(self, A):
+		self.shape = A.shape
+		self.sparse = issparse(A)
+		if self.sparse:
+			from scipy.sparse.linalg import splu
+			self.lu = splu(csc_matrix(A))
+		else:
+			from scipy.linalg import lu_factor
+			self.lu = lu_factor(np.asarray(A))
+
+	def solve(self, b, trans=False):
+		"""
+		Solve A x = b (or A^T x = b for trans=True)
+		:param b: right-hand side of shape (n,) or (n,k); sparse right-hand sides are converted to dense
+		:param trans: if True, solve the transposed system
+		:return: x
+		"""
+		if issparse(b):
+			b = b.toarray()
+		if self.sparse:
+			return self.lu.solve(np.asarray(b, dtype=float), trans="T" if trans else "N")
+		from scipy.linalg import lu_solve
+		return lu_solve(self.lu, b, trans=1 if trans else 0)
+
+
+_cache = OrderedDict()
+max_cached_factorizations = 8
+
+
+def matrix_hash(A):
+	"""Hash of the content of a dense or sparse matrix, used to identify the network topology.
+	"""
+	h = hashlib.sha1()
+	h.update(str(A.shape).encode())
+	if issparse(A):
+		A = csc_matrix(A)
+		A.sort_indices()
+		for arr in (A.indptr, A.indices, A.data):
+			h.update(np.ascontiguousarray(arr).tobytes())
+	else:
+		h.update(np.ascontiguousarray(A).tobytes())
+	return h.hexdigest()
+
+
+def factorize(A, use_cache=True):
+	"""
+	Return the LU factorization of A. Factorizations are cached per matrix content, such that repeated
+	calls of the estimators for the same network topology do not factorize the admittance matrix again.
+
+	:param A: square numpy array or scipy.sparse matrix
+	:param use_cache: if False, the factorization is always calculated
+	:return: Factorization object
+	"""
+	if isinstance(A, Factorization):
+		return A
+	if not use_cache:
+		return Factorization(A)
+	key = matrix_hash(A)
+	if key in _cache:
+		fac = _cache.pop(key)
+	else:
+		fac = Factorization(A)
+		while len(_cache) >= max_cached_factorizations:
+			_cache.popitem(last=False)
+	_cache[key] = fac
+	return fac
+
+
+def clear_cache():
+	"""Remove all cached factorizations
+	"""
+	_cache.clear()
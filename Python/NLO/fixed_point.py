@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the solution of fixed point equations x = g(x) as they arise for the calculation of nodal
+voltages from bus power in the nodal load observer (fix point equation in W. Heins' thesis).
+
+Besides plain (Picard) iteration, Anderson acceleration is available. It extrapolates from the last iterates by a
+small least-squares problem and typically reduces the number of evaluations of g considerably.
+
+"""
+
+import numpy as np
+
+from NLO.convergence import Criterion
+
+
+def fixed_point(g, x0, accuracy=1e-12, maxiter=20, method="anderson", depth=5, criterion=None):
+	"""
+	Solve x = g(x) by fixed point iteration starting from x0. The iteration stops if the norm of the change of
+	the iterate is below `accuracy` or after `maxiter` evaluations of g, or as defined by `criterion`.
+
+	:param g: function mapping ndarray of shape (n,) to ndarray of shape (n,)
+	:param x0: initial value
+	:param accuracy: threshold for the norm of the change of the iterate
+	:param maxiter: maximum number of evaluations of g
+	:param method: "picard" for plain iteration or "anderson" (default) for Anderson acceleration
+	:param depth: number of previous iterates used for Anderson acceleration
+	:param criterion: (optional) Criterion object (see convergence.py) replacing accuracy and maxiter
+	:return: x, info with info a dict containing the number of "iterations", the "history" of the step norms
+			and the "reason" for stopping
+	"""
+	if method not in ["picard", "anderson"]:
+		raise ValueError("Unknown fixed point method '%s'. Use 'picard' or 'anderson'." % method)
+	crit = (criterion or Criterion(atol=accuracy, maxiter=maxiter)).start()
+	x = x0
+	dG = []; dF = []	# differences of function values and residuals
+	g_prev = f_prev = None
+	res_prev = np.inf
+	while True:
+		gx = g(x)
+		f = gx - x
+		x_new = gx
+		if method == "anderson":
+			res = np.linalg.norm(f)
+			if res >= res_prev:
+				# no decrease of the residual; restart acceleration from the current Picard step
+				dG = []; dF = []
+			elif f_prev is not None:
+				dG.append(gx - g_prev); dF.append(f - f_prev)
+				if len(dF) > depth:
+					dG.pop(0); dF.pop(0)
+				gamma = np.linalg.lstsq(np.array(dF).T, f, rcond=-1)[0]
+				x_new = gx - np.dot(np.array(dG).T, gamma)
+			g_prev, f_prev, res_prev = gx, f, res
+		step = np.linalg.norm(x_new - x)
+		x = x_new
+		if crit.check(step, np.linalg.norm(x)):
+			break
+	return x, crit.info()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the per-step instrumentation of the nodal load observer.
+
+A `StepProfile` passed to an estimator as `profile` records for each time step
+	- the wall time of the stages of the step (e.g. "voltage", "jacobian", "gain", "correction")
+	- the number of iterations of the loops (e.g. "voltage", "iekf")
+	- values such as the final step norm of the Kalman filter iteration ("residual") and, if requested by
+	  `condition=True`, an estimate of the condition number of the innovation covariance ("condition")
+in preallocated arrays. If an estimator is called without profile, nothing is recorded or calculated.
+
+Example::
+
+	profile = StepProfile(nT)
+	IteratedExtendedKalman(..., profile=profile)
+	print profile.summary()
+
+"""
+
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+class StepProfile(object):
+	"""
+	Record of per-step timings, iteration counts and values. Arrays are allocated for `nT` time steps and grow
+	(by doubling) if more steps are recorded, e.g. by a streaming estimator.
+
+	:param nT: expected number of time steps
+	:param callback: (optional) function called as callback(k, record) at the end of each time step k with the
+			record of that step as returned by `step`
+	:param condition: (optional) if True, the estimators record an estimate of the 1-norm condition number of the
+			innovation covariance; this requires an additional factorization in each time step
+	"""
+	def __init__(self, nT=0, callback=None, condition=False):
+		self.capacity = max(int(nT), 1)
+		self.callback = callback
+		self.condition = condition
+		self.steps = 0
+		self.time = {}
+		self.iterations = {}
+		self.values = {}
+
+	def _array(self, table, name, k, dtype):
+		if k >= self.capacity:
+			while k >= self.capacity:
+				self.capacity *= 2
+			for tab in [self.time, self.iterations, self.values]:
+				for key, a in tab.items():
+					tab[key] = np.r_[a, np.zeros(self.capacity - len(a), dtype=a.dtype)]
+		if name not in table:
+			table[name] = np.zeros(self.capacity, dtype=dtype)
+		return table[name]
+
+	def tic(self):
+		"""Current time for a subsequent call of `toc`"""
+		return timer()
+
+	def toc(self, stage, k, start):
+		"""Add the time elapsed since `start` to `stage` of time step k"""
+		self._array(self.time, stage, k, float)[k] += timer() - start
+
+	def add_iterations(self, loop, k, count):
+		"""Add `count` iterations of `loop` to time step k"""
+		self._array(self.iterations, loop, k, int)[k] += count
+
+	def set_value(self, name, k, value):
+		"""Record `value` of `name` for time step k"""
+		self._array(self.values, name, k, float)[k] = value
+
+	def end_step(self, k):
+		"""Finish time step k"""
+		self.steps = max(self.steps, k + 1)
+		if self.callback is not None:
+			self.callback(k, self.step(k))
+
+	def step(self, k):
+		"""dict with the "time", "iterations" and "values" recorded for time step k"""
+		record = {}
+		for label, table in [("time", self.time), ("iterations", self.iterations), ("values", self.values)]:
+			record[label] = dict((key, a[k]) for key, a in table.items() if k < len(a))
+		return record
+
+	def results(self):
+		"""dict with the "time", "iterations" and "values" arrays of all recorded time steps"""
+		record = {}
+		for label, table in [("time", self.time), ("iterations", self.iterations), ("values", self.values)]:
+			record[label] = dict((key, a[:self.steps]) for key, a in table.items())
+		return record
+
+	def summary(self):
+		"""dict with total and mean time per stage, mean and maximum iterations per loop and maximum values"""
+		n = max(self.steps, 1)
+		return {"time": dict((key, {"total": a[:n].sum(), "mean": a[:n].mean()}) for key, a in self.time.items()),
+				"iterations": dict((key, {"mean": a[:n].mean(), "max": a[:n].max()}) for key, a in self.iterations.items()),
+				"values": dict((key, {"max": a[:n].max()}) for key, a in self.values.items())}
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the linear algebra of the Kalman filter correction step used by the nodal load observer.
+
+The innovation covariance H*P*H' + R is symmetric positive definite. The Kalman gain is therefore calculated by
+Cholesky factorization and triangular solves instead of (pseudo-)inversion. Depending on the dimensions, the gain is
+calculated either in the measurement space
+
+	K = P*H' * inv(H*P*H' + R)
+
+or, if there are more measurements than states, equivalently in the state space
+
+	K = inv(inv(P) + H'*inv(R)*H) * H'*inv(R)
+
+The latter is also the basis of the information form of the correction step (see `InformationUpdate`), which
+accumulates H'*inv(R)*H and H'*inv(R)*y such that all solves are in the state dimension.
+
+The measurement noise covariance R can be given as
+	- dense matrix of shape (m,m)
+	- vector of variances of shape (m,) for diagonal R
+	- tuple (U11, U12, U22) of 2x2 blocks as returned by `amph_phase_to_real_imag_batch` in nodal_load_observer.py
+
+"""
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, lu_factor, get_lapack_funcs, LinAlgError
+
+
+def add_noise(S, R):
+	"""Add the measurement noise covariance R to the dense matrix S in place
+	:param S: ndarray of shape (m,m)
+	:param R: measurement noise covariance (dense, diagonal or 2x2 blocks)
+	:return: S
+	"""
+	if isinstance(R, tuple):
+		U11, U12, U22 = R
+		N = len(U11)
+		idx = np.arange(N)
+		S[idx,idx] += U11
+		S[idx+N,idx+N] += U22
+		S[idx,idx+N] += U12
+		S[idx+N,idx] += U12
+	elif R.ndim == 1:
+		S.flat[::S.shape[0]+1] += R
+	else:
+		S += R
+	return S
+
+
+def noise_solve(R, A):
+	"""Solve R*X = A for the measurement noise covariance R
+	:param R: measurement noise covariance (dense, diagonal or 2x2 blocks)
+	:param A: ndarray of shape (m,) or (m,k)
+	:return: X
+	"""
+	if isinstance(R, tuple):
+		U11, U12, U22 = R
+		N = len(U11)
+		if A.ndim == 2:
+			U11, U12, U22 = U11[:,np.newaxis], U12[:,np.newaxis], U22[:,np.newaxis]
+		det = U11*U22 - U12**2
+		At, Ab = A[:N], A[N:]
+		return np.r_[(U22*At - U12*Ab)/det, (U11*Ab - U12*At)/det]
+	elif R.ndim == 1:
+		if A.ndim == 2:
+			return A/R[:,np.newaxis]
+		return A/R
+	return cho_solve(cho_factor(R, lower=True), A)
+
+
+def innovation_solve(S, B):
+	"""Solve S*X = B for the symmetric positive definite innovation covariance S by Cholesky factorization.
+	If S is not positive definite (e.g., due to round-off in the covariance update), the system is solved by
+	LU factorization and, if S is singular, by the pseudo-inverse of S.
+	:param S: ndarray of shape (m,m)
+	:param B: ndarray of shape (m,) or (m,k)
+	:return: X
+	"""
+	try:
+		return cho_solve(cho_factor(S, lower=True, check_finite=False), B, check_finite=False)
+	except (LinAlgError, ValueError):
+		pass
+	try:
+		return np.linalg.solve(S, B)
+	except np.linalg.LinAlgError:
+		return np.dot(np.linalg.pinv(S), B)
+
+
+def kalman_gain(P, H, R, side="auto"):
+	"""Kalman gain K = P*H' * inv(H*P*H' + R)
+
+	:param P: forecast error covariance of shape (n,n)
+	:param H: observation matrix of shape (m,n)
+	:param R: measurement noise covariance (dense, diagonal or 2x2 blocks)
+	:param side: "measurement", "state" or "auto" (default); "auto" chooses the smaller of both dimensions
+	:return: K of shape (n,m)
+	"""
+	n = P.shape[0]
+	m = H.shape[0]
+	if side == "auto":
+		side = "state" if m > n else "measurement"
+	if side == "state":
+		try:
+			return InformationUpdate(information_matrix(P, fallback=False), H, R).gain()
+		except (LinAlgError, ValueError):
+			pass	# P or R singular; use measurement space instead
+	PHt = np.dot(P, H.T)
+	S = add_noise(np.dot(H, PHt), R)
+	return innovation_solve(S, PHt.T).T
+
+
+def condition_estimate(S, lu=None):
+	"""Estimate of the 1-norm condition number of S by LAPACK gecon, which needs O(m^2) operations in addition
+	to the LU factorization instead of the singular value decomposition of np.linalg.cond
+	:param S: ndarray of shape (m,m)
+	:param lu: (optional) LU factorization of S as returned by scipy.linalg.lu_factor
+	:return: estimate of the condition number
+	"""
+	if S.shape[0] == 0:
+		return 1.0
+	if lu is None:
+		lu = lu_factor(S, check_finite=False)
+	gecon, = get_lapack_funcs(("gecon",), (lu[0],))
+	rcond, info = gecon(lu[0], np.abs(S).sum(axis=0).max(), norm="1")
+	return 1.0/rcond if rcond > 0 else np.inf
+
+
+def information_matrix(P, fallback=True):
+	"""Inverse of the symmetric positive definite covariance matrix P by Cholesky factorization
+	:param P: ndarray of shape (n,n)
+	:param fallback: if True, the pseudo-inverse is used when P is not positive definite; otherwise LinAlgError is raised
+	:return: inv(P)
+	"""
+	try:
+		return cho_solve(cho_factor(P, lower=True, check_finite=False), np.eye(P.shape[0]), check_finite=False)
+	except (LinAlgError, ValueError):
+		if not fallback:
+			raise LinAlgError("Covariance matrix is not positive definite.")
+		return np.linalg.pinv(P)
+
+
+class InformationUpdate(object):
+	"""
+	Correction step of the Kalman filter in information form. With the forecast information matrix inv(P), the
+	posterior information matrix is
+
+		A = inv(P) + H'*inv(R)*H
+
+	and the correction of the state for the innovation z is inv(A)*H'*inv(R)*z. The only factorization is of the
+	(n,n) matrix A, which is cheaper than the (m,m) innovation covariance if there are many measurements.
+
+	:param Pinv: forecast information matrix inv(P) of shape (n,n), see `information_matrix`
+	:param H: observation matrix of shape (m,n)
+	:param R: measurement noise covariance (dense, diagonal or 2x2 blocks)
+	"""
+	def __init__(self, Pinv, H, R):
+		self.RinvH = noise_solve(R, H)
+		self.A = Pinv + np.dot(H.T, self.RinvH)	# accumulated H'*inv(R)*H
+		try:
+			self.fac = cho_factor(self.A, lower=True, check_finite=False)
+		except (LinAlgError, ValueError):
+			self.fac = None
+
+	def _solve(self, b):
+		# Cholesky factorization of A if positive definite, otherwise LU factorization or pseudo-inverse
+		if self.fac is not None:
+			return cho_solve(self.fac, b, check_finite=False)
+		try:
+			return np.linalg.solve(self.A, b)
+		except np.linalg.LinAlgError:
+			return np.dot(np.linalg.pinv(self.A), b)
+
+	def correction(self, z):
+		"""State correction inv(A)*H'*inv(R)*z for the innovation z"""
+		return self._solve(np.dot(self.RinvH.T, z))
+
+	def gain(self):
+		"""Kalman gain K = inv(A)*H'*inv(R)"""
+		return self._solve(self.RinvH.T)
+
+	def covariance(self):
+		"""Posterior error covariance inv(A)"""
+		return self._solve(np.eye(self.A.shape[0]))
+
+
+def sequential_update(x, P, H, R, y):
+	"""
+	Correction step of the Kalman filter processing the measurements one at a time (diagonal R) or one 2x2 block
+	at a time (R given as 2x2 blocks). Each measurement is assimilated by a rank-1 (rank-2) update of the state and
+	covariance, such that no matrix inversion is required. The result is equivalent to the correction with the full
+	Kalman gain for the measurement model y = H*x + v. Measurements with value NaN are skipped.
+
+	:param x: forecast state of shape (n,)
+	:param P: symmetric forecast error covariance of shape (n,n)
+	:param H: observation matrix of shape (m,n)
+	:param R: measurement noise covariance as vector of variances of shape (m,) or 2x2 blocks (U11, U12, U22)
+	:param y: measurements of shape (m,)
+	:return: x, P
+	"""
+	x = np.array(x, dtype=float)
+	P = np.array(P, dtype=float)
+	H = np.asarray(H)
+	available = ~np.isnan(y)
+
+	def scalar_update(i, r):
+		ph = np.dot(P, H[i])
+		kg = ph/(np.dot(H[i], ph) + r)
+		x[:] += kg*(y[i] - np.dot(H[i], x))
+		P[:] -= np.outer(kg, ph)
+
+	if isinstance(R, tuple):
+		U11, U12, U22 = R
+		N = len(U11)
+		for i in range(N):
+			j = i + N
+			if available[i] and available[j]:
+				Hb = H[[i,j]]
+				PHt = np.dot(P, Hb.T)
+				S = np.dot(Hb, PHt)
+				S[0,0] += U11[i]; S[1,1] += U22[i]; S[0,1] += U12[i]; S[1,0] += U12[i]
+				Sinv = np.array([[S[1,1], -S[0,1]], [-S[1,0], S[0,0]]])/(S[0,0]*S[1,1] - S[0,1]*S[1,0])
+				Kb = np.dot(PHt, Sinv)
+				x += np.dot(Kb, y[[i,j]] - np.dot(Hb, x))
+				P -= np.dot(Kb, PHt.T)
+			elif available[i]:
+				scalar_update(i, U11[i])
+			elif available[j]:
+				scalar_update(j, U22[i])
+	else:
+		R = np.asarray(R)
+		if R.ndim != 1:
+			raise ValueError("Sequential processing requires diagonal or 2x2 block diagonal R.")
+		for i in np.nonzero(available)[0]:
+			scalar_update(i, R[i])
+	# remove asymmetry due to round-off, which would otherwise be amplified over time
+	return x, 0.5*(P + P.T)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the Monte Carlo propagation of measurement and pseudo-measurement uncertainties through the
+nodal load observer according to GUM Supplement 1 (JCGM 101:2008).
+
+For each draw, the measurements and pseudo-measurements are perturbed by normally distributed errors with the given
+standard uncertainties and the estimator is evaluated. Draws are evaluated in batches (all draws of a batch at once
+by `BatchLinearKalmanFilter` for the LKF and by `BatchIteratedExtendedKalman` for the IEKF) and batches may be
+distributed over worker processes (see parallel.py). The results of each batch are accumulated into running
+statistics, such that the individual draws are never stored:
+
+	- mean and standard deviation
+	- (optional) covariance matrix between the nodes for each time step
+	- (optional) probabilistically symmetric coverage intervals from a histogram with fixed bins
+
+"""
+
+from inspect import getargspec
+
+import numpy as np
+
+from NLO.parallel import iter_parallel
+
+# position of the quantities in the return values of the estimators
+quantity_index = {"S": 0, "V": 1, "DeltaS": 3}
+
+
+class RunningStatistics(object):
+	"""
+	Mean, variance and (optional) covariance of draws of an array of shape (n,nT), updated batch-wise by the
+	pairwise update formula of Chan et al. Coverage intervals are obtained from histograms with `bins` bins of equal
+	width covering `bin_range` standard deviations (of the first batch) around the mean of the first batch; the
+	resolution of the interval limits is hence about 2*bin_range/bins standard deviations.
+
+	:param covariance: if True, the covariance matrix between the n rows is calculated for each of the nT columns
+	:param bins: number of histogram bins for coverage intervals; 0 switches the histograms off
+	:param bin_range: half width of the histogram in standard deviations
+	"""
+	def __init__(self, covariance=False, bins=1000, bin_range=10.0):
+		self.covariance = covariance
+		self.bins = bins
+		self.bin_range = bin_range
+		self.count = 0
+		self.mean = None
+		self.M2 = None 		# sum of squared deviations from the mean (diagonal or full for each column)
+		self.hist = None
+
+	def update(self, X):
+		"""
+		Add a batch of draws
+		:param X: ndarray of shape (nDraws,n,nT)
+		"""
+		X = np.asarray(X, dtype=float)
+		nb = X.shape[0]
+		mb = X.mean(axis=0)
+		dX = X - mb
+		if self.covariance:
+			M2b = np.einsum("dit,djt->tij", dX, dX)
+		else:
+			M2b = np.sum(dX**2, axis=0)
+		if self.count == 0:
+			self.mean, self.M2 = mb, M2b
+		else:
+			n = self.count
+			delta = mb - self.mean
+			self.mean = self.mean + delta*nb/float(n + nb)
+			if self.covariance:
+				self.M2 = self.M2 + M2b + np.einsum("it,jt->tij", delta, delta)*n*nb/float(n + nb)
+			else:
+				self.M2 = self.M2 + M2b + delta**2*n*nb/float(n + nb)
+		self.count += nb
+		if self.bins > 0:
+			self._update_histogram(X)
+
+	def _update_histogram(self, X):
+		if self.hist is None:
+			with np.errstate(invalid="ignore", divide="ignore"):
+				scale = self.std
+			scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+			self.lower = self.mean - self.bin_range*scale
+			self.width = 2*self.bin_range*scale/self.bins
+			# one additional bin for values below and above the range
+			self.hist = np.zeros(self.mean.shape + (self.bins + 2,), dtype=np.int64)
+		b = np.floor((X - self.lower)/self.width).astype(np.int64) + 1
+		b = np.clip(b, 0, self.bins + 1)
+		offset = np.arange(self.mean.size).reshape(self.mean.shape)*(self.bins + 2)
+		self.hist += np.bincount((b + offset).ravel(), minlength=self.hist.size).reshape(self.hist.shape)
+
+	@property
+	def variance(self):
+		if self.covariance:
+			return np.diagonal(self.M2, axis1=1, axis2=2).T/(self.count - 1)
+		return self.M2/(self.count - 1)
+
+	@property
+	def std(self):
+		return np.sqrt(self.variance)
+
+	@property
+	def cov(self):
+		"""Covariance matrices of shape (nT,n,n)"""
+		if not self.covariance:
+			raise ValueError("The covariance has not been calculated; use covariance=True.")
+		return self.M2/(self.count - 1)
+
+	def quantile(self, p):
+		"""
+		p-quantile of the draws obtained by linear interpolation in the histogram. Values outside of the range of the
+		histogram are NaN.
+		"""
+		if self.hist is None:
+			raise ValueError("No histograms available; use bins > 0.")
+		cum = np.cumsum(self.hist, axis=-1)
+		target = p*self.count
+		j = np.argmax(cum >= target, axis=-1)	# bin containing the quantile
+		below = _take(cum, j) - _take(self.hist, j)
+		frac = (target - below)/np.maximum(_take(self.hist, j), 1)
+		q = self.lower + (j - 1 + frac)*self.width
+		q[(j == 0) | (j == self.bins + 1)] = np.nan
+		return q
+
+	def interval(self, coverage=0.95):
+		"""Probabilistically symmetric coverage interval for the given coverage probability
+		:return: lower and upper limit, each of shape (n,nT)
+		"""
+		return self.quantile(0.5*(1 - coverage)), self.quantile(0.5*(1 + coverage))
+
+
+def _take(A, j):
+	"""A[..., j] with a different index j for each of the leading indices; j is of shape A.shape[:-1]"""
+	idx = np.ogrid[tuple(slice(0, s) for s in A.shape[:-1])]
+	return A[tuple(idx) + (j,)]
+
+
+def draw(values, uncertainties, size, rng):
+	"""
+	Draws of normally distributed values
+	:param values: dict of ndarrays of shape (n_key,nT)
+	:param uncertainties: dict of standard uncertainties (float, shape (n_key,) or (n_key,nT)); values of keys
+			without uncertainty are not perturbed
+	:param size: number of draws
+	:param rng: numpy.random.RandomState
+	:return: dict of ndarrays of shape (size,n_key,nT)
+	"""
+	draws = {}
+	for key in values:
+		x = np.asarray(values[key], dtype=float)
+		if uncertainties is not None and key in uncertainties:
+			u = np.asarray(uncertainties[key], dtype=float)
+			if u.ndim == 1:
+				u = u[:, np.newaxis]
+			draws[key] = x + u*rng.randn(size, *x.shape)
+		else:
+			draws[key] = np.tile(x, (size, 1, 1))
+	return draws
+
+
+def _evaluate_batch(seed, size, estimator_name, meas, meas_unc, pseudo_meas, pseudo_unc, quantities, **kwargs):
+	"""Evaluate the estimator for a batch of draws; executed by the worker processes"""
+	from NLO.batch import BatchLinearKalmanFilter, BatchIteratedExtendedKalman
+	import NLO.nodal_load_observer as nlo
+	rng = np.random.RandomState(seed)
+	meas_draws = draw(meas, meas_unc, size, rng)
+	pseudo_draws = draw(pseudo_meas, pseudo_unc, size, rng)
+	if estimator_name == "LinearKalmanFilter":
+		results = BatchLinearKalmanFilter(meas=meas_draws, meas_unc=dict(meas_unc), pseudo_meas=pseudo_draws, **kwargs)
+	elif estimator_name == "IteratedExtendedKalman" and set(kwargs) <= set(getargspec(BatchIteratedExtendedKalman).args):
+		# options of the iterated filter which are not available in the batched version fall back to the loop below
+		results = BatchIteratedExtendedKalman(meas=meas_draws, meas_unc=dict(meas_unc), pseudo_meas=pseudo_draws,
+											  **kwargs)
+	else:
+		# each draw starts from a copy of the initial estimate such that it is neither modified nor shared
+		runs = [getattr(nlo, estimator_name)(meas=dict((key, v[i]) for key, v in meas_draws.items()), meas_unc=dict(meas_unc),
+										pseudo_meas=dict((key, v[i]) for key, v in pseudo_draws.items()),
+										**dict(kwargs, V0=np.array(kwargs["V0"])))
+				for i in range(size)]
+		results = [np.array(r) for r in zip(*runs)]
+	return dict((q, results[quantity_index[q]]) for q in quantities)
+
+
+def monte_carlo(topology, meas, meas_unc, meas_idx, pseudo_meas, pseudo_unc, model, V0, Vs=None, draws=1000,
+				batch_size=100, estimator="LinearKalmanFilter", quantities=("S", "V"), seed=None, processes=1,
+				covariance=False, bins=1000, **kwargs):
+	"""
+	Monte Carlo propagation of uncertainties through the nodal load observer (GUM Supplement 1)
+
+	:param topology: dict containing information on bus, branch, ... in PyPower format
+	:param meas: dict containing the measurements
+	:param meas_unc: dict containing associated standard uncertainties (same units as meas); measurements without
+			uncertainty are not perturbed
+	:param meas_idx: dict containing the corresponding indices
+	:param pseudo_meas: dict containing the pseudo-measurements
+	:param pseudo_unc: dict containing standard uncertainties of the pseudo-measurements
+	:param model: DynamicModel object as defined in dynamic_models.py
+	:param V0: initial estimate of nodal voltages
+	:param Vs: voltages at slack node (magnitude and phase); not used by NLOextended
+	:param draws: number of Monte Carlo draws
+	:param batch_size: number of draws evaluated at once
+	:param estimator: "LinearKalmanFilter" (default) or "IteratedExtendedKalman" (both vectorized over the draws
+			of a batch) or "NLOextended"
+	:param quantities: estimated quantities for which statistics are calculated; "S", "V" and/or "DeltaS"
+	:param seed: (optional) seed of the random number generator; the results do not depend on the number of processes
+	:param processes: (optional) number of worker processes for the batches (see parallel.py)
+	:param covariance: (optional) if True, the covariance matrices between nodes are calculated for each time step
+	:param bins: (optional) number of histogram bins for coverage intervals; 0 switches them off
+	:param kwargs: further keyword arguments of the estimator
+
+	:return: dict with a RunningStatistics object for each quantity
+	"""
+	rng = np.random.RandomState(seed)
+	nbatch = -(-draws//batch_size)
+	seeds = rng.randint(2**31 - 1, size=nbatch)
+	sizes = [min(batch_size, draws - i*batch_size) for i in range(nbatch)]
+	specs = [{"seed": s, "size": n} for s, n in zip(seeds, sizes)]
+	shared = dict(kwargs, topology=topology, meas=meas, meas_unc=meas_unc, meas_idx=meas_idx, pseudo_meas=pseudo_meas,
+				  pseudo_unc=pseudo_unc, model=model, V0=V0, estimator=_evaluate_batch, estimator_name=estimator,
+				  quantities=quantities)
+	if Vs is not None:
+		shared["Vs"] = Vs
+	stats = dict((q, RunningStatistics(covariance=covariance, bins=bins)) for q in quantities)
+	for result in iter_parallel(specs, shared=shared, processes=processes):
+		for q in quantities:
+			stats[q].update(result[q])
+	return stats
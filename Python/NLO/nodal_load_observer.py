@@ -10,17 +10,43 @@ original MATLAB code by Wiebke Heins (TU Clausthal)
 """
 
 import numpy as np
-from scipy.sparse import issparse
+from numpy.linalg import LinAlgError
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse import issparse, diags, bmat
+from scipy.sparse.linalg import spsolve
 
 if __name__=="NLO.nodal_load_observer": # module is imported from within package
 	from tools.data_tools import process_admittance, separate_Yslack, makeYbus
+	from NLO.factorization import factorize
+	from NLO.power_flow_equations import BranchList, BusPowerEquations, MeasurementEquations
+	from NLO import equation_cache
+	from NLO.selectors import Selector
+	from NLO.fixed_point import fixed_point
+	from NLO.convergence import Criterion, criteria
+	from NLO.kalman_update import add_noise, kalman_gain, information_matrix, InformationUpdate, \
+		sequential_update, condition_estimate
 else:
 	from tools.data_tools import process_admittance, separate_Yslack, makeYbus
+	from NLO.factorization import factorize
+	from NLO.power_flow_equations import BranchList, BusPowerEquations, MeasurementEquations
+	from NLO import equation_cache
+	from NLO.selectors import Selector
+	from NLO.fixed_point import fixed_point
+	from NLO.convergence import Criterion, criteria
+	from NLO.kalman_update import add_noise, kalman_gain, information_matrix, InformationUpdate, \
+		sequential_update, condition_estimate
+
+
+def relative_change(A, B):
+	"""Relative change max|A-B|/max|B| of A w.r.t. B (dense or sparse matrices)
+	"""
+	return abs(A - B).max()/max(abs(B).max(), np.finfo(float).tiny)
 
 
 def get_system_matrices(pmeas,qmeas,vmeas):
 	"""Construction of matrices Cm, Dm and Dnm which map all power/voltage values to the actual
-	measured/non-measured ones.
+	measured/non-measured ones. The matrices are returned as Selector objects (see selectors.py),
+	which store only the positions of the ones and are applied by indexing.
 
 	:param pmeas: (n_K,) shaped array of booleans indicating measurement positions of active power
 	:param qmeas: (n_K,) shaped array of booleans indicating measurement positions of reactive power
@@ -34,88 +60,251 @@ def get_system_matrices(pmeas,qmeas,vmeas):
 # construction of matrix Cm
 	m = vmeas.nonzero()[0]
 	r = len(m)
-	Cm = np.zeros((2*r,2*n_K))
-	for i in range(r):
-		Cm[i,m[i]] = 1
-		Cm[r+i,n_K+m[i]] = 1
+	Cm = Selector(np.arange(2*r), np.r_[m, n_K+m], (2*r,2*n_K))
 
 # construction of matrix Dm
-	pm = len(pmeas.nonzero()[0])
-	qm = len(qmeas.nonzero()[0])
-	Dm = np.zeros((2*n_K, pm+qm),dtype=int)  # (Eq.4.78) in WH thesis
-	for k,ind in enumerate(pmeas.nonzero()[0]):
-		Dm[ind,k] = 1
-	for k,ind in enumerate(qmeas.nonzero()[0]):
-		Dm[n_K+ind,pm+k] = 1
+	pm = pmeas.nonzero()[0]
+	qm = qmeas.nonzero()[0]
+	Dm = Selector(np.r_[pm, n_K+qm], np.arange(len(pm)+len(qm)), (2*n_K, len(pm)+len(qm)))  # (Eq.4.78) in WH thesis
 
 # construction of matrix Dnm
-	pnmeas = -pmeas[:]
-	qnmeas = -qmeas[:]
-	pnm = len(pnmeas.nonzero()[0])
-	qnm = len(qnmeas.nonzero()[0])
-	Dnm = np.zeros((2*n_K, pnm+qnm))  # (Eq.4.78) in WH thesis
-	for k,ind in enumerate(pnmeas.nonzero()[0]):
-		Dnm[ind,k] = 1
-	for k,ind in enumerate(qnmeas.nonzero()[0]):
-		Dnm[n_K+ind,pnm+k] = 1
+	pnm = (~pmeas).nonzero()[0]
+	qnm = (~qmeas).nonzero()[0]
+	Dnm = Selector(np.r_[pnm, n_K+qnm], np.arange(len(pnm)+len(qnm)), (2*n_K, len(pnm)+len(qnm)))  # (Eq.4.78) in WH thesis
 	return Cm, Dnm, Dm
 
 
 
 
-def jacobian(Y00,Ys,V,Vs):
+def jacobian(Y00,Ys,V,Vs,pattern=None):
 	"""
 	Calculation of jacobian matrix for the extended Kalman filter
+	For sparse Y00 and Ys the Jacobian is returned as scipy.sparse CSC matrix.
+
+	:param Y00: real-valued admittance matrix w/o slack node, shape (2*n,2*n)
+	:param Ys: real-valued admittance to slack node, shape (2*n,2)
+	:param V: real and imaginary part of nodal voltages, shape (2*n,)
+	:param Vs: real and imaginary part of slack voltage, shape (2,)
+	:param pattern: (optional) JacobianPattern object of Y00 to be reused for sparse matrices
+	:return: Dh
 	"""
-	n_K = Y00.shape[0]/2
-	G = Y00[:n_K,:n_K]
-	B = Y00[n_K:,:n_K]
-	Gs= Ys[:n_K,0]
-	Bs= Ys[n_K:,0]
-
-	n = V.shape[0]/2
+	if isinstance(pattern,JacobianPattern):
+		return pattern.evaluate(V,Vs)
+	if issparse(Y00):
+		return JacobianPattern(Y00,Ys).evaluate(V,Vs)
 
-	VsRe = Vs[0]
-	VsIm = Vs[1]
+	n = Y00.shape[0]/2
+	G = Y00[:n,:n]
+	B = Y00[n:,:n]
+	Gs= Ys[:n,0]
+	Bs= Ys[n:,0]
 
 	VRe = V[:n]
 	VIm = V[n:]
+	# real and imaginary part of nodal currents including the slack node
+	IRe = np.dot(G,VRe) - np.dot(B,VIm) + Gs*Vs[0] - Bs*Vs[1]
+	IIm = np.dot(B,VRe) + np.dot(G,VIm) + Bs*Vs[0] + Gs*Vs[1]
+
+	# Dh = [[H,N],[M,L]] with H = -L and N = M for the outer diagonal elements
+	Dh = np.empty((2*n,2*n))
+	H = Dh[:n,:n]; N = Dh[:n,n:]
+	M = Dh[n:,:n]; L = Dh[n:,n:]
+	np.multiply(3*VRe[:,np.newaxis],G,out=H)
+	H += 3*VIm[:,np.newaxis]*B
+	np.multiply(3*VIm[:,np.newaxis],G,out=N)
+	N -= 3*VRe[:,np.newaxis]*B
+	np.negative(H,out=L)
+	M[:] = N
+	# diagonal elements
+	diag = np.arange(n)
+	H[diag,diag] += 3*IRe
+	N[diag,diag] += 3*IIm
+	M[diag,diag] -= 3*IIm
+	L[diag,diag] += 3*IRe
+	return Dh
 
-	# Dh = [[H,N],[M,L]]
-	H = np.zeros((n,n))
-	N = np.zeros((n,n))
 
-	# outer diagonal elements of H
-	for i in range(n):
-		for j in range(n):
-			H[i,j] = 3*VRe[i]*G[i,j] + 3*VIm[i]*B[i,j]
-	# diagonal elements
-	for i in range(n):
-		H[i,i] = 3*np.dot(G[i,:],VRe)- 3*np.dot(B[i,:],VIm) + 3*G[i,i]*VRe[i] + 3*B[i,i]*VIm[i] + 3*Gs[i]*VsRe - 3*Bs[i]*VsIm
+def bus_power(Y00,Ys,V,Vs):
+	"""
+	Nodal power for nodal voltages V as used by the fix point equation of the nodal load observer, i.e.
+	P = 3*(VRe*IRe + VIm*IIm) and Q = 3*(VIm*IRe - VRe*IIm) with nodal currents I = Y00*V + Ys*Vs.
+	The function `jacobian` returns its derivative w.r.t. V.
+
+	:param Y00: real-valued admittance matrix w/o slack node, shape (2*n,2*n)
+	:param Ys: real-valued admittance to slack node, shape (2*n,2)
+	:param V: real and imaginary part of nodal voltages, shape (2*n,)
+	:param Vs: real and imaginary part of slack voltage, shape (2,)
+	:return: real and imaginary part of nodal power, shape (2*n,)
+	"""
+	n = len(V)/2
+	I = Y00.dot(V) + _dense_column(Ys.dot(Vs))
+	return 3*np.r_[V[:n]*I[:n] + V[n:]*I[n:], V[n:]*I[:n] - V[:n]*I[n:]]
 
-	# outer diagonal elements of N
-	for i in range(n):
-		for j in range(n):
-			N[i,j] = -3*VRe[i]*B[i,j] + 3*VIm[i]*G[i,j]
-	# diagonal elements
-	for i in range(n):
-		N[i,i] = 3*np.dot(B[i,:],VRe) + 3*np.dot(G[i,:],VIm) - 3*B[i,i]*VRe[i] + 3*G[i,i]*VIm[i] + 3*Bs[i]*VsRe + 3*Gs[i]*VsIm
-
-	# outer diagonal elements of M
-	M = N.copy()
-	# diagonal elements of M
-	for i in range(n):
-		M[i,i] = -3*np.dot(B[i,:],VRe) - 3*np.dot(G[i,:],VIm) -3*B[i,i]*VRe[i] + 3*G[i,i]*VIm[i] - 3*Bs[i]*VsRe - 3*Gs[i]*VsIm
-
-	# outer diagonal elements of L
-	L = -H.copy()
-	# diagonal elements of L
-	for i in range(n):
-		L[i,i] = 3*np.dot(G[i,:],VRe) -3*np.dot(B[i,:],VIm) - 3*B[i,i]*VIm[i] - 3*G[i,i]*VRe[i] + 3*Gs[i]*VsRe - 3*Bs[i]*VsIm
-
-	Dh = np.vstack((np.hstack((H,N)),
-					np.hstack((M,L))))
-	return Dh
+
+def newton_voltages(Y00,Ys,S,V,Vs,accuracy=1e-9,maxiter=20,pattern=None,damped=False,criterion=None):
+	"""
+	Calculate nodal voltages for given nodal power S by Newton-Raphson iteration on `bus_power`, using the
+	Jacobian matrix returned by `jacobian`. The iteration stops if the norm of the voltage update is below
+	`accuracy` or after `maxiter` iterations, or as defined by `criterion`.
+
+	:param Y00: real-valued admittance matrix w/o slack node, shape (2*n,2*n)
+	:param Ys: real-valued admittance to slack node, shape (2*n,2)
+	:param S: real and imaginary part of nodal power, shape (2*n,)
+	:param V: initial nodal voltages, shape (2*n,)
+	:param Vs: real and imaginary part of slack voltage, shape (2,)
+	:param accuracy: threshold for the norm of the voltage update
+	:param maxiter: maximum number of iterations
+	:param pattern: (optional) JacobianPattern object for sparse matrices
+	:param damped: if True, the Newton step is halved until the norm of the power mismatch decreases
+	:param criterion: (optional) Criterion object (see convergence.py) replacing accuracy and maxiter; the
+			power mismatch is available for mismatch-based stopping
+	:return: V, info with info a dict containing the number of "iterations", the "history" of step norms
+			and the "reason" for stopping
+	"""
+	crit = (criterion or Criterion(atol=accuracy, maxiter=maxiter)).start()
+	mismatch = S - bus_power(Y00,Ys,V,Vs)
+	while True:
+		Dh = jacobian(Y00,Ys,V,Vs,pattern)
+		dV = factorize(Dh, use_cache=False).solve(mismatch)
+		alpha = 1.0
+		V_new = V + dV
+		mismatch_new = S - bus_power(Y00,Ys,V_new,Vs)
+		if damped:
+			nrm = np.linalg.norm(mismatch)
+			while np.linalg.norm(mismatch_new) > (1 - 1e-4*alpha)*nrm and alpha > 1.0/64:
+				alpha /= 2
+				V_new = V + alpha*dV
+				mismatch_new = S - bus_power(Y00,Ys,V_new,Vs)
+		V, mismatch = V_new, mismatch_new
+		if crit.check(alpha*np.linalg.norm(dV), np.linalg.norm(V), np.linalg.norm(mismatch)):
+			break
+	return V, crit.info()
+
+
+class JacobianPattern(object):
+	"""
+	Sparsity structure of the EKF Jacobian for a sparse admittance matrix.
+	All four blocks H, N, M and L of the Jacobian share the nonzero pattern of the admittance matrix
+	(plus its diagonal). The pattern and the CSC structure of the Jacobian are determined once, such that each
+	evaluation only fills the nonzero values with cost linear in the number of branches.
+	"""
+	def __init__(self,Y00,Ys):
+		from scipy.sparse import csr_matrix, coo_matrix, identity
+		Y00 = csr_matrix(Y00)
+		n = Y00.shape[0]/2
+		self.n = n
+		self.G = Y00[:n,:n]
+		self.B = Y00[n:,:n]
+		self.Gs = _dense_column(Ys[:n,:1])
+		self.Bs = _dense_column(Ys[n:,:1])
+
+		# common nonzero pattern of G, B and the diagonal
+		P = (abs(self.G) + abs(self.B) + identity(n,format="csr")).tocoo()
+		r, c = P.row, P.col
+		self.rows = r
+		self.g = np.asarray(self.G[r,c]).ravel()
+		self.b = np.asarray(self.B[r,c]).ravel()
+		self.diag = (r==c).nonzero()[0]
+		self.diag_rows = r[self.diag]
+
+		# CSC structure of [[H,N],[M,L]] and permutation from block-wise ordering to CSC ordering
+		nnz = len(r)
+		rows = np.r_[r, r, r+n, r+n]
+		cols = np.r_[c, c+n, c, c+n]
+		order = coo_matrix((np.arange(1,4*nnz+1,dtype=float),(rows,cols)),shape=(2*n,2*n)).tocsc()
+		self.perm = order.data.astype(int) - 1
+		self.indices = order.indices
+		self.indptr = order.indptr
+		self.shape = (2*n,2*n)
+
+	def evaluate(self,V,Vs):
+		"""
+		Calculate the Jacobian matrix for nodal voltages V and slack voltage Vs
+		:return: Dh in scipy.sparse CSC format
+		"""
+		from scipy.sparse import csc_matrix
+		n = self.n
+		VRe = V[:n]
+		VIm = V[n:]
+		IRe = self.G.dot(VRe) - self.B.dot(VIm) + self.Gs*Vs[0] - self.Bs*Vs[1]
+		IIm = self.B.dot(VRe) + self.G.dot(VIm) + self.Bs*Vs[0] + self.Gs*Vs[1]
+
+		VRe_r = 3*VRe[self.rows]
+		VIm_r = 3*VIm[self.rows]
+		H = VRe_r*self.g + VIm_r*self.b
+		N = VIm_r*self.g - VRe_r*self.b
+		M = N.copy()
+		L = -H
+		H[self.diag] += 3*IRe[self.diag_rows]
+		N[self.diag] += 3*IIm[self.diag_rows]
+		M[self.diag] -= 3*IIm[self.diag_rows]
+		L[self.diag] += 3*IRe[self.diag_rows]
+		data = np.r_[H,N,M,L][self.perm]
+		return csc_matrix((data,self.indices,self.indptr),shape=self.shape)
+
+
+def broyden_update(H, dx, dy):
+	"""Broyden rank-1 update of the Jacobian H such that the updated matrix satisfies the secant condition H*dx = dy
+	:param H: ndarray of shape (m,n)
+	:param dx: change of the argument; shape (n,)
+	:param dy: change of the function value; shape (m,)
+	:return: updated H
+	"""
+	nrm = np.dot(dx, dx)
+	if nrm == 0:
+		return H
+	return H + np.outer(dy - np.dot(H, dx), dx/nrm)
+
+
+def predicted_step(steps, confirm=False):
+	"""Estimate of the step norm of the next iteration by the contraction of the iteration
+	:param steps: step norms of all iterations up to the current one
+	:param confirm: True if the current iteration follows a change of the Jacobian; the contraction is then that of
+			the two previous iterations instead of that of the current one
+	:return: estimated norm of the next step; the current step if the contraction is not known
+	"""
+	rate = steps[-3:-1] if confirm else steps[-2:]
+	if len(rate) == 2 and rate[0] > 0:
+		return steps[-1]*min(1.0, rate[1]/rate[0])
+	return steps[-1]
+
+
+def _dense_column(A):
+	# return (n,1) shaped dense or sparse matrix as flat numpy array
+	if issparse(A):
+		return A.toarray().ravel()
+	return np.asarray(A).ravel()
+
+
+def _dense(A):
+	# return numpy array of dense or sparse matrix A
+	if issparse(A):
+		return A.toarray()
+	return A
+
+
+def _solve(A,b):
+	"""Solve the linear system A x = b for dense or scipy.sparse matrix A
+	"""
+	if issparse(A):
+		return spsolve(A.tocsc(),b)
+	return np.linalg.solve(A,b)
+
+
+def calcM(mu,sparse=False):
+	"""Matrix M(mu) relating nodal power to nodal current for nodal voltages mu (W. Heins thesis).
+
+	:param mu: (2*n_K,) shaped array of real and imaginary part of nodal voltages
+	:param sparse: if True, M is returned in scipy.sparse CSR format
+	"""
+	n_K = len(mu)/2
+	divisor = 3*(mu[:n_K]**2 + mu[n_K:]**2)
+	if sparse:
+		a = diags(mu[:n_K]/divisor,0)
+		b = diags(mu[n_K:]/divisor,0)
+		return bmat([[a, b],[b, -a]],format="csr")
+	return np.r_[np.c_[np.diag(mu[:n_K]/divisor), np.diag(mu[n_K:]/divisor)],
+			     np.c_[np.diag(mu[n_K:]/divisor), -np.diag(mu[:n_K]/divisor)]]
 
 
 def jacobian_dSdV(Y, nK):
@@ -123,6 +312,8 @@ def jacobian_dSdV(Y, nK):
 	# calculate the corresponding Jacobian matrix.
 	from sympy import symbols, Matrix
 
+	if issparse(Y):		# symbolic set up requires dense matrix
+		Y = Y.toarray()
 	G = Matrix(np.real(Y))
 	B = Matrix(np.imag(Y))
 
@@ -180,7 +371,9 @@ def jacobian_dHdV(nK, y, cap, inds):
 
 
 def LinearKalmanFilter(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
-						   Vs, slack_idx=0, Y=None):
+						   Vs, slack_idx=0, Y=None, sparse=None, steady_state=None, steady_state_tol=1e-3,
+						   drift_tol=1e-3, fixed_point_method="picard", iteration_log=None, convergence=None,
+						   profile=None):
 	"""
 	Quasi-Linear Kalman filter for the nodal load observer
 	This version of the NLO state estimation method ignores the nonlinearity for the calculation of the
@@ -198,14 +391,31 @@ def LinearKalmanFilter(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V
 	:param Vs: voltages at slack node (magnitude and phase)
 	:param slack_idx: index of slack node
 	:param Y: (optional) user defined admittance matrix
+	:param sparse: (optional) if True, admittance matrices are kept in sparse format and all linear systems
+			are solved by sparse factorization; default is True if Y is a scipy.sparse matrix
+	:param steady_state: (optional) if "last", Ks and the Kalman gain are frozen at their last calculated values
+			as soon as the relative change of Ks (i.e., of M in Ks = inv(Yadm)*M) and of the error covariance
+			between two time steps is below `steady_state_tol`. Ks and gain are recalculated if the relative
+			change of the estimated voltages w.r.t. those at freezing exceeds `drift_tol`.
+	:param steady_state_tol: (optional) threshold for freezing the gain; Ks follows the changes of the load and
+			typically changes by 1e-4 to 1e-3 between time steps
+	:param drift_tol: (optional) threshold for the recalculation of a frozen gain
+	:param fixed_point_method: (optional) "picard" (default) or "anderson" iteration for the calculation of
+			voltages from power (see fixed_point.py)
+	:param iteration_log: (optional) list to which a dict with the number of "iterations" and the "history" of
+			step norms is appended for each solution of the fixed point equation
+	:param convergence: (optional) dict with a Criterion object (see convergence.py) for the loop "voltage"
+			(fix point iteration for Ks); default is an absolute tolerance of 1e-12 and 20 iterations
+	:param profile: (optional) StepProfile object (see instrumentation.py) recording the time of the stages
+			"voltage", "gain" and "correction", the iterations of the loop "voltage" and, if `profile.condition`
+			is set, an estimate of the "condition" number of the innovation covariance for each time step
 
 	"""
-	if issparse(Y):
-		Y = Y.toarray()
-
-	if not isinstance(Y,np.ndarray):
+	if not (isinstance(Y,np.ndarray) or issparse(Y)):
 		Y = makeYbus(topology["baseMVA"],topology["bus"],topology["branch"])
-	Yadm, Y_slack = separate_Yslack(Y,slack_idx)
+	if sparse is None:
+		sparse = issparse(Y)
+	Yadm, Y_slack = separate_Yslack(Y,slack_idx,sparse=sparse)
 
 	nK = len(V0)/2
 	pmeas = np.zeros(nK,dtype = bool); pmeas[meas_idx["Pk"]] = True
@@ -216,10 +426,14 @@ def LinearKalmanFilter(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V
 	# transform voltages at slack node to real and imaginary parts
 	Vs_ri = np.vstack((Vs[0,:]*np.cos(Vs[1,:]),
 					   Vs[0,:]*np.sin(Vs[1,:])))
-	Slack = np.linalg.solve(Yadm,np.dot(Y_slack,Vs_ri))
+	# Yadm is constant, hence it is factorized only once for all time steps and iterations
+	Yfac = factorize(Yadm)
+	Slack = Yfac.solve(Y_slack.dot(Vs_ri))
 	# y = np.r_[meas["Vm"], meas["Va"]] + np.dot(Cm,Slack)
+	# rows of inv(Yadm) at measured voltages; Ks = inv(Yadm)*M is never formed explicitly
+	CmYinv = Yfac.solve(Cm.T.toarray(), trans=True).T
 
-	S = np.dot(Dm, np.r_[meas["Pk"], meas["Qk"]]) + np.dot(Dnm, np.r_[pseudo_meas["Pk"], pseudo_meas["Qk"]])
+	S = Dm.dot(np.r_[meas["Pk"], meas["Qk"]]) + Dnm.dot(np.r_[pseudo_meas["Pk"], pseudo_meas["Qk"]])
 
 	# adjust uncertainties in case that their dimension is wrong
 	if isinstance(meas_unc["Vm"],float):
@@ -235,28 +449,28 @@ def LinearKalmanFilter(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V
 	nx = model.dim
 	nm = 2*meas["Vm"].shape[0]
 	t_f= meas["Vm"].shape[1]
+	# transform voltages to real and imaginary parts for all time steps
+	yRe,yIm,URI = amph_phase_to_real_imag_batch(meas["Vm"],np.radians(meas["Va"]),meas_unc["Vm"]**2,meas_unc["Va"]**2)
 
-	def calcM(mu):
-		divisor = 3*(mu[:nK]**2 + mu[nK:]**2)
-		return np.r_[np.c_[np.diag(mu[:nK]/divisor), np.diag(mu[nK:]/divisor)],
-				     np.c_[np.diag(mu[nK:]/divisor), -np.diag(mu[:nK]/divisor)]]
+	crits = criteria({"voltage": Criterion(atol=1e-12, maxiter=20)}, convergence)
 
-	def calcKs(V,Sh,k,accuracy=1e-12):
+	def calcKs(V,Sh,k):
 		# According to W. Heins' Thesis calculation of V using Ks is a fix point equation
 		# We take that into account by doing a fixed number of iterations of the corresponding
-		# fix point iterations
-		Vn = V.copy()
-		fp_diff = 1.0
-		maxiter = 20
-		count = 0
-		while fp_diff>accuracy and count < maxiter:
-			tmp = Vn
-			MU = calcM(Vn)
-			Ks = np.linalg.solve(Yadm,MU)
-			Vn = np.dot(Ks, np.dot(Dnm,Sh) + S[:,k]) - Slack[:,k]
-			fp_diff = np.linalg.norm(tmp-Vn)
-			count += 1
-		return Ks
+		# fix point iterations. Since Ks = inv(Yadm)*M, only M of the last iteration is returned.
+		# The iteration starts from the voltages of the previous time step.
+		rhs = Dnm.dot(Sh) + S[:,k]
+		last = {}
+		def g(Vn):
+			last["MU"] = calcM(Vn,sparse)
+			return Yfac.solve(last["MU"].dot(rhs)) - Slack[:,k]
+		Vn, info = fixed_point(g, V.copy(), method=fixed_point_method, criterion=crits["voltage"])
+		if isinstance(iteration_log, list):
+			info["step"] = k
+			iteration_log.append(info)
+		if profile is not None:
+			profile.add_iterations("voltage", k, info["iterations"])
+		return last["MU"]
 
 
 	P = model.forecast_unc()
@@ -270,45 +484,71 @@ def LinearKalmanFilter(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V
 	UncDeltaS = np.zeros_like(DeltaS_est)
 	Dnm = model.adjust_Dnm(Dnm)
 
+	if steady_state not in [None, "last"]:
+		raise ValueError("Unknown steady state mode '%s'. Use None or 'last'." % steady_state)
+	frozen = False 	# True if Ks and gain are frozen
+	V_frozen = None 	# estimated voltages at freezing
+	MU_prev = P_prev = None
+
 #%% ########################### KALMAN ########################################
 	print '.',
 	for k in range(1,t_f+1):
-		# transform voltages to real and imaginary parts
-		yRe,yIm,R = amph_phase_to_real_imag(meas["Vm"][:,k-1],np.radians(meas["Va"][:,k-1]),meas_unc["Vm"][:,k-1]**2,meas_unc["Va"][:,k-1]**2)
-		y = np.r_[yRe,yIm] + np.dot(Cm,Slack[:,k-1])
+		y = np.r_[yRe[:,k-1],yIm[:,k-1]] + Cm.dot(Slack[:,k-1])
+		if frozen and relative_change(V_est[:,k-1], V_frozen) > drift_tol:
+			frozen = False
 	# preparation of state space system matrices
-		Ks = calcKs(V_est[:,k-1],x_est[:,k-1],k-1)
-		C = np.dot(Cm,np.dot(Ks,Dnm))
-		D = np.dot(Cm,Ks)
+		if profile is not None: t0 = profile.tic()
+		if not frozen:
+			MU = calcKs(V_est[:,k-1],x_est[:,k-1],k-1)
+			D = MU.T.dot(CmYinv.T).T 	# D = Cm*Ks
+			C = Dnm.premultiply(D)
+		if profile is not None: profile.toc("voltage", k-1, t0); t0 = profile.tic()
 #========================== actual Kalman filter part =========================
 	#  Kalman filter forecast step
 		xf = model.forecast_state(x_est[:,k-1])[:,np.newaxis]
-		Pf = model.forecast_unc(P)
-	# Kalman gain matrix K
-		K =  np.linalg.solve(np.dot(C,np.dot(Pf,C.T)) + R, np.dot(C,P)).T
+		if not frozen:
+			Pf = model.forecast_unc(P)
+		# Kalman gain matrix K
+			Sinn = add_block_covariance(np.dot(C,np.dot(Pf,C.T)),URI,k-1)
+			lu = lu_factor(Sinn, check_finite=False)
+			K =  lu_solve(lu, np.dot(C,P), check_finite=False).T
+			if profile is not None and profile.condition:
+				profile.set_value("condition", k-1, condition_estimate(Sinn, lu))
+		if profile is not None: profile.toc("gain", k-1, t0); t0 = profile.tic()
 	# corrected state estimate
 		x_est[:,k][:,np.newaxis] = xf + np.dot(K, y.reshape(nm,1)
 									  - (np.dot(C,xf) + np.dot(D,S[:,k-1].reshape(2*nK,1))) )
-	# corrected error covariance matrix
-		P = np.dot(np.eye(nx) - np.dot(K,C),Pf)
+		if not frozen:
+		# corrected error covariance matrix
+			P = np.dot(np.eye(nx) - np.dot(K,C),Pf)
+			if steady_state and P_prev is not None and relative_change(MU, MU_prev) < steady_state_tol \
+					and relative_change(P, P_prev) < steady_state_tol:
+				frozen = True
+				V_frozen = V_est[:,k-1].copy()
+			MU_prev, P_prev = MU, P
 #==============================================================================
 	# calculate voltage from estimated power
-		V_est[:,k] = np.dot(Ks, np.dot(Dnm,x_est[:,k-1]) + S[:,k-1]) - Slack[:,k-1]
+		V_est[:,k] = Yfac.solve(MU.dot(Dnm.dot(x_est[:,k-1]) + S[:,k-1])) - Slack[:,k-1]
 		DeltaS_est[:,k-1] = x_est[:,k]
 		UncDeltaS[:,k-1] = np.sqrt(np.diag(P))
+		if profile is not None:
+			profile.toc("correction", k-1, t0)
+			profile.end_step(k-1)
 		print '.',
 	print '.'
 #%%
 
   # results
-	S_est = S + np.dot(Dnm,DeltaS_est) # S_est = S + D_ng * DeltaS_est
-	UncS  = np.zeros_like(S) + np.dot(Dnm,UncDeltaS)
+	S_est = S + Dnm.dot(DeltaS_est) # S_est = S + D_ng * DeltaS_est
+	UncS  = np.zeros_like(S) + Dnm.dot(UncDeltaS)
 	return S_est, V_est[:,1:], UncS, DeltaS_est,UncDeltaS
 
 
 
 def IteratedExtendedKalman(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
-						   Vs,slack_idx=0, Y=None, accuracy=1e-9, maxiter=50):
+						   Vs,slack_idx=0, Y=None, accuracy=1e-9, maxiter=50, sparse=None, filter_form="auto",
+						   jacobian_update="full", refresh_ratio=0.5, refresh_drift=1e-3, fixed_point_method="picard",
+						   iteration_log=None, voltage_solver="fixed_point", convergence=None, profile=None):
 	"""
 	Iterated Extended Kalman filter for the nodal load observer
 	Real-valued matrices of complex-valued quantities are assumed to be structured as [ [real part], [imag part] ]
@@ -325,30 +565,39 @@ def IteratedExtendedKalman(topology, meas, meas_unc, meas_idx, pseudo_meas, mode
 	:param Y: (optional) admittance matrix
 	:param accuracy: threshold for inner iteration of the iterated EKF
 	:param maxiter: maximum number of inner iterations of the iterated EKF
+	:param sparse: (optional) if True, admittance matrices and Jacobian are kept in sparse format and all linear
+			systems are solved by sparse factorization; default is True if Y is a scipy.sparse matrix
+	:param filter_form: (optional) "covariance", "information", "sequential" or "auto" (default); the information form
+			solves all linear systems in the state dimension and is chosen by "auto" if there are more measurements
+			than states; "sequential" processes the measurements one (2x2 block) at a time
+	:param jacobian_update: (optional) "full" (default) recalculates the Jacobian in each iteration; "reuse" keeps
+			the linearization and the Kalman gain of previous iterations and time steps; "broyden" additionally
+			applies Broyden rank-1 updates from consecutive iterates. With "reuse" or "broyden" the Jacobian is
+			recalculated when the voltages drift away from the linearization or the iteration contracts worse than
+			`refresh_ratio`. A stop is confirmed by one iteration with the exact Jacobian, whose step is scaled by
+			the contraction of the previous iterations, such that the estimate is that of "full" within `accuracy`
+	:param refresh_ratio: (optional) threshold for the ratio of consecutive iteration steps
+	:param refresh_drift: (optional) threshold for the relative change of the voltages since the last
+			calculation of the Jacobian
+	:param fixed_point_method: (optional) "picard" (default) or "anderson" iteration for the calculation of
+			voltages from power (see fixed_point.py)
+	:param iteration_log: (optional) list to which a dict with the number of "iterations" and the "history" of
+			step norms is appended for each solution of the fixed point equation
+	:param voltage_solver: (optional) "fixed_point" (default), "newton" or "damped_newton"; method for the
+			calculation of nodal voltages from nodal power in each iteration (see `newton_voltages`)
+	:param convergence: (optional) dict with Criterion objects (see convergence.py) for the loops "voltage"
+			(calculation of voltages) and "iekf" (iterations of the Kalman filter) replacing the defaults
+			given by `accuracy` and `maxiter`
+	:param profile: (optional) StepProfile object (see instrumentation.py) recording the time of the stages
+			"voltage", "jacobian" and "gain", the iterations of the loops "voltage" and "iekf", the final step
+			norm of the iteration ("residual") and, if `profile.condition` is set, an estimate of the "condition"
+			number of the innovation covariance for each time step
+
+	Missing readings are given as NaN. Missing voltage readings are left out of the correction step; a missing
+	power reading is replaced by the last available reading of the same bus.
 
 	:return: Shat, Vhat, uShat, DeltaS, uDeltaS
 	"""
-	if issparse(Y):
-		Y = Y.toarray()
-	n = model.dim
-	n_K = len(V0)/2
-	pmeas = np.zeros(n_K,dtype = bool); pmeas[meas_idx["Pk"]] = True
-	qmeas = np.zeros(n_K,dtype = bool); qmeas[meas_idx["Qk"]] = True
-	vmeas = np.zeros(n_K,dtype = bool); vmeas[meas_idx["Vm"]] = True
-	Cm,Dnm,Dm = get_system_matrices(pmeas,qmeas,vmeas)
-	if not isinstance(Y,np.ndarray):
-		Y = makeYbus(topology["baseMVA"],topology["bus"],topology["branch"])
-	Y00, Ys = separate_Yslack(Y,slack_idx)
-
-	# transform voltages at slack node to real and imaginary parts
-	Vs_ri = np.vstack((Vs[0,:]*np.cos(np.radians(Vs[1,:])),
-					   Vs[0,:]*np.sin(np.radians(Vs[1,:]))))
-	Slack = np.linalg.solve(Y00,np.dot(Ys,Vs_ri))
-	Sm = np.r_[meas["Pk"], meas["Qk"]]
-	Sfc = np.r_[pseudo_meas["Pk"], pseudo_meas["Qk"]]
-	u = np.dot(Dm,Sm) + np.dot(Dnm,Sfc)
- 	#np.savetxt("/Users/makara01/Documents/oioi/Sm.out", u)
-
 	# adjust uncertainties in case that their dimension is wrong
 	if isinstance(meas_unc["Vm"],float):
 		meas_unc["Vm"] = meas_unc["Vm"]*np.ones_like(meas["Vm"])
@@ -360,69 +609,273 @@ def IteratedExtendedKalman(topology, meas, meas_unc, meas_idx, pseudo_meas, mode
 	elif len(meas_unc["Va"].shape)==1:
 		meas_unc["Va"] = np.tile(meas_unc["Va"],(meas["Va"].shape[1],1)).T
 
-	def calcM(mu):
-		divisor = 3*(mu[:n_K]**2 + mu[n_K:]**2)
-		return np.r_[np.c_[np.diag(mu[:n_K]/divisor), np.diag(mu[n_K:]/divisor)],
-				     np.c_[np.diag(mu[n_K:]/divisor), -np.diag(mu[:n_K]/divisor)]]
+	observer = StreamingIteratedExtendedKalman(topology, meas_idx, model, V0, slack_idx=slack_idx, Y=Y,
+											   accuracy=accuracy, maxiter=maxiter, sparse=sparse,
+											   filter_form=filter_form, jacobian_update=jacobian_update,
+											   refresh_ratio=refresh_ratio, refresh_drift=refresh_drift,
+											   fixed_point_method=fixed_point_method,
+											   iteration_log=iteration_log, voltage_solver=voltage_solver,
+											   convergence=convergence, profile=profile)
+	n = model.dim
+	n_K = len(V0)/2
 	nT = Vs.shape[1]
-	xhat = np.zeros((n,nT))
 	Vhat = np.zeros((2*n_K,nT))
 	Shat = np.zeros((2*n_K,nT))
-	DeltaS = np.zeros_like(xhat)
-	uDeltaS= np.zeros_like(xhat)
-	Pfilter = model.forecast_unc()
-	Dnm = model.adjust_Dnm(Dnm)
-
+	DeltaS = np.zeros((n,nT))
+	uDeltaS= np.zeros_like(DeltaS)
+	# transform voltages at slack node and voltage readings to real and imaginary parts for all time steps
+	Vs_ri = np.vstack((Vs[0,:]*np.cos(np.radians(Vs[1,:])), Vs[0,:]*np.sin(np.radians(Vs[1,:]))))
+	Slack = observer.Yfac.solve(observer.Ys.dot(Vs_ri))
+	yRe,yIm,URI = amph_phase_to_real_imag_batch(meas["Vm"],np.radians(meas["Va"]),meas_unc["Vm"]**2,meas_unc["Va"]**2)
+	Sm = np.r_[meas["Pk"], meas["Qk"]]
+	Sfc = np.r_[pseudo_meas["Pk"], pseudo_meas["Qk"]]
 	for k in range(nT):
-		# transform voltages to real and imaginary parts
-		yRe,yIm,R = amph_phase_to_real_imag(meas["Vm"][:,k],np.radians(meas["Va"][:,k]),meas_unc["Vm"][:,k]**2,meas_unc["Va"][:,k]**2)
-		
-		y = np.r_[yRe,yIm]
-		if k==0:
+		R = tuple(U[:,k] for U in URI)
+		Shat[:,k], Vhat[:,k], uS_k, DeltaS[:,k-1], uDeltaS[:,k-1] = \
+			observer._update(Sm[:,k], Sfc[:,k], Vs_ri[:,k], Slack[:,k], yRe[:,k], yIm[:,k], R)
+
+	uS  = observer.Dnm.dot(uDeltaS)
+	return Shat, Vhat, uS, DeltaS, uDeltaS
+
+
+class StreamingIteratedExtendedKalman(object):
+	"""
+	Iterated Extended Kalman filter for the nodal load observer as stateful object for online operation. Each call
+	of `update` processes the data of a single time step. Only the current state, covariance, voltages and
+	linearization are kept together with the factorization of the admittance matrix, such that memory does not
+	grow with the length of the time series. `IteratedExtendedKalman` is this filter applied to a whole time series.
+
+	:param topology: dict containing information on bus, branch, ... in PyPower format
+	:param meas_idx: dict containing the indices of measurements "Pk", "Qk", "Vm" and "Va"
+	:param model: DynamicModel object as defined in dynamic_models.py
+	:param V0: initial estimate of nodal voltages at all nodes except slack
+	:param slack_idx: index of slack node
+	:param Y: (optional) admittance matrix
+
+	For the remaining parameters see `IteratedExtendedKalman`.
+	"""
+	def __init__(self, topology, meas_idx, model, V0, slack_idx=0, Y=None, accuracy=1e-9, maxiter=50, sparse=None,
+				 filter_form="auto", jacobian_update="full", refresh_ratio=0.5, refresh_drift=1e-3,
+				 fixed_point_method="picard", iteration_log=None, voltage_solver="fixed_point", convergence=None,
+				 profile=None):
+		if jacobian_update not in ["full", "reuse", "broyden"]:
+			raise ValueError("Unknown Jacobian update '%s'. Use 'full', 'reuse' or 'broyden'." % jacobian_update)
+		if voltage_solver not in ["fixed_point", "newton", "damped_newton"]:
+			raise ValueError("Unknown voltage solver '%s'. Use 'fixed_point', 'newton' or 'damped_newton'." % voltage_solver)
+		self.model = model
+		self.n = model.dim
+		self.n_K = len(V0)/2
+		pmeas = np.zeros(self.n_K,dtype = bool); pmeas[meas_idx["Pk"]] = True
+		qmeas = np.zeros(self.n_K,dtype = bool); qmeas[meas_idx["Qk"]] = True
+		vmeas = np.zeros(self.n_K,dtype = bool); vmeas[meas_idx["Vm"]] = True
+		self.Cm,self.Dnm_pseudo,self.Dm = get_system_matrices(pmeas,qmeas,vmeas)
+		if not (isinstance(Y,np.ndarray) or issparse(Y)):
+			Y = makeYbus(topology["baseMVA"],topology["bus"],topology["branch"])
+		if sparse is None:
+			sparse = issparse(Y)
+		self.sparse = sparse
+		self.Y00, self.Ys = separate_Yslack(Y,slack_idx,sparse=sparse)
+		# Y00 is constant, hence it is factorized only once for all time steps and iterations
+		self.Yfac = factorize(self.Y00)
+		self.jac_pattern = JacobianPattern(self.Y00,self.Ys) if sparse else None
+		self.Dnm = model.adjust_Dnm(self.Dnm_pseudo)
+		self.Dnm_full = self.Dnm.toarray()	# dense right-hand side for the solution with the Jacobian
+		self.form = correction_form(filter_form, 2*len(meas_idx["Vm"]), self.n)
+		self.accuracy = accuracy
+		self.jacobian_update = jacobian_update
+		self.refresh_ratio = refresh_ratio
+		self.refresh_drift = refresh_drift
+		self.fixed_point_method = fixed_point_method
+		self.iteration_log = iteration_log
+		self.voltage_solver = voltage_solver
+		self.profile = profile
+		self.crits = criteria({"voltage": Criterion(atol=accuracy, maxiter=maxiter-1),
+							   "iekf": Criterion(atol=accuracy, maxiter=maxiter-1)}, convergence)
+		self.V0 = V0
+		self.reset()
+
+	def reset(self):
+		"""Restart the filter from the initial state of the model and the initial voltages V0"""
+		self.k = 0
+		self.xhat = None
+		self.Pfilter = self.model.forecast_unc()
+		self.mu = np.hstack((self.V0[:self.n_K]*np.cos(self.V0[self.n_K:]),
+							 self.V0[:self.n_K]*np.sin(self.V0[self.n_K:])))
+		self.H = None
+		self.V_jacobian = None 	# voltages at which H was calculated
+		self.Sm = None 	# last available power readings
+
+	def update(self, meas_k, pseudo_k, Vs_k, meas_unc_k):
+		"""
+		Process the data of the next time step
+
+		:param meas_k: dict containing measurements "Pk", "Qk", "Vm" and "Va" of the time step, each of shape (n_key,)
+		:param pseudo_k: dict containing pseudo-measurements "Pk" and "Qk" of the time step
+		:param Vs_k: voltage amplitude and phase at slack node
+		:param meas_unc_k: dict containing uncertainties of "Vm" and "Va" (floats or of shape (n_key,))
+
+		:return: Shat, Vhat, uShat, DeltaS, uDeltaS of the time step
+		"""
+		# transform voltage at slack node and voltage readings to real and imaginary parts
+		Vs_ri = np.array([Vs_k[0]*np.cos(np.radians(Vs_k[1])), Vs_k[0]*np.sin(np.radians(Vs_k[1]))])
+		Vm = np.asarray(meas_k["Vm"], dtype=float)
+		uVm = np.asarray(meas_unc_k["Vm"], dtype=float)*np.ones_like(Vm)
+		uVa = np.asarray(meas_unc_k["Va"], dtype=float)*np.ones_like(Vm)
+		yRe,yIm,R = amph_phase_to_real_imag_batch(Vm,np.radians(meas_k["Va"]),uVm**2,uVa**2)
+		return self._update(np.r_[meas_k["Pk"], meas_k["Qk"]], np.r_[pseudo_k["Pk"], pseudo_k["Qk"]], Vs_ri,
+							self.Yfac.solve(self.Ys.dot(Vs_ri)), yRe, yIm, R)
+
+	def _voltages(self, rhs, mu, Slack, Vs_ri):
+		"""
+		Calculation of the voltages from the nodal power rhs of the current time step, starting from mu
+		:param rhs: nodal power
+		:param mu: previous voltages
+		:param Slack: inv(Y00)*Ys*Vs_ri
+		:param Vs_ri: real and imaginary part of the voltage at slack node
+		:return: voltages
+		"""
+		k, profile, crit = self.k, self.profile, self.crits["voltage"]
+		if profile is not None: t0 = profile.tic()
+		if self.voltage_solver == "fixed_point":
+			Yfac, sparse = self.Yfac, self.sparse
+			g = lambda V: Yfac.solve(calcM(V,sparse).dot(rhs)) - Slack
+			mu, info = fixed_point(g, g(mu), method=self.fixed_point_method, criterion=crit)
+			info["iterations"] += 1
+		else:
+			mu, info = newton_voltages(self.Y00, self.Ys, rhs, mu, Vs_ri, pattern=self.jac_pattern,
+									   damped=self.voltage_solver=="damped_newton", criterion=crit)
+		if isinstance(self.iteration_log, list):
+			info["step"] = k
+			self.iteration_log.append(info)
+		if profile is not None:
+			profile.add_iterations("voltage", k, info["iterations"])
+			profile.toc("voltage", k, t0)
+		return mu
+
+	def _update(self, Sm, Sfc, Vs_ri, Slack, yRe, yIm, R):
+		"""
+		Process the next time step with the slack voltage and the voltage readings in rectangular form, as converted
+		for all time steps at once by `IteratedExtendedKalman`
+
+		:param Sm: bus power readings (NaN if missing)
+		:param Sfc: pseudo-measurements of bus power
+		:param Vs_ri: real and imaginary part of the voltage at slack node
+		:param Slack: inv(Y00)*Ys*Vs_ri
+		:param yRe: real parts of the voltage readings
+		:param yIm: imaginary parts of the voltage readings
+		:param R: covariance of the voltage readings as 2x2 blocks (see `amph_phase_to_real_imag_batch`)
+
+		:return: Shat, Vhat, uShat, DeltaS, uDeltaS of the time step
+		"""
+		Cm, Dnm, model = self.Cm, self.Dnm, self.model
+		form, accuracy, jacobian_update = self.form, self.accuracy, self.jacobian_update
+		Y00, Ys, jac_pattern, crits = self.Y00, self.Ys, self.jac_pattern, self.crits
+		profile, k = self.profile, self.k
+		Sm = np.array(Sm, dtype=float)
+		missing = np.isnan(Sm)
+		if np.any(missing):
+			if self.Sm is None:
+				raise ValueError("Power readings are missing in the first time step.")
+			Sm[missing] = self.Sm[missing]
+		self.Sm = Sm
+		u = self.Dm.dot(Sm) + self.Dnm_pseudo.dot(Sfc)
+		# only available voltage readings enter the correction step
+		available = np.isfinite(yRe) & np.isfinite(yIm)
+		rows = np.r_[available, available]
+		R = tuple(U[available] for U in R)
+		y = np.r_[yRe,yIm][rows]
+		if self.xhat is None:
 			xhatfc = model.forecast_state()
 			Pfilterfc = model.forecast_unc()
-			mu = np.hstack((V0[:n_K]*np.cos(V0[n_K:]),
-							V0[:n_K]*np.sin(V0[n_K:])))
 		else:
-			xhatfc = model.forecast_state(xhat[:,k-1])
-			Pfilterfc = model.forecast_unc(Pfilter)
-			mu = Vhat[:,k-1]
+			xhatfc = model.forecast_state(self.xhat)
+			Pfilterfc = model.forecast_unc(self.Pfilter)
+		mu = self.mu
+		H = self.H
+		Pfilter = self.Pfilter
+		if form == "information":
+			try:
+				Pinvfc = information_matrix(Pfilterfc, fallback=False)
+			except LinAlgError:
+				form = "covariance" 	# singular forecast covariance, e.g. of an AR(2) model
 		eta = xhatfc
-		varstop1 = 1
-		j1 = 1
-		while (varstop1 > accuracy) and (j1 < maxiter):
-			M_U = calcM(mu)
-			muiter = np.dot(np.dot(np.linalg.inv(Y00),M_U),u[:,k] + np.dot(Dnm,eta)) - Slack[:,k] 
-           
-			varstop2 = 1
-			j2 = 1
-			while (varstop2 > accuracy) and (j2 < maxiter):
-				M_U = calcM(muiter)
-				temp2 = muiter
-				muiter = np.dot(np.dot(np.linalg.inv(Y00),M_U),u[:,k] + np.dot(Dnm,eta)) - Slack[:,k]
-				varstop2 = np.linalg.norm(muiter-temp2)
-				j2 += 1
-			mu = muiter
-			Dh = jacobian(Y00,Ys,mu,Vs_ri[:,k])
-			H = np.dot(Cm, np.dot(np.linalg.inv(Dh), Dnm))
-			K = np.dot(np.dot(Pfilterfc,H.T), np.linalg.pinv(np.dot(H,np.dot(Pfilterfc,H.T))+R))
+		outer = crits["iekf"].start()
+		refresh = H is None or jacobian_update == "full"
+		exact = False 	# True if H is the Jacobian at the current iterate
+		polish = False 	# True in the iteration which confirms a stop with the exact Jacobian
+		new_gain = True 	# False while H and hence the gain are unchanged
+		secant = None 	# previous iterate (eta, measured voltages) for Broyden updates
+		steps = [] 	# norms of the steps of all iterations
+		while True:
+			mu = self._voltages(u + Dnm.dot(eta), mu, Slack, Vs_ri)
+			if profile is not None: t0 = profile.tic()
+			if not refresh and relative_change(mu, self.V_jacobian) > self.refresh_drift:
+				refresh = True 	# the voltages drifted away from the linearization
+			if refresh:
+				Dh = jacobian(Y00,Ys,mu,Vs_ri,jac_pattern)
+				dVdeta = _solve(Dh, self.Dnm_full)
+				H = Cm.dot(dVdeta)
+				self.V_jacobian = mu
+				refresh = jacobian_update == "full"
+				exact = new_gain = True
+				if profile is not None: profile.toc("jacobian", k, t0); t0 = profile.tic()
+			else:
+				exact = False
+				# secant update only if the change is large compared to the accuracy of the voltages
+				if jacobian_update == "broyden" and secant is not None \
+						and np.linalg.norm(Cm.dot(mu) - secant[1]) > np.sqrt(accuracy):
+					H = broyden_update(H, eta - secant[0], Cm.dot(mu) - secant[1])
+					new_gain = True
+			secant = (eta, Cm.dot(mu))
 			temp1 = eta
-			eta = xhatfc + np.dot(K, y - np.dot(Cm,mu) - np.dot(H, xhatfc-eta))
-			varstop1 = np.linalg.norm(temp1-eta)
-			j1 += 1
+			Hy, h = H[rows], Cm.dot(mu)[rows]
+			if form == "information":
+				if new_gain:
+					update = InformationUpdate(Pinvfc, Hy, R)
+				eta = xhatfc + update.correction(y - h - np.dot(Hy, xhatfc-eta))
+			elif form == "sequential":
+				eta, Pfilter = sequential_update(xhatfc, Pfilterfc, Hy, R, y - h + np.dot(Hy, eta))
+			else:
+				if new_gain:
+					K = kalman_gain(Pfilterfc, Hy, R)
+				eta = xhatfc + np.dot(K, y - h - np.dot(Hy, xhatfc-eta))
+			new_gain = False
+			if profile is not None: profile.toc("gain", k, t0)
+			steps.append(np.linalg.norm(temp1-eta))
+			if jacobian_update == "full":
+				stop = outer.check(steps[-1], np.linalg.norm(eta))
+			else:
+				stop = outer.check(predicted_step(steps, confirm=polish), np.linalg.norm(eta))
+			if stop and (polish or jacobian_update == "full" or (exact and outer.converged)):
+				break
+			# the fixed point depends on the linearization, hence a stop with a previous Jacobian is confirmed by
+			# one iteration with the exact Jacobian; if it fails, the iteration continues with this Jacobian
+			polish = stop
+			if stop or (not exact and len(steps) > 1 and steps[-1] > self.refresh_ratio*steps[-2]):
+				refresh = True 	# confirmation of the stop or poor convergence
+		if polish:
+			# voltages of the estimate after the confirming iteration by linearization at the exact Jacobian
+			mu = mu + dVdeta.dot(eta - temp1)
 		# Data assimilation step
-		Pfilter = np.dot( np.eye(n) - np.dot(K,H), Pfilterfc)
-		xhat[:,k] = eta
-		Shat[:,k] = u[:,k] + np.dot(Dnm,xhat[:,k])
-		Vhat[:,k] = mu
-		DeltaS[:,k-1] = xhat[:,k]
-		uDeltaS[:,k-1] = np.sqrt(np.diag(Pfilter))
-	
-	uS  = np.dot(Dnm,uDeltaS)
-	return Shat, Vhat, uS, DeltaS, uDeltaS
+		if form == "information":
+			Pfilter = update.covariance()
+		elif form == "covariance":
+			Pfilter = np.dot( np.eye(self.n) - np.dot(K,Hy), Pfilterfc)
+		self.xhat, self.Pfilter, self.mu, self.H = eta, Pfilter, mu, H
+		if profile is not None:
+			profile.add_iterations("iekf", k, outer.iterations)
+			profile.set_value("residual", k, outer.history[-1])
+			if profile.condition:
+				profile.set_value("condition", k, condition_estimate(add_noise(np.dot(Hy, np.dot(Pfilterfc, Hy.T)), R)))
+			profile.end_step(k)
+		self.k += 1
+		uDeltaS = np.sqrt(np.diag(Pfilter))
+		return u + Dnm.dot(eta), mu, Dnm.dot(uDeltaS), eta, uDeltaS
 
 def NLOextended(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
-				slack_idx=0, Y=None, accuracy=1e-9, maxiter=5):
+				slack_idx=0, Y=None, accuracy=1e-9, maxiter=5, symbolic=False, filter_form="auto",
+				jacobian_update="full", refresh_ratio=0.5, refresh_drift=1e-3, convergence=None, covariances=None,
+				profile=None):
 	"""
 	Iterated Extended Kalman filter for the nodal load observer (extended to all kind of measurements)
 	Real-valued matrices of complex-valued quantities are assumed to be structured as [ [real part], [imag part] ]
@@ -442,6 +895,33 @@ def NLOextended(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
 	:param Y: (optional) admittance matrix
 	:param accuracy: threshold for inner iteration of the iterated EKF
 	:param maxiter: maximum number of inner iterations of the iterated EKF
+	:param symbolic: if True, network equations and Jacobians are derived symbolically using sympy
+	:param filter_form: (optional) "covariance", "information", "sequential" or "auto" (default); the information form
+			solves all linear systems in the state dimension and is chosen by "auto" if there are more measurements
+			than states; "sequential" processes the measurements one (2x2 block) at a time
+	:param jacobian_update: (optional) "full" (default) recalculates the Jacobian in each iteration; "reuse" keeps
+			the linearization and the Kalman gain of previous iterations and time steps; "broyden" additionally
+			applies Broyden rank-1 updates from consecutive iterates. With "reuse" or "broyden" the Jacobian is
+			recalculated when the voltages drift away from the linearization or the iteration contracts worse than
+			`refresh_ratio`. A stop is confirmed by one iteration with the exact Jacobian, whose step is scaled by
+			the contraction of the previous iterations, such that the estimate is that of "full" within `accuracy`
+	:param refresh_ratio: (optional) threshold for the ratio of consecutive iteration steps
+	:param refresh_drift: (optional) threshold for the relative change of the voltages since the last
+			calculation of the Jacobian
+	:param convergence: (optional) dict with Criterion objects (see convergence.py) for the loops "voltage"
+			(Newton's method for the voltages) and "iekf" (iterations of the Kalman filter) replacing the defaults;
+			default for "voltage" is a tolerance of 1e-12 relative to the norm of the voltages, detection of
+			stagnation at the round-off level and at most 20 iterations
+	:param covariances: (optional) container to which the posterior error covariance matrix of each time step is
+			appended, e.g. a list or a container from covariance_store.py (last k matrices or chunks on disk);
+			by default only the diagonal is retained (as uDeltaS)
+	:param profile: (optional) StepProfile object (see instrumentation.py) recording the time of the stages
+			"voltage", "jacobian" and "gain", the iterations of the loops "voltage" and "iekf", the final step
+			norm of the iteration ("residual") and, if `profile.condition` is set, an estimate of the "condition"
+			number of the innovation covariance for each time step
+
+	Missing readings are given as NaN and are left out of the correction step. A missing bus power reading is
+	replaced by the last available reading of the same bus for the calculation of the voltages.
 
 	:return: Shat, Vhat, uShat, DeltaS, uDeltaS
 	"""
@@ -462,19 +942,23 @@ def NLOextended(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
 	vmeas = np.zeros(n_K,dtype = bool); vmeas[meas_idx["Vm"]] = True
 	Cm,Dnm,Dm = get_system_matrices(pmeas,qmeas,vmeas)
 	Dnm = model.adjust_Dnm(Dnm) # adjust for the case of AR(2) process
-	Dnm_nB = Dnm[non_ref, :]
+	Dnm_nB = Dnm.toarray()[non_ref, :]
 
 	# generate admittance matrix from network data if not provided by the user
-	if not isinstance(Y,np.ndarray):
+	if not (isinstance(Y,np.ndarray) or issparse(Y)):
 		Y = makeYbus(topology["baseMVA"],topology["bus"],topology["branch"])
-	y, cap = calc_admittance(topology["branch"])[1:]
+	branches = BranchList.from_branch_data(topology["branch"],n_K)
 	# calculate network functions and their Jacobians
-	J_dSdV, J_dHdV, f_hSK, f_hSl = network_equations(Y, y, cap, n_K, meas_idx)
+	if symbolic:
+		y, cap = branches.matrices()
+		J_dSdV, J_dHdV, f_hSK, f_hSl = network_equations(Y, y, cap, n_K, meas_idx, symbolic=True)
+	else:
+		J_dSdV, J_dHdV, f_hSK, f_hSl = network_equations(Y, branches, None, n_K, meas_idx)
 
 	# calculate vector of nodal powers from actual and pseudo measurements
-	Sm = np.r_[meas["Pk"], meas["Qk"]]
+	Sm = hold_missing(np.r_[meas["Pk"], meas["Qk"]])
 	Sfc = np.r_[pseudo_meas["Pk"], pseudo_meas["Qk"]]
-	u = np.dot(Dm,Sm) + np.dot(Dnm,Sfc)
+	u = Dm.dot(Sm) + Dnm.dot(Sfc)
 	nT = u.shape[1]
 
 	xhat = np.zeros((n,nT))
@@ -482,44 +966,63 @@ def NLOextended(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
 	Shat = np.zeros((2 * n_K, nT))
 	DeltaS = np.zeros_like(xhat)
 	uDeltaS= np.zeros_like(xhat)
-	P = []
+
+	# measurement values and variances of all time steps in one contiguous array each
+	layout = MeasurementLayout(meas, meas_unc, meas_names)
+	nm = layout.size
+	form = correction_form(filter_form, nm, n)
+	if jacobian_update not in ["full", "reuse", "broyden"]:
+		raise ValueError("Unknown Jacobian update '%s'. Use 'full', 'reuse' or 'broyden'." % jacobian_update)
+	crits = criteria({"voltage": Criterion(rtol=1e-12, maxiter=20, stagnation_window=2),
+					  "iekf": Criterion(atol=accuracy, maxiter=maxiter-1)}, convergence)
+	H = None
+	V_jacobian = None 	# voltages at which H was calculated
+	Va_idx = n_K + np.asarray(meas_idx["Va"], dtype=int)
 
 	# helper function
-	def calcV(V, eta, meas_k, umeas_k, k, PF_accuracy = 1e-16):
+	def calcV(V, eta, k):
 		"""Calculate nodal voltages by minimizing the difference between measured and calculated bus power using Newton's method
 		:rtype: tuple
-		:param meas_k: measured values
-		:param umeas_k: uncertainties associated with measured values
-		:return: V, h_V, Jacobian_V
+		:param V: initial nodal voltages
+		:param eta: state estimate
+		:param k: time index
+		:return: V
 		"""
 		def voltage2buspower(v):
-			EqPF = f_hSK(*v)[non_ref]
-			JacSE = J_dSdV(*v)[non_ref]
+			EqPF = f_hSK(v)[non_ref]
+			JacSE = J_dSdV(v)[non_ref]
 			return EqPF, JacSE
 
-		pf_stop = 1; pf_iter = 0
-		Jac_SfromV = None
-		SfromV = None
-		S = np.dot(Dm,np.r_[meas_k['Pk'],meas_k['Qk']]) + np.dot(Dnm,Sfc[:,k]) + Dnm.dot(eta)
-		while pf_stop > PF_accuracy and pf_iter < 20:
+		crit = crits["voltage"].start()
+		S = u[:,k] + Dnm.dot(eta)
+		while True:
 			SfromV, Jac_SfromV = voltage2buspower(V)
-			delta_V = np.linalg.solve(Jac_SfromV, S[non_ref] - SfromV)
+			mismatch = S[non_ref] - SfromV
+			delta_V = _solve(Jac_SfromV, mismatch)
 			V[non_ref] = V[non_ref] + delta_V
-			pf_stop = np.linalg.norm(delta_V)
-			pf_iter += 1
+			# the mismatch refers to the voltages before the update
+			if crit.check(np.linalg.norm(delta_V), np.linalg.norm(V), np.linalg.norm(mismatch)):
+				break
+		if profile is not None:
+			profile.add_iterations("voltage", k, crit.iterations)
 		return V
 
+	def seed_voltages(mu, k):
+		"""Replace the voltages in mu by the available voltage readings at time index k"""
+		for key, idx in [("Vm", np.asarray(meas_idx["Vm"], dtype=int)), ("Va", Va_idx)]:
+			if len(idx)>0:
+				values = layout.get(key,k)
+				available = np.isfinite(values)
+				mu[idx[available]] = values[available]
+
 	# Iterated Extended Kalman Filter
+	P = model.forecast_unc() 	# only the covariance of the previous time step is kept
 	for k in range(nT):
-		meas_k, umeas_k = meas_at_time(meas,meas_unc,k,meas_names)
 		if k == 0:
 			xhatfc = model.forecast_state()
 			Pfc = model.forecast_unc()
-			mu  = V0
-			if len(meas_idx['Vm'])>0:
-				mu[meas_idx["Vm"]] = meas_k["Vm"][:]
-			if len(meas_idx['Va'])>0:
-				mu[n_K+np.asarray(meas_idx["Va"])] = meas_k["Va"][:]
+			mu  = np.array(V0, dtype=float) 	# copy; V0 may be shared between calls
+			seed_voltages(mu, k)
 			# xhat[:,k] = xhatfc[:]
 			# P.append(Pfc)
 			# Shat[:, k] = u[:, k] + np.dot(Dnm, xhat[:, k])
@@ -527,42 +1030,172 @@ def NLOextended(topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0,
 			# continue 	# at time 0 use forecast as estimate
 		else:
 			xhatfc = model.forecast_state(xhat[:, k - 1])
-			Pfc = model.forecast_unc(P[k - 1])
+			Pfc = model.forecast_unc(P)
 			mu = Vhat[:, k - 1].copy()
-			if len(meas_idx['Vm'])>0:
-				mu[meas_idx["Vm"]] = meas_k["Vm"]
-			if len(meas_idx['Va'])>0:
-				mu[n_K+np.asarray(meas_idx["Va"])] = meas_k["Va"]
-
-		Meas, R, meas_inds = construct_meas_vector(meas_k,umeas_k,meas_names)
-		iekf_stop = 1; j1 = 1
+			seed_voltages(mu, k)
+
+		# only available readings enter the correction step
+		available = np.isfinite(layout.values[:,k])
+		if available.all():
+			available = slice(None) 	# views without copying
+		Meas = layout.values[available,k]
+		r = layout.variances[available,k] 	# R = diag(r)
+		step_form = form
+		if form == "information":
+			try:
+				Pinvfc = information_matrix(Pfc, fallback=False)
+			except LinAlgError:
+				step_form = "covariance" 	# singular forecast covariance, e.g. of an AR(2) model
 		eta = xhatfc
-		while (iekf_stop > accuracy) and (j1 < maxiter):
-			V = calcV(mu, eta, meas_k, umeas_k, k)
-			Eq1 = np.dot(Dm.T, f_hSK(*V))   # bus power from nodal voltage at measured buses
-			Eq2 = f_hSl(*V)  # from/to power and voltage magnitude at measured buses
+		outer = crits["iekf"].start()
+		refresh = H is None or jacobian_update == "full"
+		exact = False 	# True if H is the Jacobian at the current iterate
+		polish = False 	# True in the iteration which confirms a stop with the exact Jacobian
+		new_gain = True 	# False while H and hence the gain are unchanged
+		secant = None 	# previous iterate (eta, h) for Broyden updates
+		steps = [] 	# norms of the steps of all iterations
+		while True:
+			if profile is not None: t0 = profile.tic()
+			V = calcV(mu, eta, k)
+			Eq1 = Dm.T.dot(f_hSK(V))   # bus power from nodal voltage at measured buses
+			Eq2 = f_hSl(V)  # from/to power and voltage magnitude at measured buses
 			h = np.r_[Eq1, Eq2]
-
-			JdSdV = J_dSdV(*V)
-			JdVdDS = np.linalg.solve(JdSdV[non_ref,:], Dnm[non_ref,:])  # Jacobian of inverse of 'bus power from nodal voltage'
-			JdhdV = np.r_[np.dot(Dm.T, JdSdV), J_dHdV(*V)]
-			H = np.dot(JdhdV, JdVdDS)
-			K = np.dot(Pfc, np.linalg.solve((np.dot(H, np.dot(Pfc, H.T)) + R).T, H).T)
+			if profile is not None: profile.toc("voltage", k, t0); t0 = profile.tic()
+
+			if not refresh and relative_change(V, V_jacobian) > refresh_drift:
+				refresh = True 	# the voltages drifted away from the linearization
+			if refresh:
+				JdSdV = J_dSdV(V)
+				JdVdDS = _solve(JdSdV[non_ref,:], Dnm_nB)  # Jacobian of inverse of 'bus power from nodal voltage'
+				JdhdV = np.r_[_dense(Dm.T.dot(JdSdV)), _dense(J_dHdV(V))]
+				H = np.dot(JdhdV, JdVdDS)
+				V_jacobian = V.copy()
+				refresh = jacobian_update == "full"
+				exact = new_gain = True
+				if profile is not None: profile.toc("jacobian", k, t0); t0 = profile.tic()
+			else:
+				exact = False
+				# secant update only if the change is large compared to the accuracy of the voltages
+				if jacobian_update == "broyden" and secant is not None \
+						and np.linalg.norm(h - secant[1]) > np.sqrt(accuracy):
+					H = broyden_update(H, eta - secant[0], h - secant[1])
+					new_gain = True
+			secant = (eta, h)
 			temp = eta.copy()
-			eta = xhatfc + np.dot(K, Meas - h - np.dot(H, xhatfc - eta))
-			iekf_stop = np.linalg.norm(temp-eta)
-			j1 += 1
-		P.append(np.dot(np.eye(n) - np.dot(K, H), Pfc))
+			Hm, hm = H[available], h[available]
+			if step_form == "information":
+				if new_gain:
+					update = InformationUpdate(Pinvfc, Hm, r)
+				eta = xhatfc + update.correction(Meas - hm - np.dot(Hm, xhatfc - eta))
+			elif step_form == "sequential":
+				eta, Pk = sequential_update(xhatfc, Pfc, Hm, r, Meas - hm + np.dot(Hm, eta))
+			else:
+				if new_gain:
+					K = kalman_gain(Pfc, Hm, r)
+				eta = xhatfc + np.dot(K, Meas - hm - np.dot(Hm, xhatfc - eta))
+			new_gain = False
+			if profile is not None: profile.toc("gain", k, t0)
+			steps.append(np.linalg.norm(temp-eta))
+			if jacobian_update == "full":
+				stop = outer.check(steps[-1], np.linalg.norm(eta))
+			else:
+				stop = outer.check(predicted_step(steps, confirm=polish), np.linalg.norm(eta))
+			if stop and (polish or jacobian_update == "full" or (exact and outer.converged)):
+				break
+			# the fixed point depends on the linearization, hence a stop with a previous Jacobian is confirmed by
+			# one iteration with the exact Jacobian; if it fails, the iteration continues with this Jacobian
+			polish = stop
+			if stop or (not exact and len(steps) > 1 and steps[-1] > refresh_ratio*steps[-2]):
+				refresh = True 	# confirmation of the stop or poor convergence
+		if polish:
+			# voltages of the estimate after the confirming iteration by linearization at the exact Jacobian
+			V[non_ref] += JdVdDS.dot(eta - temp)
+		if step_form == "information":
+			P = update.covariance()
+		elif step_form == "sequential":
+			P = Pk
+		else:
+			P = np.dot(np.eye(n) - np.dot(K, Hm), Pfc)
+		if covariances is not None:
+			covariances.append(P)
+		if profile is not None:
+			profile.add_iterations("iekf", k, outer.iterations)
+			profile.set_value("residual", k, outer.history[-1])
+			if profile.condition:
+				profile.set_value("condition", k, condition_estimate(add_noise(np.dot(Hm, np.dot(Pfc, Hm.T)), r)))
+			profile.end_step(k)
 		xhat[:, k] = eta
-		Shat[:, k] = u[:, k] + np.dot(Dnm, xhat[:, k])
+		Shat[:, k] = u[:, k] + Dnm.dot(xhat[:, k])
 		Vhat[:, k] = V[:]
 		DeltaS[:,k-1] = xhat[:,k]
-		uDeltaS[:,k-1] = np.sqrt(np.diag(P[k]))
-	uS = np.dot(Dnm, uDeltaS)
+		uDeltaS[:,k-1] = np.sqrt(np.diag(P))
+	if hasattr(covariances, "flush"):
+		covariances.flush()
+	uS = Dnm.dot(uDeltaS)
 
 	return Shat, Vhat, uS, DeltaS, uDeltaS
 
 
+def hold_missing(S):
+	"""Replace missing values (NaN) in the time series S of shape (n,nT) by the last available value of the same row
+	:param S: ndarray of shape (n,nT)
+	:return: copy of S without missing values
+	"""
+	S = np.array(S, dtype=float)
+	if S.size == 0:
+		return S
+	if np.any(np.isnan(S[:,0])):
+		raise ValueError("Power readings are missing in the first time step.")
+	for k in range(1, S.shape[1]):
+		missing = np.isnan(S[:,k])
+		S[missing,k] = S[missing,k-1]
+	return S
+
+
+def correction_form(filter_form, nm, n):
+	"""Form of the Kalman correction step
+	:param filter_form: "covariance", "information", "sequential" or "auto"
+	:param nm: number of measurements
+	:param n: dimension of the state
+	:return: "covariance", "information" or "sequential"
+	"""
+	if filter_form == "auto":
+		return "information" if nm > n else "covariance"
+	if filter_form not in ["covariance", "information", "sequential"]:
+		raise ValueError("Unknown filter form '%s'. Use 'covariance', 'information', 'sequential' or 'auto'." % filter_form)
+	return filter_form
+
+
+class MeasurementLayout(object):
+	"""
+	All measurements and associated uncertainties of a time series, assembled once in the order used by
+	`construct_meas_vector`. Values and variances are stored as contiguous (nm,nT) arrays in column-major order,
+	such that the measurement vector and the diagonal of R for time index k are views without copying.
+
+	:param meas: dict of measurements, each of shape (n_key,nT) or empty
+	:param meas_unc: dict of associated standard uncertainties (arrays of the same shape or floats)
+	:param meas_names: list of measurement types in the order of the measurement vector
+	"""
+	def __init__(self, meas, meas_unc, meas_names=["Pk","Qk","Vm","Va"]):
+		self.names = [key for key in meas_names if len(meas[key])>0]
+		self.slices = {}
+		count = 0
+		for key in self.names:
+			self.slices[key] = slice(count, count + meas[key].shape[0])
+			count += meas[key].shape[0]
+		self.size = count
+		self.nT = meas[self.names[0]].shape[1] if self.names else 0
+		self.values = np.empty((self.size, self.nT), order="F")
+		self.variances = np.empty((self.size, self.nT), order="F")
+		for key in self.names:
+			self.values[self.slices[key]] = meas[key]
+			self.variances[self.slices[key]] = np.asarray(meas_unc[key])**2
+
+	def get(self, key, k):
+		"""Values of measurement type `key` at time index k"""
+		return self.values[self.slices[key], k]
+
+
 def meas_at_time(meas,meas_unc,ind,meas_names=None):
 	"""Returns dictionary with the entries of meas at time index ind.
 	:param meas: dict of measurements
@@ -614,12 +1247,53 @@ def construct_meas_vector(meas,meas_unc,meas_names=["Pk","Qk","Vm","Va"]):
 	return Meas, R, inds
 
 
-def network_equations(Y, y, cap, nK, meas_idx):
+def network_equations(Y, y, cap, nK, meas_idx, symbolic=False, use_cache=True, cache_dir=None):
+	"""Set up network equations to calculate estimates of bus power, power at line and voltages together with
+	their Jacobian matrices with respect to nodal voltages (w/o slack node). All returned functions take the
+	(2*nK,) shaped vector of real and imaginary parts of nodal voltages as argument.
+	By default the equations and Jacobians are evaluated numerically from the admittance data. For a sparse
+	admittance matrix Y, the Jacobians are returned in scipy.sparse format.
+
+	:param Y: nodal admittance matrix
+	:param y: line admittances as (nK,nK) shaped matrix or BranchList object
+	:param cap: line capacitances as (nK,nK) shaped matrix (not used if y is a BranchList)
+	:param nK: number of buses
+	:param meas_idx: dict containing the measurement indices
+	:param symbolic: if True, use symbolic equations and calculate the Jacobian matrices with sympy
+	:param use_cache: if True, compiled symbolic equations are loaded from/stored in the on-disk cache
+	:param cache_dir: (optional) directory of the cache; default is `equation_cache.cache_dir`
+	:return: J_dSdV, J_dHdV, f_hSK, f_hSl
+	"""
+	if symbolic:
+		return network_equations_symbolic(Y, y, cap, nK, meas_idx, use_cache, cache_dir)
+
+	if isinstance(y, BranchList):
+		branches = y
+	else:
+		branches = BranchList.from_matrices(y, cap)
+	bus_eqs = BusPowerEquations(Y)
+	meas_eqs = MeasurementEquations(nK, branches, meas_idx, sparse=issparse(Y))
+	return bus_eqs.jacobian, meas_eqs.jacobian, bus_eqs.power, meas_eqs.evaluate
+
+
+def network_equations_symbolic(Y, y, cap, nK, meas_idx, use_cache=True, cache_dir=None):
 	"""Set up network equations to calculate estimates of bus power, power at line and voltages. This method uses
 	 symbolic equations and calculates the Jacobian matrix with respect to nodal voltages.
+	 The compiled equations are stored in an on-disk cache (see equation_cache.py) and loaded from there
+	 whenever the same network and measurement indices are used again.
 	:param meas_idx: dict containg uncertainty associated with measurement data
+	:param use_cache: if True, use the on-disk cache of compiled equations
+	:param cache_dir: (optional) directory of the cache; default is `equation_cache.cache_dir`
 	:return: J_dSdV, J_dHdV, f_hSK, f_hSl
 	"""
+	if isinstance(y, BranchList):
+		y, cap = y.matrices()
+	if use_cache:
+		key = equation_cache.equations_key(Y, y, cap, nK, meas_idx)
+		funcs = equation_cache.load(key, cache_dir)
+		if funcs is not None:
+			return funcs
+
 	import sympy
 
 	def makearray(Mat):
@@ -632,54 +1306,34 @@ def network_equations(Y, y, cap, nK, meas_idx):
 
 	JMatrix_dSdV, hSK = jacobian_dSdV(Y, nK)
 	JMatrix_dHdV, hSluV = jacobian_dHdV(nK, y, cap, meas_idx)
-
-	J_dSdV = sympy.lambdify(tuple(["e%d" % (i + 1) for i in range(nK)] + ["f%d" % (i + 1) for i in range(nK)]),
-							JMatrix_dSdV, modules = mat2array)
-	f_hSK = sympy.lambdify(tuple(["e%d" % (i + 1) for i in range(nK)] + ["f%d" % (i + 1) for i in range(nK)]), hSK,
-						   modules = mat2array)
+	if use_cache:
+		exprs = {"J_dSdV": JMatrix_dSdV, "J_dHdV": JMatrix_dHdV, "f_hSK": hSK, "f_hSl": hSluV}
+		sources = dict((name, equation_cache.generate_source(name, exprs[name], nK)) for name in exprs)
+		return equation_cache.store(key, sources, cache_dir)
+
+	args = tuple(["e%d" % (i + 1) for i in range(nK)] + ["f%d" % (i + 1) for i in range(nK)])
+	J_dSdV = sympy.lambdify(args, JMatrix_dSdV, modules = mat2array)
+	f_hSK = sympy.lambdify(args, hSK, modules = mat2array)
 	if hSluV is None:
-		J_dHdV = lambda *V: np.array([[]])
+		J_dHdV = lambda *V: np.zeros((0, 2*nK-2))
 		f_hSl = lambda *V: np.array([])
 	else:
-		J_dHdV = sympy.lambdify(tuple(["e%d" % (i + 1) for i in range(nK)] + ["f%d" % (i + 1) for i in range(nK)]),
-								JMatrix_dHdV, modules = mat2array)
-		f_hSl = sympy.lambdify(tuple(["e%d" % (i + 1) for i in range(nK)] + ["f%d" % (i + 1) for i in range(nK)]), hSluV,
-							  modules = mat2array)
-	return J_dSdV, J_dHdV, f_hSK, f_hSl
+		J_dHdV = sympy.lambdify(args, JMatrix_dHdV, modules = mat2array)
+		f_hSl = sympy.lambdify(args, hSluV, modules = mat2array)
+	return [lambda V, f=f: f(*V) for f in (J_dSdV, J_dHdV, f_hSK, f_hSl)]
 
 
 def calc_admittance(network_branches):
 	""" From network branch information in PyPower format calculate the bus and network admittances.
+	For large networks use BranchList.from_branch_data instead, which avoids the dense (nK,nK) matrices.
 
 	:param network_branches: numpy array contain all information about the network branches
 	:returns: bus admittance matrix Y, line admittances y and line capacitances cap
 
 	"""
-	nK = int(network_branches[:,:2].max())
-	dim  = network_branches.shape[0]
-	r = np.zeros((nK,nK))
-	x = np.zeros_like(r)
-	cap=np.zeros_like(r)        # Capacity between branch and earth
-
-	for i in range(dim):
-		k_start = network_branches[i,0]-1
-		k_end = network_branches[i,1]-1
-		r[k_start,k_end] = network_branches[i,2]
-		x[k_start,k_end] = network_branches[i,3]
-		cap[k_start,k_end]=network_branches[i,4]
-
-	r += r.T
-	x += x.T
-	cap += cap.T
-	z = r + 1j*x
-	y = np.zeros_like(z)
-	for i in range(nK):
-		for j in range(nK):
-			if z[i,j] != 0:
-				y[i,j] = 1/z[i, j]
-	Y = -y
-	for i in range(nK):
-		Y[i,i] = np.sum(y[i,:])+1j*np.sum(cap[i,:]/2)
+	branches = BranchList.from_branch_data(network_branches)
+	y, cap = branches.matrices()
+	Y = branches.admittance_matrix().toarray()
 	return Y, y, cap
 
 
@@ -725,26 +1379,58 @@ def amph_phase_to_real_imag(A,P,Ua,Up):
 	:param UAP: ndarray of uncertainties associated with A and P; shape (2xN,)
 	:return: Re, Im, URI
 	"""
-	from scipy import sparse
 	assert(len(A.shape)==1)
+	Re, Im, URI = amph_phase_to_real_imag_batch(A,P,Ua,Up)
+	return Re, Im, block_covariance_to_dense(URI)
+
+
+def amph_phase_to_real_imag_batch(A,P,Ua,Up):
+	"""
+	Vectorized version of `amph_phase_to_real_imag` for all time steps at once.
+
+	The covariance matrix of [Re; Im] for each time step consists of 2x2 blocks [[U11, U12], [U12, U22]] for each
+	measurement location. It is returned in compact form as the tuple (U11, U12, U22) of arrays with the same shape
+	as A. Use `add_block_covariance` to add it to a dense matrix or `block_covariance_to_dense` to obtain the full matrix.
+
+	:param A: ndarray of amplitude values; shape (N,) or (N,nT)
+	:param P: ndarray of phase values in radians; same shape as A
+	:param Ua: ndarray of squared uncertainties associated with A; same shape as A
+	:param Up: ndarray of squared uncertainties associated with P; same shape as A
+	:return: Re, Im, (U11, U12, U22)
+	"""
 	assert(A.shape==P.shape)
 	assert(Ua.shape==A.shape)
 	assert(Up.shape==P.shape)
+	cosP = np.cos(P)
+	sinP = np.sin(P)
 	# calculation of F
-	Re = A*np.cos(P)
-	Im = A*np.sin(P)
-	# calculation of sensitivities
-	CRA = np.cos(P)
-	CRP = -A*np.sin(P)
-	CIA = np.sin(P)
-	CIP = A*np.cos(P)
-
-	# assignment of uncertainty blocks in UAP
-	N = len(A)
-
-	U11 = CRA*Ua*CRA + CRP*Up*CRP
-	U12 = CRA*Ua*CIA + CRP*Up*CIP
-	U22 = CIA*Ua*CIA + CIP*Up*CIP
-	URI = sparse.diags([np.r_[U11,U22],U12,U12],[0,N,-N]).toarray()
-	return Re, Im, URI
+	Re = A*cosP
+	Im = A*sinP
+	# calculation of sensitivities: CRA = cosP, CRP = -Im, CIA = sinP, CIP = Re
+	U11 = cosP*Ua*cosP + Im*Up*Im
+	U12 = cosP*Ua*sinP - Im*Up*Re
+	U22 = sinP*Ua*sinP + Re*Up*Re
+	return Re, Im, (U11, U12, U22)
+
+
+def add_block_covariance(M, URI, k=None):
+	"""
+	Add the compact 2x2-block covariance matrix as returned by `amph_phase_to_real_imag_batch` to the
+	dense (2N,2N) matrix M in place.
+
+	:param M: dense ndarray of shape (2N,2N)
+	:param URI: tuple (U11, U12, U22) of arrays of shape (N,) or (N,nT)
+	:param k: (optional) time index if the entries of URI are of shape (N,nT)
+	:return: M
+	"""
+	if k is not None:
+		URI = tuple(U[:,k] for U in URI)
+	return add_noise(M, URI)
+
+
+def block_covariance_to_dense(URI, k=None):
+	"""Dense (2N,2N) covariance matrix from the compact 2x2-block form
+	"""
+	N = URI[0].shape[0]
+	return add_block_covariance(np.zeros((2*N,2*N)), URI, k)
 
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains a runner for many independent estimator runs on a pool of worker processes, e.g., one run
+of `IteratedExtendedKalman` per dynamic model as in example_2_UKGDS60_PVdata_ARmodel_leastsq_parameters.py.
+
+Each run is specified by a dict with the keyword arguments of the estimator (see `run_parallel`). Data which are
+the same for all runs, such as topology, admittance matrix and measurements, are passed once as `shared`. They are copied into
+shared memory before the worker processes are started, and the workers access them without copying. Hence, they
+are not pickled for every run.
+
+Each worker runs a single-threaded estimator by default, such that the number of processes times the number of
+BLAS threads does not exceed the number of cores.
+
+"""
+
+import os
+import ctypes
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+from scipy.sparse import issparse, csr_matrix, csc_matrix
+
+blas_env_variables = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS",
+					  "NUMEXPR_NUM_THREADS"]
+
+
+def set_blas_threads(n):
+	"""
+	Limit the number of threads of BLAS/LAPACK in the current process.
+	The environment variables are respected by libraries which are loaded afterwards (and by child processes). For
+	libraries which are loaded already, threadpoolctl or mkl-service are used if available.
+	:param n: number of threads
+	"""
+	for var in blas_env_variables:
+		os.environ[var] = str(n)
+	try:
+		from threadpoolctl import threadpool_limits
+		threadpool_limits(limits=n)
+		return
+	except ImportError:
+		pass
+	try:
+		import mkl
+		mkl.set_num_threads(n)
+	except ImportError:
+		pass
+
+
+def _share_array(a):
+	a = np.ascontiguousarray(a)
+	raw = RawArray(ctypes.c_char, max(a.nbytes, 1))
+	np.frombuffer(raw, dtype=a.dtype, count=a.size)[:] = a.ravel()
+	return ("array", raw, a.dtype.str, a.shape)
+
+
+def to_shared(obj):
+	"""
+	Copy ndarrays, scipy.sparse matrices and dicts (e.g. topology) thereof into shared memory
+	:param obj: ndarray, scipy.sparse matrix, dict or any other (picklable) object
+	:return: descriptor of the shared object, see `from_shared`
+	"""
+	if isinstance(obj, np.ndarray) and obj.dtype != object:
+		return _share_array(obj)
+	if issparse(obj):
+		fmt = "csc" if obj.format == "csc" else "csr"
+		obj = csc_matrix(obj) if fmt == "csc" else csr_matrix(obj)
+		return ("sparse", fmt, obj.shape, _share_array(obj.data), _share_array(obj.indices),
+				_share_array(obj.indptr))
+	if isinstance(obj, dict):
+		return ("dict", dict((key, to_shared(value)) for key, value in obj.items()))
+	return ("value", obj)
+
+
+def from_shared(desc):
+	"""
+	Read-only views of shared objects without copying
+	:param desc: descriptor as returned by `to_shared`
+	:return: ndarray, scipy.sparse matrix, dict or other object
+	"""
+	kind = desc[0]
+	if kind == "array":
+		raw, dtype, shape = desc[1:]
+		a = np.frombuffer(raw, dtype=np.dtype(dtype), count=int(np.prod(shape))).reshape(shape)
+		a.flags.writeable = False
+		return a
+	if kind == "sparse":
+		fmt, shape = desc[1:3]
+		data, indices, indptr = [from_shared(d) for d in desc[3:]]
+		matrix = csc_matrix if fmt == "csc" else csr_matrix
+		return matrix((data, indices, indptr), shape=shape, copy=False)
+	if kind == "dict":
+		return dict((key, from_shared(value)) for key, value in desc[1].items())
+	return desc[1]
+
+
+_shared = {}
+
+
+def _init_worker(shared_desc, blas_threads):
+	"""Initializer of the worker processes; shared_desc is inherited from the parent process"""
+	global _shared
+	if blas_threads is not None:
+		set_blas_threads(blas_threads)
+	_shared = dict((key, from_shared(desc)) for key, desc in shared_desc.items())
+
+
+def _estimator(name):
+	if callable(name):
+		return name
+	import NLO.nodal_load_observer as nlo
+	import NLO.batch as batch
+	for module in [nlo, batch]:
+		if hasattr(module, name):
+			return getattr(module, name)
+	raise ValueError("Unknown estimator '%s'." % name)
+
+
+def _run(spec):
+	"""Carry out a single run in the worker"""
+	# the estimators add or replace entries of dict arguments (e.g. meas_unc), hence shared dicts are copied
+	kwargs = dict((key, dict(value) if isinstance(value, dict) else value) for key, value in _shared.items())
+	kwargs.update(spec)
+	estimator = _estimator(kwargs.pop("estimator", "IteratedExtendedKalman"))
+	return estimator(**kwargs)
+
+
+def run_parallel(specs, shared=None, processes=None, blas_threads=1):
+	"""
+	Carry out independent estimator runs on a pool of worker processes.
+
+	Example (one IEKF run per dynamic model)::
+
+		specs = [dict(model=model) for model in models]
+		shared = dict(topology=topology, Y=Yws, meas=meas, meas_unc=meas_unc, meas_idx=meas_idx,
+					  pseudo_meas=pseudo_meas, V0=Vhat0, Vs=Vs)
+		results = run_parallel(specs, shared=shared)
+
+	:param specs: list of dicts with the keyword arguments of the estimator for each run; the key "estimator"
+			contains the estimator function or its name in nodal_load_observer.py or batch.py (default is
+			"IteratedExtendedKalman")
+	:param shared: (optional) dict of keyword arguments common to all runs; ndarrays, scipy.sparse matrices and dicts
+			thereof (e.g. topology) are placed in shared memory and passed to the estimator as read-only arrays
+	:param processes: (optional) number of worker processes; default is the number of CPUs. With processes=1 all
+			runs are carried out in the current process and the shared data are passed without copying.
+	:param blas_threads: (optional) number of BLAS threads per worker process (or of the current process if
+			processes=1); None leaves the setting unchanged
+	:return: list of the return values of the estimator in the order of specs
+	"""
+	return list(iter_parallel(specs, shared, processes, blas_threads))
+
+
+def iter_parallel(specs, shared=None, processes=None, blas_threads=1):
+	"""
+	Same as `run_parallel`, but the return values are yielded in the order of specs as soon as they are available,
+	such that they can be processed (e.g. accumulated) without keeping all of them in memory.
+	"""
+	global _shared
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	processes = max(1, min(processes, len(specs)))
+	if shared is None:
+		shared = {}
+	if processes == 1:
+		if blas_threads is not None:
+			set_blas_threads(blas_threads)
+		previous = _shared
+		_shared = dict(shared)
+		try:
+			for spec in specs:
+				yield _run(spec)
+		finally:
+			_shared = previous
+		return
+	shared_desc = dict((key, to_shared(value)) for key, value in shared.items())
+	pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(shared_desc, blas_threads))
+	try:
+		# imap preserves the order of specs; chunksize 1 balances runs of different duration
+		for result in pool.imap(_run, specs, chunksize=1):
+			yield result
+	except:
+		pool.terminate()
+		raise
+	pool.close()
+	pool.join()
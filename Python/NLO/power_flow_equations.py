@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains numerical implementations of the network equations used by the extended nodal load observer.
+Bus power, power at lines and voltage magnitudes are calculated from the nodal voltages, together with their
+analytical Jacobian matrices with respect to the real and imaginary parts of the nodal voltages at all non-slack buses.
+
+Nodal voltages are given as real-valued vectors V = [e, f] with e the real and f the imaginary parts.
+
+"""
+
+import numpy as np
+from scipy.sparse import issparse, csr_matrix, coo_matrix
+
+
+def non_slack_columns(nK, slack_idx=0):
+	"""Indices of the real and imaginary parts of all non-slack nodal voltages in V = [e, f]
+	"""
+	non_slack = np.delete(np.arange(nK), slack_idx)
+	return np.r_[non_slack, nK + non_slack]
+
+
+class BranchList(object):
+	"""
+	Compact branch-indexed representation of the line parameters of a network.
+	For each branch the from and to bus, the series admittance y = 1/(r + jx) and the line capacitance are stored,
+	such that memory requirements are linear in the number of branches. Parallel branches between the same pair
+	of buses are combined into a single branch.
+	"""
+	def __init__(self, from_bus, to_bus, y, cap, nK=None):
+		"""
+		:param from_bus: (nbr,) shaped array of bus indices (Python indexing)
+		:param to_bus: (nbr,) shaped array of bus indices (Python indexing)
+		:param y: (nbr,) shaped array of complex series admittances
+		:param cap: (nbr,) shaped array of line capacitances
+		:param nK: (optional) number of buses
+		"""
+		from_bus = np.asarray(from_bus, dtype=int)
+		to_bus = np.asarray(to_bus, dtype=int)
+		if nK is None:
+			nK = int(max(from_bus.max(), to_bus.max())) + 1 if len(from_bus) > 0 else 0
+		self.nK = nK
+		# combine parallel branches using a unique index for each unordered pair of buses
+		lo = np.minimum(from_bus, to_bus)
+		hi = np.maximum(from_bus, to_bus)
+		pairs, inv = np.unique(lo*nK + hi, return_inverse=True)
+		self.from_bus = (pairs // nK).astype(int)
+		self.to_bus = (pairs % nK).astype(int)
+		self.y = np.bincount(inv, weights=np.real(y), minlength=len(pairs)) \
+				 + 1j*np.bincount(inv, weights=np.imag(y), minlength=len(pairs))
+		self.cap = np.bincount(inv, weights=np.asarray(cap, dtype=float), minlength=len(pairs))
+		self._pairs = pairs
+
+	@classmethod
+	def from_branch_data(cls, network_branches, nK=None):
+		"""Set up branch list from network branch information in PyPower format (from bus, to bus, r, x, b, ...).
+		Bus numbers starting at 1 are converted to Python indices.
+		"""
+		network_branches = np.asarray(network_branches)
+		from_bus = network_branches[:, 0].astype(int)
+		to_bus = network_branches[:, 1].astype(int)
+		if network_branches[:, :2].min() > 0: 	# assume bus numbering starting at 1
+			from_bus = from_bus - 1
+			to_bus = to_bus - 1
+		z = network_branches[:, 2] + 1j*network_branches[:, 3]
+		y = np.zeros_like(z)
+		y[z != 0] = 1/z[z != 0]
+		return cls(from_bus, to_bus, y, network_branches[:, 4], nK)
+
+	@classmethod
+	def from_matrices(cls, y, cap):
+		"""Set up branch list from (nK,nK) shaped matrices of line admittances and line capacitances
+		"""
+		y = np.asarray(y)
+		cap = np.asarray(cap)
+		i, j = np.nonzero(np.triu((y != 0) | (cap != 0), 1))
+		return cls(i, j, y[i, j], cap[i, j], y.shape[0])
+
+	def __len__(self):
+		return len(self.y)
+
+	def branch_index(self, i, j):
+		"""Index of the branches connecting buses i and j
+		:param i: array of bus indices
+		:param j: array of bus indices
+		:return: array of branch indices
+		"""
+		i = np.asarray(i, dtype=int)
+		j = np.asarray(j, dtype=int)
+		key = np.minimum(i, j)*self.nK + np.maximum(i, j)
+		if len(self._pairs) == 0:
+			ind = np.zeros(len(key), dtype=int)
+			found = np.zeros(len(key), dtype=bool)
+		else:
+			ind = np.minimum(np.searchsorted(self._pairs, key), len(self._pairs) - 1)
+			found = self._pairs[ind] == key
+		if not np.all(found):
+			k = (~found).nonzero()[0][0]
+			raise ValueError("Measured line (%d,%d) is not a branch of the network." % (i[k], j[k]))
+		return ind
+
+	def admittance_matrix(self):
+		"""Nodal admittance matrix in scipy.sparse CSR format
+		"""
+		f, t = self.from_bus, self.to_bus
+		shunt = 0.5j*self.cap
+		rows = np.r_[f, t, f, t]
+		cols = np.r_[t, f, f, t]
+		vals = np.r_[-self.y, -self.y, self.y + shunt, self.y + shunt]
+		return coo_matrix((vals, (rows, cols)), shape=(self.nK, self.nK)).tocsr()
+
+	def matrices(self):
+		"""Dense (nK,nK) shaped matrices of line admittances y and line capacitances cap
+		"""
+		y = np.zeros((self.nK, self.nK), dtype=complex)
+		cap = np.zeros((self.nK, self.nK))
+		y[self.from_bus, self.to_bus] = self.y
+		y[self.to_bus, self.from_bus] = self.y
+		cap[self.from_bus, self.to_bus] = self.cap
+		cap[self.to_bus, self.from_bus] = self.cap
+		return y, cap
+
+
+class BusPowerEquations(object):
+	"""
+	Active and reactive bus power S = V * conj(Y V) as function of the nodal voltages.
+	The Jacobian is calculated with respect to the voltages at all non-slack buses. For a sparse admittance
+	matrix, the Jacobian is returned in scipy.sparse CSC format. Its structure is determined once, such that each
+	evaluation only fills the nonzero values.
+	"""
+	def __init__(self, Y, slack_idx=0):
+		self.sparse = issparse(Y)
+		self.nK = nK = Y.shape[0]
+		self.non_ref = non_slack_columns(nK, slack_idx)
+		if self.sparse:
+			from scipy.sparse import identity
+			self.Y = csr_matrix(Y)
+			# nonzero pattern of Y and its diagonal w/o the slack column
+			P = (abs(self.Y) + identity(nK, format="csr")).tocoo()
+			keep = P.col != slack_idx
+			r, c = P.row[keep], P.col[keep]
+			self.rows = r
+			self.y_conj = np.conj(np.asarray(self.Y[r, c]).ravel())
+			self.diag = (r == c).nonzero()[0]
+			self.diag_rows = r[self.diag]
+			# CSC structure of [[dP/de, dP/df], [dQ/de, dQ/df]] and permutation into CSC ordering
+			colmap = -np.ones(2*nK, dtype=int)
+			colmap[self.non_ref] = np.arange(2*nK - 2)
+			rows = np.r_[r, r, nK + r, nK + r]
+			cols = np.r_[colmap[c], colmap[nK + c], colmap[c], colmap[nK + c]]
+			order = coo_matrix((np.arange(1, len(rows) + 1, dtype=float), (rows, cols)),
+							   shape=(2*nK, 2*nK - 2)).tocsc()
+			self.perm = order.data.astype(int) - 1
+			self.indices = order.indices
+			self.indptr = order.indptr
+		else:
+			self.Y = np.asarray(Y)
+
+	def power(self, V):
+		"""
+		:param V: (2*nK,) shaped array of real and imaginary parts of nodal voltages
+		:return: (2*nK,) shaped array of active and reactive bus power
+		"""
+		nK = self.nK
+		Vc = V[:nK] + 1j*V[nK:]
+		S = Vc*np.conj(self.Y.dot(Vc))
+		return np.r_[S.real, S.imag]
+
+	def jacobian(self, V):
+		"""
+		:param V: (2*nK,) shaped array of real and imaginary parts of nodal voltages
+		:return: (2*nK, 2*nK-2) shaped Jacobian of bus power with respect to non-slack nodal voltages
+		"""
+		nK = self.nK
+		Vc = V[:nK] + 1j*V[nK:]
+		cI = np.conj(self.Y.dot(Vc))
+		# dS/de = diag(conj(I)) + diag(V)*conj(Y) and dS/df = j*diag(conj(I)) - j*diag(V)*conj(Y)
+		if self.sparse:
+			from scipy.sparse import csc_matrix
+			dSde = Vc[self.rows]*self.y_conj
+			dSdf = -1j*dSde
+			dSde[self.diag] += cI[self.diag_rows]
+			dSdf[self.diag] += 1j*cI[self.diag_rows]
+			data = np.r_[dSde.real, dSdf.real, dSde.imag, dSdf.imag][self.perm]
+			return csc_matrix((data, self.indices, self.indptr), shape=(2*nK, 2*nK - 2))
+		VY = Vc[:, np.newaxis]*np.conj(self.Y)
+		diag = np.arange(nK)
+		J = np.empty((2*nK, 2*nK))
+		J[:nK, :nK] = VY.real
+		J[nK:, :nK] = VY.imag
+		J[:nK, nK:] = VY.imag
+		J[nK:, nK:] = -VY.real
+		J[diag, diag] += cI.real
+		J[nK + diag, diag] += cI.imag
+		J[diag, nK + diag] -= cI.imag
+		J[nK + diag, nK + diag] += cI.real
+		return J[:, self.non_ref]
+
+
+class MeasurementEquations(object):
+	"""
+	Active and reactive power at lines and voltage magnitudes at the measured buses as function of the nodal
+	voltages. The order of the equations is: active power at lines, reactive power at lines, voltage magnitudes.
+	All equations are evaluated only for the measured lines and buses, with the line parameters taken from the
+	branch list. Memory and computational cost are therefore linear in the number of measurements.
+	"""
+	def __init__(self, nK, branches, meas_idx, slack_idx=0, sparse=False):
+		"""
+		:param nK: number of buses
+		:param branches: BranchList object containing the line parameters
+		:param meas_idx: dict containing index arrays of measured lines ("Pl", "Ql") and voltages ("Vm")
+		:param slack_idx: index of slack node
+		:param sparse: if True, Jacobian is returned in scipy.sparse CSC format
+		"""
+		self.nK = nK
+		self.sparse = sparse
+
+		def line_indices(key):
+			if key in meas_idx and len(meas_idx[key]) > 0:
+				inds = np.asarray(meas_idx[key]).astype(int).reshape(-1, 2)
+				return inds[:, 0], inds[:, 1]
+			return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+		self.Pl_i, self.Pl_j = line_indices("Pl")
+		self.Ql_i, self.Ql_j = line_indices("Ql")
+		if "Vm" in meas_idx and len(meas_idx["Vm"]) > 0:
+			self.Vm_i = np.asarray(meas_idx["Vm"]).astype(int).ravel()
+		else:
+			self.Vm_i = np.zeros(0, dtype=int)
+		Pl_br = branches.branch_index(self.Pl_i, self.Pl_j)
+		Ql_br = branches.branch_index(self.Ql_i, self.Ql_j)
+		self.Pl_g = branches.y[Pl_br].real
+		self.Pl_b = branches.y[Pl_br].imag
+		self.Ql_g = branches.y[Ql_br].real
+		self.Ql_b = branches.y[Ql_br].imag
+		self.Ql_c = branches.cap[Ql_br]
+		self.nPl = len(self.Pl_i)
+		self.nQl = len(self.Ql_i)
+		self.nVm = len(self.Vm_i)
+		self.dim = self.nPl + self.nQl + self.nVm
+
+		# map from column in V = [e, f] to column in Jacobian; slack columns are removed (-1)
+		self.colmap = -np.ones(2*nK, dtype=int)
+		self.colmap[non_slack_columns(nK, slack_idx)] = np.arange(2*nK - 2)
+
+	def evaluate(self, V):
+		"""
+		:param V: (2*nK,) shaped array of real and imaginary parts of nodal voltages
+		:return: values of the measurement equations
+		"""
+		nK = self.nK
+		e = V[:nK]
+		f = V[nK:]
+		i, j = self.Pl_i, self.Pl_j
+		Pl = (e[i]**2 + f[i]**2)*self.Pl_g - (e[i]*e[j] + f[i]*f[j])*self.Pl_g + (e[i]*f[j] - e[j]*f[i])*self.Pl_b
+		i, j = self.Ql_i, self.Ql_j
+		Ql = -(e[i]**2 + f[i]**2)*(self.Ql_b + self.Ql_c/2) + (e[i]*e[j] + f[i]*f[j])*self.Ql_b \
+			 + (e[i]*f[j] - e[j]*f[i])*self.Ql_g
+		i = self.Vm_i
+		Vm = np.sqrt(e[i]**2 + f[i]**2)
+		return np.r_[Pl, Ql, Vm]
+
+	def jacobian(self, V):
+		"""
+		:param V: (2*nK,) shaped array of real and imaginary parts of nodal voltages
+		:return: Jacobian of the measurement equations with respect to non-slack nodal voltages
+		"""
+		nK = self.nK
+		e = V[:nK]
+		f = V[nK:]
+		rows = []; cols = []; vals = []
+
+		def add(r, c, v):
+			rows.append(r); cols.append(c); vals.append(v)
+
+		# active power at lines
+		i, j = self.Pl_i, self.Pl_j
+		g, b = self.Pl_g, self.Pl_b
+		r = np.arange(self.nPl)
+		add(r, i, 2*e[i]*g - e[j]*g + f[j]*b)
+		add(r, nK + i, 2*f[i]*g - f[j]*g - e[j]*b)
+		add(r, j, -e[i]*g - f[i]*b)
+		add(r, nK + j, -f[i]*g + e[i]*b)
+		# reactive power at lines
+		i, j = self.Ql_i, self.Ql_j
+		g, b, bc = self.Ql_g, self.Ql_b, self.Ql_b + self.Ql_c/2
+		r = self.nPl + np.arange(self.nQl)
+		add(r, i, -2*e[i]*bc + e[j]*b + f[j]*g)
+		add(r, nK + i, -2*f[i]*bc + f[j]*b - e[j]*g)
+		add(r, j, e[i]*b - f[i]*g)
+		add(r, nK + j, f[i]*b + e[i]*g)
+		# voltage magnitudes
+		i = self.Vm_i
+		absV = np.sqrt(e[i]**2 + f[i]**2)
+		r = self.nPl + self.nQl + np.arange(self.nVm)
+		add(r, i, e[i]/absV)
+		add(r, nK + i, f[i]/absV)
+
+		rows = np.concatenate(rows)
+		cols = self.colmap[np.concatenate(cols)]
+		vals = np.concatenate(vals)
+		keep = cols >= 0
+		J = coo_matrix((vals[keep], (rows[keep], cols[keep])), shape=(self.dim, 2*nK - 2))
+		if self.sparse:
+			return J.tocsc()
+		return J.toarray()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the selection operators which map between the values at all buses and the actually
+measured/non-measured ones (matrices Cm, Dm and Dnm in W. Heins' thesis).
+
+Instead of dense 0/1 matrices, only the positions of the ones are stored and the operators are applied by
+indexing (gather/scatter). This avoids O(n^2) memory and dense matrix products in the estimators.
+
+"""
+
+import numpy as np
+from scipy.sparse import issparse, csr_matrix
+
+
+class Selector(object):
+	"""
+	Linear operator given by a matrix of zeros and ones with at most a single one in each row and each column.
+	The ones are located at positions (rows[k], cols[k]).
+	"""
+	def __init__(self, rows, cols, shape):
+		self.rows = np.asarray(rows, dtype=int)
+		self.cols = np.asarray(cols, dtype=int)
+		self.shape = tuple(shape)
+		assert(self.rows.shape == self.cols.shape)
+		# pure gather operation, i.e. each row contains exactly one 1 in order
+		self.is_gather = len(self.rows) == self.shape[0] and np.all(self.rows == np.arange(self.shape[0]))
+
+	@property
+	def T(self):
+		return Selector(self.cols, self.rows, (self.shape[1], self.shape[0]))
+
+	def dot(self, x):
+		"""
+		Apply operator from the left, i.e. calculate S*x
+		:param x: numpy array of shape (shape[1],) or (shape[1],k), or scipy.sparse matrix
+		:return: S*x
+		"""
+		if issparse(x):
+			return self.tocsr().dot(x)
+		x = np.asarray(x)
+		if self.is_gather:
+			return x[self.cols]
+		out = np.zeros((self.shape[0],) + x.shape[1:], dtype=np.result_type(x.dtype, float))
+		out[self.rows] = x[self.cols]
+		return out
+
+	def premultiply(self, A):
+		"""
+		Apply operator from the right, i.e. calculate A*S
+		:param A: numpy array of shape (m,shape[0])
+		:return: A*S
+		"""
+		if issparse(A):
+			return A.dot(self.tocsr())
+		A = np.asarray(A)
+		out = np.zeros(A.shape[:-1] + (self.shape[1],), dtype=np.result_type(A.dtype, float))
+		out[..., self.cols] = A[..., self.rows]
+		return out
+
+	def toarray(self):
+		"""Dense matrix representation
+		"""
+		out = np.zeros(self.shape)
+		out[self.rows, self.cols] = 1
+		return out
+
+	def tocsr(self):
+		"""Sparse matrix representation in CSR format
+		"""
+		return csr_matrix((np.ones(len(self.rows)), (self.rows, self.cols)), shape=self.shape)
+
+	def __array__(self, dtype=None):
+		if dtype is None:
+			return self.toarray()
+		return self.toarray().astype(dtype)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the nodal load observer estimators LinearKalmanFilter, IteratedExtendedKalman and NLOextended on a
+grid of network sizes (number of buses), meter densities (fraction of metered buses) and horizons (number of time
+steps).
+
+For each combination a synthetic radial network (see tools/synthetic_feeder.py) with known voltages is generated,
+and each estimator is run in a fresh process, such that the peak memory of the process is that of a single run. Reported are
+	- setup time, i.e. the wall time until the first time step starts (see `SetupTimer`), and per-step latency
+	  from the wall time of the full run without setup; cached factorizations are removed before each run
+	- throughput in time steps per second
+	- peak resident memory of the process and its increase during the estimation
+	- whether the estimated voltages are finite ("converged"); NLOextended may diverge on large networks
+	- mean time per stage and mean number of iterations per step from an additional run with instrumentation
+	  (see NLO/instrumentation.py), such that the timings above are not affected by the instrumentation
+
+Results are written as JSON for comparison between versions, e.g.
+
+	python benchmarks/benchmark_estimators.py --buses 20 100 500 --output results.json
+
+"""
+# if run as script, add parent path for relative importing
+if __name__ == '__main__' and __package__ is None:
+	from os import sys, path
+	sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import multiprocessing
+from timeit import default_timer
+
+import numpy as np
+import scipy
+from scipy.sparse import csr_matrix
+
+from tools.data_tools import separate_Yslack
+from tools.synthetic_feeder import radial_feeder, branch_in_ohm, load_profiles, simulate
+from NLO.dynamic_models import SimpleModel
+from NLO.nodal_load_observer import LinearKalmanFilter, IteratedExtendedKalman, NLOextended, newton_voltages
+from NLO.power_flow_equations import BranchList, BusPowerEquations, MeasurementEquations
+from NLO.instrumentation import StepProfile
+from NLO import factorization
+
+estimators = {"LKF": LinearKalmanFilter, "IEKF": IteratedExtendedKalman, "NLOext": NLOextended}
+
+
+def make_case(n_bus, meter_density, nT, seed=0):
+	"""
+	Synthetic radial network (see tools/synthetic_feeder.py) with loads following standard load profiles and the
+	resulting nodal voltages
+	:param n_bus: number of buses including the slack bus 0
+	:param meter_density: fraction of non-slack buses with measured power and voltage
+	:param nT: number of time steps
+	:param seed: seed of the random number generator
+	:return: dict with "topology" (branch data in Ohm), "Y", true power "S" (three-phase, in MW) and voltages "V"
+			(phase, in kV) of all non-slack buses, "metered" buses and slack voltage "Vslack"
+	"""
+	casedata = radial_feeder(n_bus, seed=seed)
+	load = load_profiles(casedata, nT, seed=seed + 1)[0]
+	truth = simulate(casedata, load)
+	topology = dict(casedata, branch=branch_in_ohm(casedata))
+	rng = np.random.RandomState(seed + 2)
+	n_meter = max(1, int(round(meter_density*(n_bus - 1))))
+	metered = np.sort(rng.choice(np.arange(1, n_bus), n_meter, replace=False))
+	return {"topology": topology, "Y": truth["Y"], "S": truth["S"], "V": truth["V"], "metered": metered,
+			"Vslack": truth["Vs"][0, 0], "seed": seed}
+
+
+def estimator_arguments(case, name, nT):
+	"""Positional and keyword arguments of the estimator `name` for the first nT time steps of `case`"""
+	rng = np.random.RandomState(case["seed"] + 1)
+	topology, Y, metered, Vslack = case["topology"], case["Y"], case["metered"], case["Vslack"]
+	nK = topology["bus"].shape[0] - 1 	# buses w/o slack
+	S = case["S"][:, :nT]
+	V = case["V"][:, :nT]
+	Vm = np.sqrt(V[:nK]**2 + V[nK:]**2)
+	Va = np.degrees(np.arctan2(V[nK:], V[:nK]))
+	uVm, uVa = 1e-3*Vslack, 1e-2
+	if name == "NLOext":
+		# all buses including slack; power per phase
+		idx = metered
+		Vfull = np.r_[np.r_[Vslack*np.ones((1, nT)), V[:nK]], np.r_[np.zeros((1, nT)), V[nK:]]]
+		lines = np.c_[topology["branch"][idx - 1, 0], idx].astype(int)
+		meas_idx = {"Pk": idx, "Qk": idx, "Vm": idx, "Pl": lines, "Ql": lines}
+		eqs = MeasurementEquations(nK + 1, BranchList.from_branch_data(topology["branch"], nK + 1), meas_idx)
+		h = np.array([eqs.evaluate(Vfull[:, k]) for k in range(nT)]).T
+		bus_eqs = BusPowerEquations(Y)
+		Sfull = np.array([bus_eqs.power(Vfull[:, k]) for k in range(nT)]).T
+		nl = len(lines)
+		meas = {"Pk": Sfull[:nK + 1][idx], "Qk": Sfull[nK + 1:][idx], "Pl": h[:nl], "Ql": h[nl:2*nl],
+				"Vm": h[2*nl:] + uVm*rng.randn(len(idx), nT)}
+		meas_unc = {"Pk": 1e-3*np.ones(len(idx)), "Qk": 1e-3*np.ones(len(idx)), "Pl": 1e-3*np.ones(nl),
+					"Ql": 1e-3*np.ones(nl), "Vm": uVm*np.ones(len(idx))}
+		notmeas = np.setdiff1d(np.arange(nK + 1), idx)
+		pseudo_meas = {"Pk": Sfull[:nK + 1][notmeas]*(1 + 0.1*rng.randn(len(notmeas), nT)),
+					   "Qk": Sfull[nK + 1:][notmeas]*(1 + 0.1*rng.randn(len(notmeas), nT))}
+		# prior uncertainty of the size of the pseudo-measurement errors at the load buses (w/o slack bus)
+		model = SimpleModel(2*len(notmeas), alpha=0.95, q=np.mean((0.1*pseudo_meas["Pk"][notmeas > 0])**2))
+		model.P0 = np.eye(model.dim)*model.q
+		# initial voltages from a power flow with the (pseudo-)measured power of the first time step, since a flat
+		# start modified by the measured voltage magnitudes is far from the solution on large networks
+		S0 = np.zeros(2*(nK + 1))
+		S0[np.r_[idx, nK + 1 + idx]] = np.r_[meas["Pk"][:, 0], meas["Qk"][:, 0]]
+		S0[np.r_[notmeas, nK + 1 + notmeas]] = np.r_[pseudo_meas["Pk"][:, 0], pseudo_meas["Qk"][:, 0]]
+		Y00, Ys = separate_Yslack(Y, 0, sparse=True)
+		V0, info = newton_voltages(Y00, Ys, 3*np.r_[S0[1:nK + 1], S0[nK + 2:]], np.r_[Vslack*np.ones(nK), np.zeros(nK)],
+								   np.array([Vslack, 0.0]), accuracy=1e-10)
+		V0 = np.r_[Vslack, V0[:nK], 0.0, V0[nK:]]
+		return (topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0), {"Y": Y}
+	idx = metered - 1 	# indices w/o slack bus
+	meas_idx = {"Pk": idx, "Qk": idx, "Vm": idx, "Va": idx}
+	meas = {"Pk": S[:nK][idx], "Qk": S[nK:][idx], "Vm": Vm[idx] + uVm*rng.randn(len(idx), nT),
+			"Va": Va[idx] + uVa*rng.randn(len(idx), nT)}
+	meas_unc = {"Vm": uVm*np.ones(len(idx)), "Va": uVa*np.ones(len(idx))}
+	notmeas = np.setdiff1d(np.arange(nK), idx)
+	pseudo_meas = {"Pk": S[:nK][notmeas]*(1 + 0.1*rng.randn(len(notmeas), nT)),
+				   "Qk": S[nK:][notmeas]*(1 + 0.1*rng.randn(len(notmeas), nT))}
+	model = SimpleModel(2*len(notmeas), alpha=0.95, q=np.mean((0.1*pseudo_meas["Pk"])**2))
+	V0 = np.r_[Vslack*np.ones(nK), np.zeros(nK)]
+	Vs = np.vstack((Vslack*np.ones(nT), np.zeros(nT)))
+	return (topology, meas, meas_unc, meas_idx, pseudo_meas, model, V0, Vs), {"Y": csr_matrix(Y)}
+
+
+def peak_memory_mb():
+	"""Peak resident memory of the current process in MB"""
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss/1024.0**2 if sys.platform == "darwin" else rss/1024.0
+
+
+class SetupTimer(StepProfile):
+	"""StepProfile recording the time of the first timing of a stage, i.e., the end of the setup of the estimator
+	(admittance matrices, factorizations, network equations) and the start of the first time step"""
+	def __init__(self, nT=0):
+		StepProfile.__init__(self, nT)
+		self.setup_end = None
+
+	def tic(self):
+		t = StepProfile.tic(self)
+		if self.setup_end is None:
+			self.setup_end = t
+		return t
+
+
+def timed_setup(estimator, args, kwargs):
+	"""Setup time of an estimator run without cached factorizations"""
+	factorization.clear_cache()
+	timer = SetupTimer()
+	t0 = default_timer()
+	estimator(*args, profile=timer, **kwargs)
+	return timer.setup_end - t0
+
+
+def timed_run(estimator, args, kwargs):
+	"""Wall time and return values of an estimator run without cached factorizations"""
+	factorization.clear_cache()
+	t0 = time.time()
+	results = estimator(*args, **kwargs)
+	return time.time() - t0, results
+
+
+def run_single(case_pars, name, queue, stages=True):
+	"""Benchmark of a single estimator for a single case; executed in a separate process"""
+	sys.stdout = open(os.devnull, "w") 	# the estimators print progress information
+	try:
+		n_bus, density, nT, seed = case_pars
+		case = make_case(n_bus, density, nT, seed)
+		estimator = estimators[name]
+		memory_before = peak_memory_mb()
+		args, kwargs = estimator_arguments(case, name, 1)
+		t_setup = timed_setup(estimator, args, kwargs)
+		args, kwargs = estimator_arguments(case, name, nT)
+		t_total, results = timed_run(estimator, args, kwargs)
+		memory_peak = peak_memory_mb()
+		step = (t_total - t_setup)/nT
+		result = {"estimator": name, "buses": n_bus, "meter_density": density, "horizon": nT,
+				  "meters": len(case["metered"]), "total_time": t_total, "setup_time": t_setup,
+				  "step_latency": step, "throughput": nT/t_total,
+				  "peak_memory_mb": memory_peak, "memory_increase_mb": memory_peak - memory_before,
+				  "converged": bool(np.all(np.isfinite(results[1])))}
+		if stages:
+			args, kwargs = estimator_arguments(case, name, nT)
+			profile = StepProfile(nT)
+			estimator(*args, profile=profile, **kwargs)
+			summary = profile.summary()
+			result["stage_time"] = dict((key, value["mean"]) for key, value in summary["time"].items())
+			result["iterations"] = dict((key, value["mean"]) for key, value in summary["iterations"].items())
+		queue.put(result)
+	except Exception as e:
+		queue.put({"estimator": name, "buses": case_pars[0], "meter_density": case_pars[1], "horizon": case_pars[2],
+				   "error": "%s: %s" % (type(e).__name__, e)})
+
+
+def run_benchmarks(buses, densities, horizons, names, seed=0, stages=True):
+	"""
+	Run all estimators for all combinations of buses, meter densities and horizons
+	:return: list of dicts with the results of each run
+	"""
+	results = []
+	for n_bus in buses:
+		for density in densities:
+			for nT in horizons:
+				for name in names:
+					queue = multiprocessing.Queue()
+					proc = multiprocessing.Process(target=run_single, args=((n_bus, density, nT, seed), name, queue, stages))
+					proc.start()
+					result = queue.get()
+					proc.join()
+					results.append(result)
+					if "error" in result:
+						print "%-7s %5d buses %4.2f meters %5d steps: %s" % (name, n_bus, density, nT, result["error"])
+					else:
+						print "%-7s %5d buses %4.2f meters %5d steps: setup %8.4f s, step %8.5f s, %8.1f steps/s, " \
+							  "%7.1f MB%s" % (name, n_bus, density, nT, result["setup_time"], result["step_latency"],
+											  result["throughput"], result["peak_memory_mb"],
+											  "" if result["converged"] else ", diverged")
+	return results
+
+
+def environment():
+	"""Versions of software and hardware used for the benchmark"""
+	return {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+			"platform": platform.platform(), "processor": platform.processor(), "cpus": multiprocessing.cpu_count(),
+			"time": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Benchmark of the nodal load observer estimators")
+	parser.add_argument("--buses", type=int, nargs="+", default=[13, 50, 200])
+	parser.add_argument("--densities", type=float, nargs="+", default=[0.1, 0.3])
+	parser.add_argument("--horizons", type=int, nargs="+", default=[24, 96])
+	parser.add_argument("--estimators", nargs="+", default=sorted(estimators), choices=sorted(estimators))
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--no-stages", dest="stages", action="store_false",
+						help="skip the instrumented run for the time per stage")
+	parser.add_argument("--output", default="benchmark_results.json")
+	options = parser.parse_args()
+	results = run_benchmarks(options.buses, options.densities, options.horizons, options.estimators, options.seed,
+							 options.stages)
+	with open(options.output, "w") as f:
+		json.dump({"environment": environment(), "results": results}, f, indent=1, sort_keys=True)
+	print "Results written to %s" % options.output
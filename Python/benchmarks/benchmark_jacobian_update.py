@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the Jacobian updates "full", "reuse" and "broyden" of the iterated Kalman filters
+IteratedExtendedKalman and NLOextended (parameter `jacobian_update`).
+
+The synthetic cases are those of benchmark_estimators.py. For each estimator and Jacobian update reported are
+	- the wall time per time step (minimum over repeated runs without cached factorizations)
+	- the time per step spent in the calculation of the Jacobian and of the Kalman gain, and the mean number of
+	  iterations per step, from an additional run with instrumentation (see NLO/instrumentation.py)
+	- the maximum deviation of the estimated voltages and states from those of a reference run with the exact
+	  Jacobian and `accuracy` 1e-13, i.e. the error due to the stopping of the iteration
+	- the maximum error of the estimated voltages w.r.t. the true voltages of the case
+
+Results are written as JSON, e.g.
+
+	python benchmarks/benchmark_jacobian_update.py --buses 60 200 --output jacobian_update.json
+
+"""
+# if run as script, add parent path for relative importing
+if __name__ == '__main__' and __package__ is None:
+	from os import sys, path
+	sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+from NLO.instrumentation import StepProfile
+from benchmark_estimators import estimators, make_case, estimator_arguments, timed_run, environment
+
+updates = ["full", "reuse", "broyden"]
+
+
+def true_voltage_error(case, name, Vhat):
+	"""Maximum deviation of the estimated voltages of the non-slack buses from the true voltages"""
+	nT = Vhat.shape[1]
+	if name == "NLOext":
+		nK = Vhat.shape[0]/2 - 1
+		Vhat = np.r_[Vhat[1:nK + 1], Vhat[nK + 2:]]
+	return np.abs(Vhat - case["V"][:, :nT]).max()
+
+
+def compare_updates(case, name, nT, repeat=3):
+	"""
+	Run the estimator `name` with each Jacobian update on the first nT time steps of `case`
+	:return: list of dicts with the results of each Jacobian update
+	"""
+	args, kwargs = estimator_arguments(case, name, nT)
+	reference = estimators[name](*args, accuracy=1e-13, **kwargs)
+	results = []
+	for update in updates:
+		times = []
+		for _ in range(repeat):
+			args, kwargs = estimator_arguments(case, name, nT)
+			t, estimate = timed_run(estimators[name], args, dict(kwargs, jacobian_update=update))
+			times.append(t)
+		args, kwargs = estimator_arguments(case, name, nT)
+		profile = StepProfile(nT)
+		estimators[name](*args, jacobian_update=update, profile=profile, **kwargs)
+		summary = profile.summary()
+		results.append({"estimator": name, "jacobian_update": update, "step_time": min(times)/nT,
+						"jacobian_time": summary["time"]["jacobian"]["mean"],
+						"gain_time": summary["time"]["gain"]["mean"],
+						"iterations": summary["iterations"]["iekf"]["mean"],
+						"voltage_deviation": np.abs(estimate[1] - reference[1]).max(),
+						"state_deviation": np.abs(estimate[3] - reference[3]).max(),
+						"voltage_error": true_voltage_error(case, name, estimate[1])})
+	return results
+
+
+def run_benchmarks(buses, names, density=0.3, nT=24, seed=0, repeat=3):
+	"""
+	Compare the Jacobian updates of all estimators for all numbers of buses
+	:return: list of dicts with the results of each run
+	"""
+	results = []
+	stdout = sys.stdout
+	for n_bus in buses:
+		case = make_case(n_bus, density, nT, seed)
+		for name in names:
+			sys.stdout = open(os.devnull, "w") 	# the estimators print progress information
+			try:
+				runs = compare_updates(case, name, nT, repeat)
+			finally:
+				sys.stdout = stdout
+			for result in runs:
+				result.update(buses=n_bus, meter_density=density, horizon=nT)
+				print "%-7s %5d buses %-8s step %8.5f s (%5.2f), jacobian %8.5f s, gain %8.5f s, %5.2f iterations, " \
+					  "deviation %.1e, error %.1e" % (name, n_bus, result["jacobian_update"], result["step_time"],
+													result["step_time"]/runs[0]["step_time"], result["jacobian_time"],
+													result["gain_time"], result["iterations"],
+													result["state_deviation"], result["voltage_error"])
+			results.extend(runs)
+	return results
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Benchmark of the Jacobian updates of the iterated Kalman filters")
+	parser.add_argument("--buses", type=int, nargs="+", default=[60, 200])
+	parser.add_argument("--density", type=float, default=0.3)
+	parser.add_argument("--horizon", type=int, default=24)
+	parser.add_argument("--estimators", nargs="+", default=["IEKF", "NLOext"], choices=["IEKF", "NLOext"])
+	parser.add_argument("--repeat", type=int, default=3)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", default="jacobian_update_results.json")
+	options = parser.parse_args()
+	results = run_benchmarks(options.buses, options.estimators, options.density, options.horizon, options.seed,
+							 options.repeat)
+	with open(options.output, "w") as f:
+		json.dump({"environment": environment(), "results": results}, f, indent=1, sort_keys=True)
+	print "Results written to %s" % options.output
@@ -27,6 +27,7 @@ from matplotlib.pyplot import *
 from scipy.io import loadmat
 from NLO.dynamic_models import AR2Model_single, SimpleModel
 from NLO.nodal_load_observer import IteratedExtendedKalman, LinearKalmanFilter
+from NLO.parallel import run_parallel
 import tools.profilesPV as ProfilePV
 from pypower.api import ppoption, runpf, makeYbus 
 from tools.load import convert_mcase, convert_to_python_indices
@@ -78,8 +79,14 @@ meas_unc = { "Vm": 1e-4*np.ones(nVMeas), "Va": 1e-4*np.ones(nVMeas) }
 
 
 
+# the runs for the different models are independent and carried out in parallel; all data except the model are
+# the same for all runs and placed in shared memory once
+specs = [dict(model=locals()["model_"+str(i)]) for i in range(nNodes-nPMeas)]
+shared = {"topology": topology, "Y": Yws, "meas": meas, "meas_unc": meas_unc, "meas_idx": meas_idx,
+          "pseudo_meas": pseudo_meas, "V0": Vhat0, "Vs": Vs}
+results = run_parallel(specs, shared=shared)
 for i in range(nNodes-nPMeas):
-    locals()["Shat_"+str(i)], locals()["Vhat_"+str(i)], uS, DeltaS, uDeltaS = IteratedExtendedKalman(topology, meas, meas_unc, meas_idx, pseudo_meas, locals()["model_"+str(i)],Vhat0,Vs,Y=Yws)
+    locals()["Shat_"+str(i)], locals()["Vhat_"+str(i)], uS, DeltaS, uDeltaS = results[i]
 
 NonMeasIdx = list(set(range(nNodes)) - set(PMeasIdx))
 
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Small synthetic test cases (see tools/synthetic_feeder.py) in the input format of the estimators
+"""
+
+import numpy as np
+
+from tools.synthetic_feeder import radial_feeder, branch_in_ohm, load_profiles, simulate, measurements
+from NLO.dynamic_models import SimpleModel, AR2Model_single
+from NLO.power_flow_equations import BranchList, BusPowerEquations, MeasurementEquations
+
+
+def make_model(n_pseudo, model="simple", q=1e-4):
+	"""Dynamic model for n_pseudo pseudo-measured values"""
+	if model == "ar2":
+		# the initial covariance is zero and the process noise of the lagged values is zero, such that the
+		# forecast covariance of the first time step is singular
+		return AR2Model_single(n_pseudo, phi1=0.6, phi2=0.3, noise=q)
+	model = SimpleModel(n_pseudo, alpha=0.95, q=q)
+	model.P0 = q*np.eye(n_pseudo)
+	return model
+
+
+def lkf_case(n_bus=15, nT=6, meter_density=0.3, model="simple", seed=0):
+	"""
+	Arguments of LinearKalmanFilter and IteratedExtendedKalman
+	:return: dict with the keyword arguments and the ground truth "S" and "V"
+	"""
+	casedata = radial_feeder(n_bus, seed=seed)
+	load, load_forecast = load_profiles(casedata, nT, seed=seed + 1)
+	truth = simulate(casedata, load)
+	meas, meas_unc, meas_idx, pseudo_meas = measurements(truth, casedata, load_forecast, meter_density=meter_density,
+														 seed=seed + 2)
+	nK = n_bus - 1
+	return {"topology": casedata, "meas": meas, "meas_unc": meas_unc, "meas_idx": meas_idx,
+			"pseudo_meas": pseudo_meas, "model": make_model(2*len(pseudo_meas["Pk"]), model),
+			"V0": np.r_[truth["Vs"][0, 0]*np.ones(nK), np.zeros(nK)], "Vs": truth["Vs"], "Y": truth["Y"],
+			"S": truth["S"], "V": truth["V"]}
+
+
+def nlo_extended_case(n_bus=15, nT=6, meter_density=0.3, seed=0):
+	"""
+	Arguments of NLOextended with measured bus power, line power and voltage magnitude (per phase, all buses
+	including the slack bus 0)
+	:return: dict with the keyword arguments and the ground truth "V"
+	"""
+	rng = np.random.RandomState(seed + 3)
+	casedata = radial_feeder(n_bus, seed=seed)
+	load, load_forecast = load_profiles(casedata, nT, seed=seed + 1)
+	truth = simulate(casedata, load)
+	nK = n_bus - 1
+	Vs = truth["Vs"][0]
+	V = np.r_[Vs[np.newaxis], truth["V"][:nK], np.zeros((1, nT)), truth["V"][nK:]]
+	topology = dict(casedata, branch=branch_in_ohm(casedata))
+	metered = np.sort(rng.choice(np.arange(1, n_bus), max(1, int(round(meter_density*nK))), replace=False))
+	lines = np.c_[topology["branch"][metered - 1, 0], metered].astype(int)
+	meas_idx = {"Pk": metered, "Qk": metered, "Vm": metered, "Pl": lines, "Ql": lines}
+	branches = BranchList.from_branch_data(topology["branch"], n_bus)
+	h = np.array([MeasurementEquations(n_bus, branches, meas_idx).evaluate(V[:, k]) for k in range(nT)]).T
+	S = np.array([BusPowerEquations(truth["Y"]).power(V[:, k]) for k in range(nT)]).T
+	nl = len(lines)
+	uVm = 1e-3*Vs.mean()
+	meas = {"Pk": S[:n_bus][metered], "Qk": S[n_bus:][metered], "Pl": h[:nl], "Ql": h[nl:2*nl],
+			"Vm": h[2*nl:] + uVm*rng.randn(len(metered), nT)}
+	meas_unc = {"Pk": 1e-4*np.ones(len(metered)), "Qk": 1e-4*np.ones(len(metered)), "Pl": 1e-4*np.ones(nl),
+				"Ql": 1e-4*np.ones(nl), "Vm": uVm*np.ones(len(metered))}
+	notmeas = np.setdiff1d(np.arange(n_bus), metered)
+	pseudo_meas = {"Pk": S[:n_bus][notmeas]*(1 + 0.1*rng.randn(len(notmeas), nT)),
+				   "Qk": S[n_bus:][notmeas]*(1 + 0.1*rng.randn(len(notmeas), nT))}
+	model = make_model(2*len(notmeas), q=np.mean((0.1*pseudo_meas["Pk"][notmeas > 0])**2))
+	return {"topology": topology, "meas": meas, "meas_unc": meas_unc, "meas_idx": meas_idx,
+			"pseudo_meas": pseudo_meas, "model": model, "V0": V[:, 0].copy(), "Y": truth["Y"], "V": V}
+
+
+def arguments(case, *names):
+	"""Keyword arguments of the estimator from a test case, with copies of the mutable measurement dicts"""
+	kwargs = dict((key, case[key]) for key in names)
+	for key in ["meas", "meas_unc", "meas_idx", "pseudo_meas"]:
+		if key in kwargs:
+			kwargs[key] = dict(kwargs[key])
+	return kwargs
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the batched Kalman filters (NLO/batch.py) against a loop over the scenarios
+"""
+
+import unittest
+
+import numpy as np
+
+from NLO.batch import BatchLinearKalmanFilter, BatchIteratedExtendedKalman, _forecast_unc
+from NLO.convergence import Criterion
+from NLO.nodal_load_observer import LinearKalmanFilter, IteratedExtendedKalman
+from tests.cases import lkf_case, make_model, arguments
+
+
+LKF_ARGS = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Vs", "Y"]
+
+
+def scenarios(case, nS, seed=0):
+	"""Pseudo-measurements of nS scenarios with 10 % random deviation"""
+	rng = np.random.RandomState(seed)
+	return dict((key, case["pseudo_meas"][key]*(1 + 0.1*rng.randn(nS, *case["pseudo_meas"][key].shape)))
+				for key in ["Pk", "Qk"])
+
+
+class ForecastTest(unittest.TestCase):
+
+	def test_stacked_forecast(self):
+		rng = np.random.RandomState(0)
+		for name in ["simple", "ar2"]:
+			model = make_model(6, name)
+			L = rng.randn(3, model.dim, model.dim)
+			P = np.matmul(L, np.transpose(L, (0, 2, 1)))
+			expected = np.array([model.forecast_unc(Ps) for Ps in P])
+			np.testing.assert_allclose(_forecast_unc(model, P), expected, rtol=1e-12, atol=1e-14)
+
+
+class BatchLinearKalmanFilterTest(unittest.TestCase):
+
+	def compare(self, case, pseudo, **kwargs):
+		nS = pseudo["Pk"].shape[0]
+		kw = arguments(case, *LKF_ARGS)
+		kw["pseudo_meas"] = pseudo
+		batch = BatchLinearKalmanFilter(**dict(kw, **kwargs))
+		for s in range(nS):
+			kw = arguments(case, *LKF_ARGS)
+			kw["pseudo_meas"] = dict((key, pseudo[key][s]) for key in pseudo)
+			single = LinearKalmanFilter(**dict(kw, **kwargs))
+			for res, ref in zip(batch, single):
+				np.testing.assert_allclose(res[s], ref, rtol=1e-9, atol=1e-12*np.abs(ref).max())
+
+	def test_scenarios(self):
+		case = lkf_case(meter_density=0.5)
+		self.compare(case, scenarios(case, 3))
+
+	def test_ar2_model(self):
+		case = lkf_case(meter_density=0.5, model="ar2")
+		self.compare(case, scenarios(case, 2))
+
+	def test_convergence(self):
+		case = lkf_case(meter_density=0.5)
+		self.compare(case, scenarios(case, 2), convergence={"voltage": Criterion(atol=1e-6, maxiter=3)})
+
+
+class BatchIteratedExtendedKalmanTest(unittest.TestCase):
+
+	def compare(self, case, pseudo, meas=None, **kwargs):
+		nS = pseudo["Pk"].shape[0]
+		kw = arguments(case, *LKF_ARGS)
+		kw["pseudo_meas"] = pseudo
+		if meas is not None:
+			kw["meas"] = meas
+		batch = BatchIteratedExtendedKalman(**dict(kw, **kwargs))
+		for s in range(nS):
+			kw = arguments(case, *LKF_ARGS)
+			kw["pseudo_meas"] = dict((key, pseudo[key][s]) for key in pseudo)
+			if meas is not None:
+				kw["meas"] = dict((key, meas[key][s]) for key in meas)
+			single = IteratedExtendedKalman(**dict(kw, **kwargs))
+			for res, ref in zip(batch, single):
+				np.testing.assert_allclose(res[s], ref, rtol=1e-9, atol=1e-12*np.abs(ref).max())
+
+	def test_scenarios(self):
+		case = lkf_case(meter_density=0.5)
+		self.compare(case, scenarios(case, 3))
+
+	def test_measurements(self):
+		case = lkf_case(meter_density=0.5)
+		rng = np.random.RandomState(1)
+		meas = dict((key, value*(1 + 1e-3*rng.randn(3, *value.shape))) for key, value in case["meas"].items())
+		self.compare(case, scenarios(case, 3), meas=meas)
+
+	def test_dense(self):
+		case = lkf_case(meter_density=0.5)
+		case["Y"] = case["Y"].toarray()
+		self.compare(case, scenarios(case, 2))
+
+	def test_ar2_model(self):
+		case = lkf_case(meter_density=0.5, model="ar2")
+		self.compare(case, scenarios(case, 2))
+
+	def test_convergence(self):
+		# the scenarios stop after different numbers of iterations
+		case = lkf_case(meter_density=0.5)
+		self.compare(case, scenarios(case, 3), convergence={"iekf": Criterion(atol=1e-6, maxiter=10)})
+
+	def test_missing_readings(self):
+		case = lkf_case(meter_density=0.5)
+		kw = arguments(case, *LKF_ARGS)
+		kw["meas"]["Vm"] = kw["meas"]["Vm"].copy()
+		kw["meas"]["Vm"][0, 2] = np.nan
+		self.assertRaises(ValueError, BatchIteratedExtendedKalman, **kw)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the convergence control (NLO/convergence.py) and of the convergence criteria of the estimators
+"""
+
+import unittest
+
+import numpy as np
+
+from NLO.convergence import Criterion, criteria
+from NLO.nodal_load_observer import IteratedExtendedKalman, NLOextended
+from tests.cases import lkf_case, nlo_extended_case, arguments
+from tests.test_nodal_load_observer import IEKF_ARGS, NLO_ARGS, assert_results_equal
+
+
+def run(crit, steps, x_norm=1.0, mismatches=None):
+	"""Check the steps until the criterion stops the loop"""
+	crit = crit.start()
+	for i, step in enumerate(steps):
+		if crit.check(step, x_norm, None if mismatches is None else mismatches[i]):
+			break
+	return crit
+
+
+class CriterionTest(unittest.TestCase):
+
+	def test_converged(self):
+		crit = run(Criterion(atol=1e-3, rtol=1e-2), [1., 0.1, 0.05, 0.01])
+		self.assertEqual(crit.reason, "converged")
+		self.assertEqual(crit.iterations, 4)
+		# the tolerance grows with the norm of the iterate
+		crit = run(Criterion(atol=1e-3, rtol=1e-2), [1., 0.1, 0.05, 0.01], x_norm=5.)
+		self.assertEqual(crit.iterations, 3)
+
+	def test_mismatch(self):
+		crit = run(Criterion(mismatch_tol=1e-6), [1., 0.1, 0.01], mismatches=[1., 1e-7, 0.])
+		self.assertEqual(crit.reason, "mismatch")
+		self.assertEqual(crit.info()["mismatch"], [1., 1e-7])
+
+	def test_stagnation(self):
+		steps = 1e-8*np.array([1., 0.5, 0.48, 0.47])
+		crit = run(Criterion(atol=1e-9, stagnation_window=2), steps)
+		self.assertEqual(crit.reason, "stagnation")
+		self.assertEqual(crit.iterations, 4)
+		self.assertTrue(crit.converged)
+		# without detection of stagnation the loop continues until maxiter
+		crit = run(Criterion(atol=1e-9, maxiter=4), steps)
+		self.assertEqual(crit.reason, "maxiter")
+		self.assertFalse(crit.converged)
+
+	def test_stagnation_round_off(self):
+		crit = run(Criterion(stagnation_window=2), 1e-15*np.array([1., 0.5, 0.48, 0.47]))
+		self.assertEqual(crit.reason, "stagnation")
+
+	def test_stagnation_far_from_tolerance(self):
+		# slow contraction far from the tolerance is not stopped for stagnation
+		crit = run(Criterion(atol=1e-9, maxiter=6, stagnation_window=2), [1., 0.5, 0.48, 0.47, 0.46, 0.45])
+		self.assertEqual(crit.reason, "maxiter")
+		self.assertEqual(crit.iterations, 6)
+		self.assertFalse(crit.converged)
+
+	def test_maxiter(self):
+		crit = run(Criterion(atol=1e-12, maxiter=5), [1.]*10)
+		self.assertEqual(crit.info(), {"iterations": 5, "history": [1.]*5, "reason": "maxiter"})
+
+	def test_start(self):
+		template = Criterion(atol=1e-3)
+		crit = run(template, [1., 1e-4])
+		self.assertEqual(crit.iterations, 2)
+		self.assertEqual(template.history, [])
+		self.assertIsNone(template.reason)
+		self.assertEqual(template.start().atol, 1e-3)
+
+	def test_criteria(self):
+		defaults = {"voltage": Criterion(atol=1e-9), "iekf": Criterion(atol=1e-6)}
+		custom = Criterion(atol=1e-3)
+		crits = criteria(defaults, {"iekf": custom})
+		self.assertIs(crits["iekf"], custom)
+		self.assertIs(crits["voltage"], defaults["voltage"])
+		self.assertIs(criteria(defaults)["iekf"], defaults["iekf"])
+		self.assertRaises(ValueError, criteria, defaults, {"newton": custom})
+
+
+class EstimatorCriteriaTest(unittest.TestCase):
+	"""Criteria equal to the defaults give the default estimate"""
+
+	def test_iterated_extended_kalman(self):
+		case = lkf_case(meter_density=0.5)
+		expected = IteratedExtendedKalman(**arguments(case, *IEKF_ARGS))
+		convergence = {"voltage": Criterion(atol=1e-9, maxiter=49), "iekf": Criterion(atol=1e-9, maxiter=49)}
+		result = IteratedExtendedKalman(convergence=convergence, **arguments(case, *IEKF_ARGS))
+		assert_results_equal(result, expected, rtol=1e-14)
+		self.assertRaises(ValueError, IteratedExtendedKalman, convergence={"newton": Criterion()},
+						  **arguments(case, *IEKF_ARGS))
+
+	def test_nlo_extended(self):
+		case = nlo_extended_case()
+		expected = NLOextended(**arguments(case, *NLO_ARGS))
+		convergence = {"voltage": Criterion(rtol=1e-12, maxiter=20, stagnation_window=2),
+					   "iekf": Criterion(atol=1e-9, maxiter=4)}
+		result = NLOextended(convergence=convergence, **arguments(case, *NLO_ARGS))
+		assert_results_equal(result, expected, rtol=1e-14)
+		# a looser tolerance of the iterations gives a close estimate
+		convergence = {"iekf": Criterion(atol=1e-6, maxiter=4)}
+		result = NLOextended(convergence=convergence, **arguments(case, *NLO_ARGS))
+		assert_results_equal(result, expected, rtol=1e-3)
+
+
+if __name__ == "__main__":
+	unittest.main()
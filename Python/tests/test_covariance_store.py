@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the containers for the posterior error covariance matrices (NLO/covariance_store.py)
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from NLO.covariance_store import LastCovariances, DiskCovariances
+from NLO.nodal_load_observer import NLOextended
+from tests.cases import nlo_extended_case, arguments
+from tests.test_nodal_load_observer import NLO_ARGS
+
+
+def matrices(nT, n=3):
+	return [t*np.eye(n) + np.ones((n, n)) for t in range(nT)]
+
+
+class CovarianceStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_last_covariances(self):
+		store = LastCovariances(k=2)
+		for P in matrices(5):
+			store.append(P)
+		self.assertEqual(len(store), 5)
+		np.testing.assert_array_equal(store[-1], matrices(5)[4])
+		np.testing.assert_array_equal(store[3], matrices(5)[3])
+		self.assertRaises(IndexError, store.__getitem__, 2)
+
+	def test_disk_covariances(self):
+		store = DiskCovariances(self.directory, chunk_size=2)
+		expected = matrices(5)
+		for t, P in enumerate(expected):
+			store.append(P)
+			# all matrices are available while appending, whether on disk or in the buffer
+			for s in range(t + 1):
+				np.testing.assert_array_equal(store[s], expected[s])
+		store.flush()
+		self.assertEqual(len(store), 5)
+		for t in range(-5, 5):
+			np.testing.assert_array_equal(store[t], expected[t])
+		self.assertRaises(IndexError, store.__getitem__, 5)
+
+	def test_nlo_extended(self):
+		case = nlo_extended_case()
+		expected = NLOextended(**arguments(case, *NLO_ARGS))
+		full, last, disk = [], LastCovariances(k=2), DiskCovariances(self.directory, chunk_size=4)
+		for store in [full, last, disk]:
+			result = NLOextended(covariances=store, **arguments(case, *NLO_ARGS))
+			for res, ref in zip(result, expected):
+				np.testing.assert_array_equal(res, ref)
+			self.assertEqual(len(store), case["V"].shape[1])
+		# the uncertainties of time step k are stored in column k-1
+		uDeltaS = np.roll(expected[4], 1, axis=1)
+		for t, P in enumerate(full):
+			np.testing.assert_allclose(np.sqrt(np.diag(P)), uDeltaS[:, t], rtol=1e-14)
+			np.testing.assert_array_equal(disk[t], P)
+		np.testing.assert_array_equal(last[-1], full[-1])
+
+
+if __name__ == "__main__":
+	unittest.main()
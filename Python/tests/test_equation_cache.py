@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the on-disk cache of the symbolic network equations (NLO/equation_cache.py)
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from NLO import equation_cache
+from NLO.nodal_load_observer import network_equations, calc_admittance
+from tests.cases import nlo_extended_case
+
+
+def sources(value):
+	"""Source code of trivial evaluators for a network of two buses"""
+	return dict((name, "def %s(V):\n\treturn array([%r])\n" % (name, value)) for name in equation_cache.function_names)
+
+
+class EquationCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def entries(self):
+		return sorted(fname for fname in os.listdir(self.directory) if fname.endswith(".eqc"))
+
+	def test_round_trip(self):
+		self.assertIsNone(equation_cache.load("missing", self.directory))
+		stored = equation_cache.store("key", sources(1.5), self.directory)
+		loaded = equation_cache.load("key", self.directory)
+		for f, g in zip(stored, loaded):
+			np.testing.assert_array_equal(g(np.ones(4)), f(np.ones(4)))
+		self.assertEqual(self.entries(), ["key.eqc"])
+
+	def test_invalid_entries(self):
+		equation_cache.store("key", sources(1.5), self.directory)
+		fname = os.path.join(self.directory, "key.eqc")
+		with open(fname, "rb") as f:
+			data = f.read()
+		n = len(equation_cache.header)
+		# entries of another interpreter version and corrupted entries are ignored
+		for invalid in [b"\0"*n + data[n:], data[:-1] + chr(ord(data[-1]) ^ 1), data[:n + 40]]:
+			with open(fname, "wb") as f:
+				f.write(invalid)
+			self.assertIsNone(equation_cache.load("key", self.directory))
+
+	def test_untrusted_directory(self):
+		equation_cache.store("key", sources(1.5), self.directory)
+		os.chmod(self.directory, 0o777)
+		self.assertIsNone(equation_cache.load("key", self.directory))
+		funcs = equation_cache.store("other", sources(2.5), self.directory)
+		np.testing.assert_array_equal(funcs[0](np.ones(4)), [2.5])
+		self.assertEqual(self.entries(), ["key.eqc"])
+
+	def test_failed_write(self):
+		def rename(src, dst):
+			raise OSError("rename failed")
+		default_rename = equation_cache.os.rename
+		equation_cache.os.rename = rename
+		try:
+			funcs = equation_cache.store("key", sources(1.5), self.directory)
+		finally:
+			equation_cache.os.rename = default_rename
+		np.testing.assert_array_equal(funcs[0](np.ones(4)), [1.5])
+		# no temporary files are left behind
+		self.assertEqual(os.listdir(self.directory), [])
+
+	def test_key(self):
+		case = nlo_extended_case(n_bus=6)
+		Y, y, cap = calc_admittance(case["topology"]["branch"])
+		meas_idx = case["meas_idx"]
+		key = equation_cache.equations_key(Y, y, cap, 6, meas_idx)
+		self.assertEqual(equation_cache.equations_key(Y.copy(), y, cap, 6, dict(meas_idx)), key)
+		self.assertNotEqual(equation_cache.equations_key(Y, y, cap, 6, dict(meas_idx, Vm=meas_idx["Vm"][:-1])), key)
+		self.assertNotEqual(equation_cache.equations_key(Y, 2*y, cap, 6, meas_idx), key)
+
+	def test_evict(self):
+		for i, name in enumerate(["a", "b", "c"]):
+			equation_cache.store(name, sources(float(i)), self.directory)
+			os.utime(os.path.join(self.directory, name + ".eqc"), (i, i))
+		equation_cache.load("a", self.directory) 	# "a" is now the most recently used entry
+		size = os.path.getsize(os.path.join(self.directory, "a.eqc"))
+		equation_cache.evict(self.directory, max_size=2*size)
+		self.assertEqual(self.entries(), ["a.eqc", "c.eqc"])
+		equation_cache.clear(self.directory)
+		self.assertEqual(self.entries(), [])
+
+	def test_network_equations(self):
+		case = nlo_extended_case(n_bus=6, meter_density=0.5)
+		Y, y, cap = calc_admittance(case["topology"]["branch"])
+		V = case["V"][:, 1]
+		expected = network_equations(Y, y, cap, 6, case["meas_idx"], symbolic=True, use_cache=False)
+		stored = network_equations(Y, y, cap, 6, case["meas_idx"], symbolic=True, cache_dir=self.directory)
+		self.assertEqual(len(self.entries()), 1)
+		loaded = network_equations(Y, y, cap, 6, case["meas_idx"], symbolic=True, cache_dir=self.directory)
+		# the cached evaluators are generated from the printed expressions instead of lambdify
+		for f, g, h in zip(expected, stored, loaded):
+			np.testing.assert_allclose(g(V), f(V), rtol=1e-12, atol=1e-12*np.abs(f(V)).max())
+			np.testing.assert_array_equal(h(V), g(V))
+
+
+if __name__ == "__main__":
+	unittest.main()
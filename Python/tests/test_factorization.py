@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the factorization of the network matrices (NLO/factorization.py)
+"""
+
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from NLO import factorization
+from NLO.factorization import Factorization, factorize, matrix_hash
+
+
+def random_matrix(n, seed=0):
+	rng = np.random.RandomState(seed)
+	return rng.randn(n, n) + n*np.eye(n)
+
+
+class FactorizationTest(unittest.TestCase):
+
+	def setUp(self):
+		factorization.clear_cache()
+
+	def test_solve(self):
+		A = random_matrix(6)
+		b = np.arange(12.).reshape(6, 2)
+		for M in [A, csr_matrix(A)]:
+			fac = Factorization(M)
+			np.testing.assert_allclose(fac.solve(b), np.linalg.solve(A, b), rtol=1e-12)
+			np.testing.assert_allclose(fac.solve(b[:, 0], trans=True), np.linalg.solve(A.T, b[:, 0]), rtol=1e-12)
+			np.testing.assert_allclose(fac.solve(csr_matrix(b)), np.linalg.solve(A, b), rtol=1e-12)
+
+	def test_cache(self):
+		A = random_matrix(5)
+		fac = factorize(A)
+		self.assertIs(factorize(A.copy()), fac)
+		self.assertIsNot(factorize(A, use_cache=False), fac)
+		self.assertIs(factorize(fac), fac)
+		factorization.clear_cache()
+		self.assertIsNot(factorize(A), fac)
+
+	def test_cache_size(self):
+		matrices = [random_matrix(4, seed) for seed in range(factorization.max_cached_factorizations + 1)]
+		first = factorize(matrices[0])
+		for A in matrices[1:]:
+			factorize(A)
+		self.assertEqual(len(factorization._cache), factorization.max_cached_factorizations)
+		self.assertIsNot(factorize(matrices[0]), first)
+
+	def test_hash(self):
+		A = random_matrix(4)
+		self.assertEqual(matrix_hash(csr_matrix(A)), matrix_hash(csr_matrix(A).tocsc()))
+		B = A.copy()
+		B[0, 0] += 1e-12
+		self.assertNotEqual(matrix_hash(A), matrix_hash(B))
+
+
+if __name__ == "__main__":
+	unittest.main()
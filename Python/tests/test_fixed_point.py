@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the fixed point iteration (NLO/fixed_point.py)
+"""
+
+import unittest
+
+import numpy as np
+
+from NLO.convergence import Criterion
+from NLO.fixed_point import fixed_point
+
+
+def linear_contraction(n=8, rho=0.9, seed=0):
+	"""g(x) = A x + b with spectral radius rho of A and the solution of x = g(x)"""
+	rng = np.random.RandomState(seed)
+	Q = np.linalg.qr(rng.randn(n, n))[0]
+	A = np.dot(Q*np.linspace(-rho, rho, n), Q.T)
+	b = rng.randn(n)
+	return (lambda x: np.dot(A, x) + b), np.linalg.solve(np.eye(n) - A, b)
+
+
+class FixedPointTest(unittest.TestCase):
+
+	def test_methods(self):
+		g, expected = linear_contraction()
+		x_picard, info_picard = fixed_point(g, np.zeros(len(expected)), maxiter=1000, method="picard")
+		x_anderson, info_anderson = fixed_point(g, np.zeros(len(expected)), maxiter=1000)
+		for x, info in [(x_picard, info_picard), (x_anderson, info_anderson)]:
+			self.assertEqual(info["reason"], "converged")
+			np.testing.assert_allclose(x, expected, rtol=1e-10)
+		self.assertLess(info_anderson["iterations"], info_picard["iterations"])
+
+	def test_maxiter(self):
+		g, expected = linear_contraction()
+		x, info = fixed_point(g, np.zeros(len(expected)), maxiter=3, method="picard")
+		self.assertEqual(info["reason"], "maxiter")
+		self.assertEqual(info["iterations"], 3)
+		np.testing.assert_allclose(x, g(g(g(np.zeros(len(expected))))), rtol=1e-14)
+
+	def test_criterion(self):
+		g, expected = linear_contraction()
+		x, info = fixed_point(g, np.zeros(len(expected)), criterion=Criterion(atol=0, rtol=1e-8, maxiter=1000))
+		self.assertEqual(info["reason"], "converged")
+		np.testing.assert_allclose(x, expected, rtol=1e-6)
+
+	def test_unknown_method(self):
+		g, expected = linear_contraction()
+		self.assertRaises(ValueError, fixed_point, g, np.zeros(len(expected)), method="newton")
+
+
+if __name__ == "__main__":
+	unittest.main()
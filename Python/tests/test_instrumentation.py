@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the per-step instrumentation (NLO/instrumentation.py)
+"""
+
+import unittest
+
+import numpy as np
+
+from NLO.instrumentation import StepProfile
+from NLO.nodal_load_observer import LinearKalmanFilter, IteratedExtendedKalman, NLOextended
+from tests.cases import lkf_case, nlo_extended_case, arguments
+from tests.test_nodal_load_observer import LKF_ARGS, IEKF_ARGS, NLO_ARGS
+
+
+class StepProfileTest(unittest.TestCase):
+
+	def test_growth(self):
+		profile = StepProfile(2)
+		for k in range(5):
+			profile.add_iterations("voltage", k, k + 1)
+			profile.set_value("residual", k, 0.5*k)
+			profile.end_step(k)
+		self.assertEqual(profile.steps, 5)
+		results = profile.results()
+		np.testing.assert_array_equal(results["iterations"]["voltage"], [1, 2, 3, 4, 5])
+		np.testing.assert_array_equal(results["values"]["residual"], [0., 0.5, 1., 1.5, 2.])
+		summary = profile.summary()
+		self.assertEqual(summary["iterations"]["voltage"], {"mean": 3., "max": 5})
+		self.assertEqual(summary["values"]["residual"], {"max": 2.})
+
+	def test_time(self):
+		profile = StepProfile(1)
+		start = profile.tic()
+		profile.toc("gain", 0, start)
+		profile.toc("gain", 0, start)
+		profile.end_step(0)
+		self.assertGreater(profile.results()["time"]["gain"][0], 0.)
+		self.assertEqual(profile.summary()["time"]["gain"]["total"], profile.results()["time"]["gain"][0])
+
+	def test_callback(self):
+		records = []
+		profile = StepProfile(callback=lambda k, record: records.append((k, record)))
+		profile.add_iterations("iekf", 0, 3)
+		profile.end_step(0)
+		profile.set_value("condition", 1, 10.)
+		profile.end_step(1)
+		self.assertEqual([k for k, _ in records], [0, 1])
+		self.assertEqual(records[0][1]["iterations"], {"iekf": 3})
+		self.assertEqual(records[1][1]["values"], {"condition": 10.})
+
+
+class EstimatorProfileTest(unittest.TestCase):
+	"""Recording a profile does not change the estimates"""
+
+	def compare(self, estimator, case, names, loops):
+		expected = estimator(**arguments(case, *names))
+		nT = expected[0].shape[1]
+		for condition in [False, True]:
+			profile = StepProfile(nT, condition=condition)
+			result = estimator(profile=profile, **arguments(case, *names))
+			for res, ref in zip(result, expected):
+				np.testing.assert_array_equal(res, ref)
+			self.assertEqual(profile.steps, nT)
+			for loop in loops:
+				self.assertTrue(np.all(profile.results()["iterations"][loop] > 0), loop)
+			# the condition number is estimated only on request
+			values = profile.results()["values"]
+			self.assertEqual("condition" in values, condition)
+			if condition:
+				self.assertTrue(np.all(values["condition"] >= 1))
+
+	def test_linear_kalman_filter(self):
+		self.compare(LinearKalmanFilter, lkf_case(meter_density=0.5), LKF_ARGS, ["voltage"])
+
+	def test_iterated_extended_kalman(self):
+		self.compare(IteratedExtendedKalman, lkf_case(meter_density=0.5), IEKF_ARGS, ["voltage", "iekf"])
+
+	def test_nlo_extended(self):
+		self.compare(NLOextended, nlo_extended_case(), NLO_ARGS, ["iekf"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the linear algebra of the Kalman filter correction step (NLO/kalman_update.py) and of the filter forms
+of the estimators
+"""
+
+import unittest
+
+import numpy as np
+
+from NLO.kalman_update import kalman_gain, information_matrix, InformationUpdate, sequential_update, add_noise, \
+	noise_solve, innovation_solve, condition_estimate
+from NLO.nodal_load_observer import IteratedExtendedKalman, NLOextended
+from tests.cases import lkf_case, nlo_extended_case, arguments
+
+
+IEKF_ARGS = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Vs", "Y"]
+NLO_ARGS = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Y"]
+
+
+def random_problem(n, m, seed=0):
+	rng = np.random.RandomState(seed)
+	L = rng.randn(n, n)
+	P = np.dot(L, L.T) + n*np.eye(n)
+	H = rng.randn(m, n)
+	R = 0.1 + rng.rand(m)
+	return P, H, R
+
+
+class SolveTest(unittest.TestCase):
+	"""Cholesky-based solves against the pseudo-inverse"""
+
+	def noise_forms(self):
+		rng = np.random.RandomState(1)
+		U11, U22 = 1 + rng.rand(3), 1 + rng.rand(3)
+		U12 = 0.1*rng.randn(3)
+		blocks = add_noise(np.zeros((6, 6)), (U11, U12, U22))
+		L = rng.randn(6, 6)
+		dense = np.dot(L, L.T) + np.eye(6)
+		return [(np.diag(U11.repeat(2)), U11.repeat(2)), (blocks, (U11, U12, U22)), (dense, dense)]
+
+	def test_noise(self):
+		A = np.random.RandomState(2).randn(6, 4)
+		for Rdense, R in self.noise_forms():
+			np.testing.assert_allclose(add_noise(np.eye(6), R), np.eye(6) + Rdense, rtol=1e-14)
+			np.testing.assert_allclose(noise_solve(R, A), np.dot(np.linalg.pinv(Rdense), A), rtol=1e-10)
+			np.testing.assert_allclose(noise_solve(R, A[:, 0]), np.dot(np.linalg.pinv(Rdense), A[:, 0]), rtol=1e-10)
+
+	def test_innovation_solve(self):
+		P, H, R = random_problem(4, 6)
+		S = np.dot(H, np.dot(P, H.T)) + np.diag(R)
+		B = np.arange(12.).reshape(6, 2)
+		np.testing.assert_allclose(innovation_solve(S, B), np.dot(np.linalg.pinv(S), B), rtol=1e-10)
+		# indefinite and singular matrices
+		for S in [np.diag([1., -2., 3.]), np.diag([1., 0., 3.])]:
+			np.testing.assert_allclose(innovation_solve(S, np.ones(3)), np.dot(np.linalg.pinv(S), np.ones(3)))
+
+
+	def test_condition_estimate(self):
+		P, H, R = random_problem(4, 6)
+		S = np.dot(H, np.dot(P, H.T)) + np.diag(R)
+		cond = np.linalg.cond(S, 1)
+		# the estimate is a lower bound which is typically within a factor of 3
+		self.assertTrue(cond/3 <= condition_estimate(S) <= cond*(1 + 1e-10))
+		self.assertEqual(condition_estimate(np.diag([1., 0.])), np.inf)
+
+
+class KalmanGainTest(unittest.TestCase):
+
+	def reference(self, P, H, R):
+		return np.dot(np.dot(P, H.T), np.linalg.inv(np.dot(H, np.dot(P, H.T)) + np.diag(R)))
+
+	def test_sides(self):
+		for n, m in [(6, 3), (3, 6)]:
+			P, H, R = random_problem(n, m)
+			K = self.reference(P, H, R)
+			for side in ["measurement", "state", "auto"]:
+				np.testing.assert_allclose(kalman_gain(P, H, R, side=side), K, rtol=1e-10, atol=1e-12)
+
+	def test_block_noise(self):
+		P, H, R = random_problem(4, 6)
+		U11, U22, U12 = R[:3], R[3:], 0.01*np.ones(3)
+		Rdense = np.diag(R)
+		idx = np.arange(3)
+		Rdense[idx, idx + 3] = Rdense[idx + 3, idx] = U12
+		K = np.dot(np.dot(P, H.T), np.linalg.inv(np.dot(H, np.dot(P, H.T)) + Rdense))
+		for side in ["measurement", "state"]:
+			np.testing.assert_allclose(kalman_gain(P, H, (U11, U12, U22), side=side), K, rtol=1e-10, atol=1e-12)
+
+	def test_singular_covariance(self):
+		P, H, R = random_problem(4, 6)
+		P[0] = P[:, 0] = 0.
+		K = self.reference(P, H, R)
+		self.assertRaises(np.linalg.LinAlgError, information_matrix, P, fallback=False)
+		np.testing.assert_allclose(kalman_gain(P, H, R, side="state"), K, rtol=1e-10, atol=1e-12)
+
+
+class InformationUpdateTest(unittest.TestCase):
+
+	def test_correction(self):
+		P, H, R = random_problem(4, 6)
+		z = np.arange(6.)
+		update = InformationUpdate(information_matrix(P), H, R)
+		K = kalman_gain(P, H, R, side="measurement")
+		np.testing.assert_allclose(update.gain(), K, rtol=1e-10, atol=1e-12)
+		np.testing.assert_allclose(update.correction(z), np.dot(K, z), rtol=1e-10, atol=1e-12)
+		np.testing.assert_allclose(update.covariance(), P - np.dot(K, np.dot(H, P)), rtol=1e-8, atol=1e-10)
+
+	def test_indefinite_matrix(self):
+		# A is not positive definite, such that the Cholesky factorization fails
+		update = InformationUpdate(-np.eye(3), np.zeros((2, 3)), np.ones(2))
+		self.assertIsNone(update.fac)
+		np.testing.assert_allclose(update.covariance(), -np.eye(3))
+
+	def test_singular_matrix(self):
+		update = InformationUpdate(np.zeros((3, 3)), np.c_[np.eye(2), np.zeros(2)], np.ones(2))
+		np.testing.assert_allclose(update.covariance(), np.diag([1., 1., 0.]), atol=1e-12)
+
+
+class SequentialUpdateTest(unittest.TestCase):
+
+	def test_equivalence(self):
+		P, H, R = random_problem(4, 6)
+		x = np.ones(4)
+		y = np.arange(6.)
+		K = kalman_gain(P, H, R)
+		xs, Ps = sequential_update(x, P, H, R, y)
+		np.testing.assert_allclose(xs, x + np.dot(K, y - np.dot(H, x)), rtol=1e-10)
+		np.testing.assert_allclose(Ps, P - np.dot(K, np.dot(H, P)), rtol=1e-8, atol=1e-10)
+
+	def test_missing_values(self):
+		P, H, R = random_problem(4, 6)
+		x = np.ones(4)
+		y = np.arange(6.)
+		y[2] = np.nan
+		keep = np.isfinite(y)
+		xs, Ps = sequential_update(x, P, H, R, y)
+		xr, Pr = sequential_update(x, P, H[keep], R[keep], y[keep])
+		np.testing.assert_allclose(xs, xr, rtol=1e-12)
+		np.testing.assert_allclose(Ps, Pr, rtol=1e-12)
+
+
+class FilterFormTest(unittest.TestCase):
+	"""The filter forms of the estimators give the result of the covariance form"""
+
+	def compare(self, estimator, case, names, forms, rtol=1e-6):
+		reference = estimator(filter_form="covariance", **arguments(case, *names))
+		for form in forms:
+			result = estimator(filter_form=form, **arguments(case, *names))
+			for ref, res in zip(reference, result):
+				np.testing.assert_allclose(res, ref, rtol=rtol, atol=1e-8*np.abs(ref).max(), err_msg=form)
+
+	def test_iterated_extended_kalman(self):
+		self.compare(IteratedExtendedKalman, lkf_case(meter_density=0.8), IEKF_ARGS, ["information", "sequential"])
+
+	def test_information_singular_forecast(self):
+		# AR(2) model with zero initial covariance; the forecast covariance is singular
+		case = lkf_case(meter_density=0.8, model="ar2")
+		self.compare(IteratedExtendedKalman, case, IEKF_ARGS, ["information", "auto"])
+
+	def test_nlo_extended(self):
+		self.compare(NLOextended, nlo_extended_case(), NLO_ARGS, ["information", "sequential"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the Monte Carlo uncertainty propagation (NLO/monte_carlo.py)
+"""
+
+import unittest
+
+import numpy as np
+
+from NLO.monte_carlo import RunningStatistics, monte_carlo
+from tests.cases import lkf_case, nlo_extended_case, arguments
+
+
+def pseudo_uncertainty(case):
+	return dict((key, 0.1*np.abs(case["pseudo_meas"][key])) for key in ["Pk", "Qk"])
+
+
+class RunningStatisticsTest(unittest.TestCase):
+
+	def test_batches(self):
+		X = np.random.RandomState(0).randn(50, 3, 2)
+		stats = RunningStatistics(covariance=True, bins=0)
+		for i in range(0, 50, 15):
+			stats.update(X[i:i + 15])
+		np.testing.assert_allclose(stats.mean, X.mean(axis=0))
+		np.testing.assert_allclose(stats.std, X.std(axis=0, ddof=1))
+		np.testing.assert_allclose(stats.cov[1], np.cov(X[:, :, 1].T))
+
+	def test_interval(self):
+		X = np.random.RandomState(0).randn(20000, 1, 1)
+		stats = RunningStatistics()
+		stats.update(X)
+		lower, upper = stats.interval(0.95)
+		self.assertAlmostEqual(lower[0, 0], -1.96, delta=0.05)
+		self.assertAlmostEqual(upper[0, 0], 1.96, delta=0.05)
+
+
+class MonteCarloTest(unittest.TestCase):
+
+	def run_estimator(self, estimator, case, names, **kwargs):
+		kw = arguments(case, *names)
+		V0 = kw["V0"].copy()
+		stats = monte_carlo(pseudo_unc=pseudo_uncertainty(case), draws=6, batch_size=4, estimator=estimator, seed=1,
+							bins=0, **dict(kw, **kwargs))
+		self.assertEqual(stats["V"].count, 6)
+		self.assertTrue(np.all(np.isfinite(stats["V"].mean)))
+		self.assertTrue(np.all(np.isfinite(stats["S"].std)))
+		np.testing.assert_array_equal(kw["V0"], V0)
+		return stats
+
+	def test_estimators(self):
+		case = lkf_case(meter_density=0.5)
+		names = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Vs", "Y"]
+		self.run_estimator("LinearKalmanFilter", case, names)
+		self.run_estimator("IteratedExtendedKalman", case, names)
+		case = nlo_extended_case()
+		names = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Y"]
+		self.run_estimator("NLOextended", case, names)
+
+	def test_batched_iterated_filter(self):
+		case = lkf_case(meter_density=0.5)
+		names = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Vs", "Y"]
+		batched = self.run_estimator("IteratedExtendedKalman", case, names)
+		# options which the batched filter does not support fall back to the evaluation of each draw
+		loop = self.run_estimator("IteratedExtendedKalman", case, names, jacobian_update="full")
+		for q in ["S", "V"]:
+			np.testing.assert_allclose(batched[q].mean, loop[q].mean, rtol=1e-9)
+			np.testing.assert_allclose(batched[q].std, loop[q].std, rtol=1e-6, atol=1e-9*np.abs(loop[q].std).max())
+
+	def test_read_only_initial_estimate(self):
+		case = nlo_extended_case()
+		case["V0"].flags.writeable = False
+		names = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Y"]
+		self.run_estimator("NLOextended", case, names)
+
+	def test_processes(self):
+		case = lkf_case(meter_density=0.5)
+		names = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Vs", "Y"]
+		single = self.run_estimator("LinearKalmanFilter", case, names)
+		parallel = self.run_estimator("LinearKalmanFilter", case, names, processes=2)
+		np.testing.assert_allclose(parallel["V"].mean, single["V"].mean, rtol=1e-12)
+		np.testing.assert_allclose(parallel["V"].std, single["V"].std, rtol=1e-10)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the options of the estimators in NLO/nodal_load_observer.py against their default
+"""
+
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from NLO import nodal_load_observer
+from NLO.instrumentation import StepProfile
+from NLO.nodal_load_observer import LinearKalmanFilter, IteratedExtendedKalman, NLOextended, hold_missing, \
+	jacobian, bus_power, JacobianPattern, amph_phase_to_real_imag, amph_phase_to_real_imag_batch, \
+	block_covariance_to_dense, MeasurementLayout, construct_meas_vector, meas_at_time, repair_meas, \
+	StreamingIteratedExtendedKalman
+from tools.data_tools import separate_Yslack
+from tests.cases import lkf_case, nlo_extended_case, arguments
+
+
+LKF_ARGS = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Vs", "Y"]
+IEKF_ARGS = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Vs", "Y"]
+NLO_ARGS = ["topology", "meas", "meas_unc", "meas_idx", "pseudo_meas", "model", "V0", "Y"]
+
+
+def assert_results_equal(result, reference, rtol=1e-6, msg=""):
+	for name, res, ref in zip(["Shat", "Vhat", "uShat", "DeltaS", "uDeltaS"], result, reference):
+		np.testing.assert_allclose(res, ref, rtol=rtol, atol=rtol*np.abs(ref).max(), err_msg="%s %s" % (msg, name))
+
+
+def with_unc_2d(kwargs, keys):
+	for key in keys:
+		unc = np.asarray(kwargs["meas_unc"][key], dtype=float)
+		kwargs["meas_unc"][key] = np.tile(unc, (kwargs["meas"][key].shape[1], 1)).T
+	return kwargs
+
+
+def finite_differences(f, x, h=1e-6):
+	"""Jacobian of f at x by central differences"""
+	return np.array([(f(x + h*e) - f(x - h*e))/(2*h) for e in np.eye(len(x))]).T
+
+
+class JacobianTest(unittest.TestCase):
+
+	def setUp(self):
+		case = lkf_case()
+		self.Y00, self.Ys = separate_Yslack(case["Y"], 0, sparse=True)
+		self.V = case["V"][:, 0]
+		self.Vs = np.array([case["Vs"][0, 0], 0.0])
+
+	def test_finite_differences(self):
+		Y00, Ys = self.Y00.toarray(), self.Ys.toarray()
+		expected = finite_differences(lambda V: bus_power(Y00, Ys, V, self.Vs), self.V)
+		Dh = jacobian(Y00, Ys, self.V, self.Vs)
+		np.testing.assert_allclose(Dh, expected, rtol=1e-6, atol=1e-6*np.abs(expected).max())
+
+	def test_pattern(self):
+		expected = jacobian(self.Y00.toarray(), self.Ys.toarray(), self.V, self.Vs)
+		Dh = jacobian(self.Y00, self.Ys, self.V, self.Vs, JacobianPattern(self.Y00, self.Ys))
+		np.testing.assert_allclose(Dh.toarray(), expected, rtol=1e-12, atol=1e-12*np.abs(expected).max())
+
+
+class AmplitudePhaseTest(unittest.TestCase):
+	"""Conversion of voltage measurements for all time steps at once against the conversion per element"""
+
+	def setUp(self):
+		rng = np.random.RandomState(0)
+		self.A = 230*(1 + 0.05*rng.rand(4, 3))
+		self.P = 0.1*rng.randn(4, 3)
+		self.Ua = (0.5*rng.rand(4, 3))**2
+		self.Up = (1e-3*rng.rand(4, 3))**2
+
+	def test_batch(self):
+		Re, Im, URI = amph_phase_to_real_imag_batch(self.A, self.P, self.Ua, self.Up)
+		N = self.A.shape[0]
+		for k in range(self.A.shape[1]):
+			U = block_covariance_to_dense(URI, k)
+			for i in range(N):
+				A, P = self.A[i, k], self.P[i, k]
+				C = np.array([[np.cos(P), -A*np.sin(P)], [np.sin(P), A*np.cos(P)]])
+				expected = np.dot(C, np.dot(np.diag([self.Ua[i, k], self.Up[i, k]]), C.T))
+				np.testing.assert_allclose([Re[i, k], Im[i, k]], A*np.array([np.cos(P), np.sin(P)]), rtol=1e-14)
+				np.testing.assert_allclose(U[np.ix_([i, N + i], [i, N + i])], expected, rtol=1e-12)
+			self.assertEqual(np.count_nonzero(U), 4*N)
+
+	def test_single_time_step(self):
+		Re, Im, URI = amph_phase_to_real_imag_batch(self.A, self.P, self.Ua, self.Up)
+		for k in range(self.A.shape[1]):
+			re, im, U = amph_phase_to_real_imag(self.A[:, k], self.P[:, k], self.Ua[:, k], self.Up[:, k])
+			np.testing.assert_array_equal(re, Re[:, k])
+			np.testing.assert_array_equal(im, Im[:, k])
+			np.testing.assert_array_equal(U, block_covariance_to_dense(URI, k))
+
+
+class MeasurementLayoutTest(unittest.TestCase):
+	"""Measurements assembled once for all time steps against the assembly per time step"""
+
+	names = ["Pk", "Qk", "Pl", "Ql", "Vm", "Va"]
+
+	def setUp(self):
+		case = nlo_extended_case()
+		kwargs = with_unc_2d(arguments(case, "meas", "meas_unc", "meas_idx"), ["Pk", "Qk", "Pl", "Ql", "Vm"])
+		self.meas, self.meas_idx, self.meas_unc = repair_meas(kwargs["meas"], kwargs["meas_idx"], kwargs["meas_unc"],
+															   expected_indices=self.names)
+
+	def test_time_steps(self):
+		layout = MeasurementLayout(self.meas, self.meas_unc, self.names)
+		for k in range(layout.nT):
+			Meas, R, _ = construct_meas_vector(*meas_at_time(self.meas, self.meas_unc, k, self.names),
+											   meas_names=self.names)
+			np.testing.assert_array_equal(layout.values[:, k], Meas)
+			np.testing.assert_array_equal(np.diag(layout.variances[:, k]), R)
+			np.testing.assert_array_equal(layout.get("Vm", k), self.meas["Vm"][:, k])
+
+	def test_slices(self):
+		layout = MeasurementLayout(self.meas, self.meas_unc, self.names)
+		self.assertEqual(layout.names, ["Pk", "Qk", "Pl", "Ql", "Vm"])
+		Meas = np.concatenate([self.meas[key][:, 0] for key in layout.names])
+		for key, sl in layout.slices.items():
+			np.testing.assert_array_equal(Meas[sl], self.meas[key][:, 0])
+
+	def test_constant_uncertainty(self):
+		meas_unc = dict((key, 0.01) for key in self.names)
+		layout = MeasurementLayout(self.meas, meas_unc, self.names)
+		for k in range(layout.nT):
+			meas_k = meas_at_time(self.meas, self.meas_unc, k, self.names)[0]
+			_, R, _ = construct_meas_vector(meas_k, meas_unc, meas_names=self.names)
+			np.testing.assert_array_equal(np.diag(layout.variances[:, k]), R)
+
+
+class SparseTest(unittest.TestCase):
+	"""Estimators with sparse admittance matrix give the results of the dense admittance matrix"""
+
+	def compare(self, estimator, case, names, **kwargs):
+		dense = arguments(case, *names)
+		dense["Y"] = case["Y"].toarray()
+		expected = estimator(**dict(dense, **kwargs))
+		sparse = arguments(case, *names)
+		sparse["Y"] = csr_matrix(case["Y"])
+		assert_results_equal(estimator(**dict(sparse, **kwargs)), expected, rtol=1e-9)
+
+	def test_linear_kalman_filter(self):
+		self.compare(LinearKalmanFilter, lkf_case(meter_density=0.5), LKF_ARGS)
+
+	def test_iterated_extended_kalman(self):
+		self.compare(IteratedExtendedKalman, lkf_case(meter_density=0.5), IEKF_ARGS)
+		self.compare(IteratedExtendedKalman, lkf_case(meter_density=0.5), IEKF_ARGS, sparse=False)
+
+	def test_nlo_extended(self):
+		self.compare(NLOextended, nlo_extended_case(), NLO_ARGS)
+
+
+class MissingReadingsTest(unittest.TestCase):
+	"""Missing readings (NaN) are left out, which is equivalent to a reading with very large uncertainty"""
+
+	def test_hold_missing(self):
+		S = np.array([[1., np.nan, np.nan, 4.], [1., 2., np.nan, 3.]])
+		np.testing.assert_array_equal(hold_missing(S), [[1., 1., 1., 4.], [1., 2., 2., 3.]])
+		self.assertRaises(ValueError, hold_missing, np.array([[np.nan, 1.]]))
+
+	def test_iterated_extended_kalman(self):
+		case = lkf_case(meter_density=0.5)
+		reference = with_unc_2d(arguments(case, *IEKF_ARGS), ["Vm", "Va"])
+		reference["meas"]["Vm"] = case["meas"]["Vm"].copy()
+		reference["meas_unc"]["Vm"][0, 2] = reference["meas_unc"]["Va"][0, 2] = 1e8
+		reference["meas"]["Pk"] = case["meas"]["Pk"].copy()
+		reference["meas"]["Pk"][0, 3] = reference["meas"]["Pk"][0, 2]
+		expected = IteratedExtendedKalman(**reference)
+		for form in ["covariance", "information", "sequential"]:
+			kwargs = arguments(case, *IEKF_ARGS)
+			kwargs["meas"]["Vm"] = case["meas"]["Vm"].copy()
+			kwargs["meas"]["Vm"][0, 2] = np.nan
+			kwargs["meas"]["Pk"] = case["meas"]["Pk"].copy()
+			kwargs["meas"]["Pk"][0, 3] = np.nan
+			result = IteratedExtendedKalman(filter_form=form, **kwargs)
+			assert_results_equal(result, expected, rtol=1e-5, msg=form)
+
+	def test_nlo_extended(self):
+		case = nlo_extended_case()
+		reference = with_unc_2d(arguments(case, *NLO_ARGS), ["Vm", "Pl"])
+		for key in ["Vm", "Pl"]:
+			reference["meas"][key] = case["meas"][key].copy()
+			reference["meas_unc"][key][0, 2] = 1e8
+		expected = NLOextended(**reference)
+		for form in ["covariance", "information", "sequential"]:
+			kwargs = arguments(case, *NLO_ARGS)
+			for key in ["Vm", "Pl"]:
+				kwargs["meas"][key] = case["meas"][key].copy()
+				kwargs["meas"][key][0, 2] = np.nan
+			result = NLOextended(filter_form=form, **kwargs)
+			self.assertTrue(np.all(np.isfinite(result[1])))
+			assert_results_equal(result, expected, rtol=1e-5, msg=form)
+
+
+class JacobianUpdateTest(unittest.TestCase):
+	"""Reuse and Broyden updates of the Jacobian give the estimate with the exact Jacobian within the accuracy of the
+	iteration at default settings"""
+
+	def compare(self, estimator, case, names):
+		expected = estimator(accuracy=1e-13, **arguments(case, *names))
+		for update in ["full", "reuse", "broyden"]:
+			result = estimator(jacobian_update=update, **arguments(case, *names))
+			for name, res, ref in zip(["Shat", "Vhat", "uShat", "DeltaS", "uDeltaS"], result, expected):
+				np.testing.assert_allclose(res, ref, rtol=0, atol=1e-8, err_msg="%s %s" % (update, name))
+
+	def test_iterated_extended_kalman(self):
+		self.compare(IteratedExtendedKalman, lkf_case(meter_density=0.5), IEKF_ARGS)
+
+	def test_nlo_extended(self):
+		for seed in range(3):
+			self.compare(NLOextended, nlo_extended_case(seed=seed), NLO_ARGS)
+
+	def test_jacobian_evaluations(self):
+		case = lkf_case(meter_density=0.5)
+		nT = case["Vs"].shape[1]
+		evaluations = []
+		def counting_jacobian(*args):
+			evaluations.append(1)
+			return jacobian(*args)
+		counts = {}
+		nodal_load_observer.jacobian = counting_jacobian
+		try:
+			for update, drift in [("full", 1e-3), ("reuse", 1e-3), ("reuse", 0.0)]:
+				del evaluations[:]
+				profile = StepProfile(nT)
+				IteratedExtendedKalman(jacobian_update=update, refresh_drift=drift, profile=profile,
+									   **arguments(case, *IEKF_ARGS))
+				counts[update, drift] = (len(evaluations), profile.iterations["iekf"].sum())
+		finally:
+			nodal_load_observer.jacobian = jacobian
+		# the exact Jacobian is calculated in each iteration, or without drift only for the confirmation of the stop
+		self.assertEqual(counts["full", 1e-3][0], counts["full", 1e-3][1])
+		self.assertLessEqual(counts["reuse", 1e-3][0], 2*nT)
+		self.assertLess(counts["reuse", 1e-3][0], counts["full", 1e-3][0])
+		self.assertEqual(counts["reuse", 0.0][0], counts["reuse", 0.0][1])
+
+	def test_unknown_update(self):
+		case = nlo_extended_case()
+		self.assertRaises(ValueError, NLOextended, jacobian_update="secant", **arguments(case, *NLO_ARGS))
+
+
+class FixedPointMethodTest(unittest.TestCase):
+	"""Anderson acceleration of the voltage calculation gives the result of the Picard iteration"""
+
+	def compare(self, estimator, case, names):
+		expected = estimator(**arguments(case, *names))
+		result = estimator(fixed_point_method="anderson", **arguments(case, *names))
+		assert_results_equal(result, expected, rtol=1e-8)
+
+	def test_linear_kalman_filter(self):
+		self.compare(LinearKalmanFilter, lkf_case(meter_density=0.5), LKF_ARGS)
+
+	def test_iterated_extended_kalman(self):
+		self.compare(IteratedExtendedKalman, lkf_case(meter_density=0.5), IEKF_ARGS)
+
+
+class VoltageSolverTest(unittest.TestCase):
+	"""Newton's method for the voltages from bus power gives the result of the fixed point iteration"""
+
+	def test_iterated_extended_kalman(self):
+		case = lkf_case(meter_density=0.5)
+		expected = IteratedExtendedKalman(**arguments(case, *IEKF_ARGS))
+		for solver in ["newton", "damped_newton"]:
+			result = IteratedExtendedKalman(voltage_solver=solver, **arguments(case, *IEKF_ARGS))
+			assert_results_equal(result, expected, rtol=1e-8, msg=solver)
+
+	def test_unknown_solver(self):
+		case = lkf_case()
+		self.assertRaises(ValueError, IteratedExtendedKalman, voltage_solver="gauss_seidel",
+						  **arguments(case, *IEKF_ARGS))
+
+
+class StreamingTest(unittest.TestCase):
+	"""The streaming filter processing one time step per call gives the estimate for the whole time series"""
+
+	def run_steps(self, observer, case):
+		results = []
+		for k in range(case["Vs"].shape[1]):
+			meas_k = dict((key, case["meas"][key][:, k]) for key in ["Pk", "Qk", "Vm", "Va"])
+			pseudo_k = dict((key, case["pseudo_meas"][key][:, k]) for key in ["Pk", "Qk"])
+			results.append(observer.update(meas_k, pseudo_k, case["Vs"][:, k], case["meas_unc"]))
+		return [np.array(res).T for res in zip(*results)]
+
+	def test_iterated_extended_kalman(self):
+		case = lkf_case(meter_density=0.5)
+		expected = IteratedExtendedKalman(**arguments(case, *IEKF_ARGS))
+		observer = StreamingIteratedExtendedKalman(case["topology"], case["meas_idx"], case["model"], case["V0"],
+												   Y=case["Y"])
+		for run in range(2):
+			Shat, Vhat, _, DeltaS, uDeltaS = self.run_steps(observer, case)
+			# IteratedExtendedKalman stores the deviations of time step k in column k-1
+			DeltaS, uDeltaS = np.roll(DeltaS, -1, axis=1), np.roll(uDeltaS, -1, axis=1)
+			result = [Shat, Vhat, observer.Dnm.dot(uDeltaS), DeltaS, uDeltaS]
+			assert_results_equal(result, expected, rtol=1e-12)
+			# the filter starts from the initial state again after reset
+			observer.reset()
+
+
+class SteadyStateTest(unittest.TestCase):
+
+	def stationary_case(self, nT=100):
+		"""Case with the data of the first time step repeated nT times"""
+		case = lkf_case(nT=1)
+		for key in ["meas", "pseudo_meas"]:
+			case[key] = dict((name, np.tile(values, (1, nT))) for name, values in case[key].items())
+		case["Vs"] = np.tile(case["Vs"], (1, nT))
+		return case
+
+	def test_no_freezing(self):
+		case = lkf_case(meter_density=0.5)
+		expected = LinearKalmanFilter(**arguments(case, *LKF_ARGS))
+		result = LinearKalmanFilter(steady_state="last", steady_state_tol=0.0, **arguments(case, *LKF_ARGS))
+		assert_results_equal(result, expected, rtol=1e-14)
+
+	def test_freezing(self):
+		case = self.stationary_case()
+		expected = LinearKalmanFilter(**arguments(case, *LKF_ARGS))
+		profile = StepProfile()
+		result = LinearKalmanFilter(steady_state="last", profile=profile, **arguments(case, *LKF_ARGS))
+		# Ks is not recalculated once frozen with the default tolerance
+		self.assertEqual(profile.results()["iterations"]["voltage"][-10:].sum(), 0)
+		np.testing.assert_allclose(result[1], expected[1], rtol=1e-5, atol=1e-5*np.abs(expected[1]).max())
+		np.testing.assert_allclose(result[2], expected[2], rtol=1e-2)
+
+	def test_unknown_mode(self):
+		case = lkf_case()
+		self.assertRaises(ValueError, LinearKalmanFilter, steady_state="dare", **arguments(case, *LKF_ARGS))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the process-pool runner (NLO/parallel.py) against sequential runs of the estimators
+"""
+
+import unittest
+
+import numpy as np
+from scipy.sparse import csc_matrix
+
+from NLO.parallel import to_shared, from_shared, run_parallel, iter_parallel
+from NLO.nodal_load_observer import LinearKalmanFilter, IteratedExtendedKalman
+from tests.cases import lkf_case, make_model, arguments
+
+
+SPEC_ARGS = ["meas", "meas_unc", "meas_idx", "pseudo_meas", "V0", "Vs"]
+
+
+class SharedMemoryTest(unittest.TestCase):
+
+	def test_round_trip(self):
+		A = np.arange(12.).reshape(3, 4)
+		S = csc_matrix(np.eye(3) + 1j*np.eye(3, k=1))
+		shared = from_shared(to_shared({"A": A, "nested": {"S": S, "n": 3}, "empty": np.zeros(0)}))
+		np.testing.assert_array_equal(shared["A"], A)
+		self.assertFalse(shared["A"].flags.writeable)
+		self.assertEqual(shared["nested"]["S"].format, "csc")
+		np.testing.assert_array_equal(shared["nested"]["S"].toarray(), S.toarray())
+		self.assertEqual(shared["nested"]["n"], 3)
+		self.assertEqual(shared["empty"].shape, (0,))
+
+
+class RunParallelTest(unittest.TestCase):
+
+	def setUp(self):
+		self.case = lkf_case(meter_density=0.5)
+		n = 2*len(self.case["pseudo_meas"]["Pk"])
+		self.specs = [dict(model=make_model(n, q=q)) for q in [1e-4, 1e-3, 1e-2]]
+		self.shared = arguments(self.case, "topology", "Y", *SPEC_ARGS)
+
+	def expected(self, estimator):
+		return [estimator(model=spec["model"], **arguments(self.case, "topology", "Y", *SPEC_ARGS))
+				for spec in self.specs]
+
+	def compare(self, results, expected):
+		self.assertEqual(len(results), len(expected))
+		for result, reference in zip(results, expected):
+			for res, ref in zip(result, reference):
+				np.testing.assert_allclose(res, ref, rtol=1e-12, atol=1e-12*np.abs(ref).max())
+
+	def test_processes(self):
+		expected = self.expected(IteratedExtendedKalman)
+		self.compare(run_parallel(self.specs, self.shared, processes=1), expected)
+		self.compare(run_parallel(self.specs, self.shared, processes=2), expected)
+
+	def test_single_process(self):
+		# the shared data are passed to the estimator without copying
+		A = np.arange(3.)
+		results = run_parallel([{"estimator": lambda A: A}], {"A": A}, processes=1, blas_threads=None)
+		self.assertIs(results[0], A)
+
+	def test_estimator_name(self):
+		specs = [dict(spec, estimator="LinearKalmanFilter") for spec in self.specs]
+		expected = self.expected(LinearKalmanFilter)
+		self.compare(list(iter_parallel(specs, self.shared, processes=2)), expected)
+		specs[0]["estimator"] = "KalmanSmoother"
+		self.assertRaises(ValueError, run_parallel, specs, self.shared, processes=1)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the numerical network equations (NLO/power_flow_equations.py) against finite differences, against
+the symbolic equations and of the branch list against the dense admittance matrices
+"""
+
+import unittest
+
+import numpy as np
+
+from NLO.power_flow_equations import BranchList, BusPowerEquations, MeasurementEquations
+from NLO.nodal_load_observer import network_equations, calc_admittance
+from tests.cases import nlo_extended_case
+
+
+def finite_differences(f, x, h=1e-6):
+	"""Jacobian of f at x by central differences"""
+	return np.array([(f(x + h*e) - f(x - h*e))/(2*h) for e in np.eye(len(x))]).T
+
+
+def dense_admittance(network_branches):
+	"""Admittance matrices by the loop over all bus pairs of the original calc_admittance"""
+	nK = int(network_branches[:, :2].max())
+	z = np.zeros((nK, nK), dtype=complex)
+	cap = np.zeros((nK, nK))
+	for row in network_branches:
+		k_start, k_end = int(row[0]) - 1, int(row[1]) - 1
+		z[k_start, k_end] = row[2] + 1j*row[3]
+		cap[k_start, k_end] = row[4]
+	z += z.T
+	cap += cap.T
+	y = np.zeros_like(z)
+	y[z != 0] = 1/z[z != 0]
+	Y = -y
+	for i in range(nK):
+		Y[i, i] = np.sum(y[i, :]) + 1j*np.sum(cap[i, :]/2)
+	return Y, y, cap
+
+
+def toarray(J):
+	return J.toarray() if hasattr(J, "toarray") else J
+
+
+class NetworkEquationsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.case = nlo_extended_case(n_bus=6, meter_density=0.5)
+		self.Y = self.case["Y"]
+		self.nK = self.Y.shape[0]
+		self.V = self.case["V"][:, 1]
+		self.non_slack = np.r_[1:self.nK, self.nK + 1:2*self.nK]
+
+	def derivatives(self, f):
+		"""Finite difference Jacobian of f w.r.t. the non-slack nodal voltages"""
+		def g(x):
+			V = self.V.copy()
+			V[self.non_slack] = x
+			return f(V)
+		return finite_differences(g, self.V[self.non_slack])
+
+	def test_bus_power(self):
+		S = BusPowerEquations(self.Y.toarray()).power(self.V)
+		Vc = self.V[:self.nK] + 1j*self.V[self.nK:]
+		expected = Vc*np.conj(self.Y.toarray().dot(Vc))
+		np.testing.assert_allclose(S, np.r_[expected.real, expected.imag], rtol=1e-12, atol=1e-12)
+
+	def test_bus_power_jacobian(self):
+		dense = BusPowerEquations(self.Y.toarray())
+		expected = self.derivatives(dense.power)
+		J = dense.jacobian(self.V)
+		np.testing.assert_allclose(J, expected, rtol=1e-6, atol=1e-6*np.abs(expected).max())
+		Js = BusPowerEquations(self.Y).jacobian(self.V)
+		self.assertEqual(Js.format, "csc")
+		np.testing.assert_allclose(Js.toarray(), J, rtol=1e-12, atol=1e-12*np.abs(J).max())
+
+	def test_measurement_jacobian(self):
+		branches = BranchList.from_branch_data(self.case["topology"]["branch"], self.nK)
+		eqs = MeasurementEquations(self.nK, branches, self.case["meas_idx"])
+		expected = self.derivatives(eqs.evaluate)
+		J = eqs.jacobian(self.V)
+		np.testing.assert_allclose(J, expected, rtol=1e-6, atol=1e-6*np.abs(expected).max())
+		Js = MeasurementEquations(self.nK, branches, self.case["meas_idx"], sparse=True).jacobian(self.V)
+		np.testing.assert_allclose(Js.toarray(), J, rtol=1e-14)
+
+	def test_symbolic(self):
+		Y, y, cap = calc_admittance(self.case["topology"]["branch"])
+		numeric = network_equations(Y, y, cap, self.nK, self.case["meas_idx"])
+		symbolic = network_equations(Y, y, cap, self.nK, self.case["meas_idx"], symbolic=True, use_cache=False)
+		for name, f, g in zip(["J_dSdV", "J_dHdV", "f_hSK", "f_hSl"], numeric, symbolic):
+			expected = toarray(g(self.V))
+			np.testing.assert_allclose(toarray(f(self.V)), expected, rtol=1e-10, atol=1e-10*np.abs(expected).max(),
+									   err_msg=name)
+
+
+class BranchListTest(unittest.TestCase):
+
+	def setUp(self):
+		# bus numbering starting at 1 as expected by the original calc_admittance
+		self.branch = nlo_extended_case(n_bus=8)["topology"]["branch"].copy()
+		self.branch[:, :2] += 1
+
+	def test_admittance_matrix(self):
+		expected = dense_admittance(self.branch)
+		branches = BranchList.from_branch_data(self.branch)
+		np.testing.assert_allclose(branches.admittance_matrix().toarray(), expected[0], rtol=1e-14)
+		for res, ref in zip(calc_admittance(self.branch), expected):
+			np.testing.assert_allclose(res, ref, rtol=1e-14)
+
+	def test_matrices(self):
+		branches = BranchList.from_branch_data(self.branch)
+		y, cap = branches.matrices()
+		copy = BranchList.from_matrices(y, cap)
+		self.assertEqual(len(copy), len(branches))
+		np.testing.assert_allclose(copy.admittance_matrix().toarray(), branches.admittance_matrix().toarray(),
+								   rtol=1e-14)
+		np.testing.assert_array_equal(copy.branch_index(branches.to_bus, branches.from_bus),
+									  copy.branch_index(branches.from_bus, branches.to_bus))
+		self.assertRaises(ValueError, branches.branch_index, [0], [self.branch.shape[0]])
+
+	def test_parallel_branches(self):
+		# the second line is split into two parallel lines with twice the impedance and half the capacitance
+		line = self.branch[1].copy()
+		line[2:4] *= 2
+		line[4] /= 2
+		split = np.r_[self.branch[:1], line[np.newaxis], line[np.newaxis], self.branch[2:]]
+		branches = BranchList.from_branch_data(split)
+		self.assertEqual(len(branches), self.branch.shape[0])
+		np.testing.assert_allclose(branches.admittance_matrix().toarray(), dense_admittance(self.branch)[0],
+								   rtol=1e-12)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the selection operators (NLO/selectors.py) against their dense matrices
+"""
+
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from NLO.selectors import Selector
+from NLO.nodal_load_observer import get_system_matrices
+
+
+class SelectorTest(unittest.TestCase):
+
+	def setUp(self):
+		self.S = Selector([0, 2, 3], [4, 1, 0], (5, 6))
+		self.A = np.zeros((5, 6))
+		self.A[[0, 2, 3], [4, 1, 0]] = 1
+		self.x = np.arange(12.).reshape(6, 2)
+
+	def test_dense(self):
+		np.testing.assert_array_equal(self.S.toarray(), self.A)
+		np.testing.assert_array_equal(self.S.tocsr().toarray(), self.A)
+		np.testing.assert_array_equal(np.asarray(self.S), self.A)
+		np.testing.assert_array_equal(self.S.T.toarray(), self.A.T)
+
+	def test_products(self):
+		np.testing.assert_array_equal(self.S.dot(self.x), np.dot(self.A, self.x))
+		np.testing.assert_array_equal(self.S.dot(self.x[:, 0]), np.dot(self.A, self.x[:, 0]))
+		np.testing.assert_array_equal(self.S.dot(csr_matrix(self.x)).toarray(), np.dot(self.A, self.x))
+		B = np.arange(10.).reshape(2, 5)
+		np.testing.assert_array_equal(self.S.premultiply(B), np.dot(B, self.A))
+		np.testing.assert_array_equal(self.S.premultiply(np.tile(B, (3, 1, 1)))[1], np.dot(B, self.A))
+		np.testing.assert_array_equal(self.S.premultiply(csr_matrix(B)).toarray(), np.dot(B, self.A))
+
+	def test_gather(self):
+		S = Selector([0, 1, 2], [3, 0, 1], (3, 4))
+		self.assertTrue(S.is_gather)
+		np.testing.assert_array_equal(S.dot(self.x[:4]), np.dot(S.toarray(), self.x[:4]))
+
+
+class SystemMatricesTest(unittest.TestCase):
+
+	def test_system_matrices(self):
+		pmeas = np.array([True, False, True, False])
+		vmeas = np.array([False, True, True, False])
+		Cm, Dnm, Dm = get_system_matrices(pmeas, pmeas, vmeas)
+		# dense matrices as constructed in W. Heins' thesis
+		Cm_dense = np.zeros((4, 8))
+		Cm_dense[[0, 1, 2, 3], [1, 2, 5, 6]] = 1
+		Dm_dense = np.zeros((8, 4))
+		Dm_dense[[0, 2, 4, 6], [0, 1, 2, 3]] = 1
+		Dnm_dense = np.zeros((8, 4))
+		Dnm_dense[[1, 3, 5, 7], [0, 1, 2, 3]] = 1
+		np.testing.assert_array_equal(Cm.toarray(), Cm_dense)
+		np.testing.assert_array_equal(Dm.toarray(), Dm_dense)
+		np.testing.assert_array_equal(Dnm.toarray(), Dnm_dense)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the synthetic feeder and measurement generator (tools/synthetic_feeder.py)
+"""
+
+import unittest
+
+import numpy as np
+
+from tools.synthetic_feeder import radial_feeder, load_profiles, pv_profiles, simulate, measurements
+
+
+class RadialFeederTest(unittest.TestCase):
+
+	def test_radial(self):
+		casedata = radial_feeder(200, n_feeders=3, seed=0)
+		branch = casedata["branch"]
+		self.assertEqual(branch.shape[0], 199)
+		self.assertTrue(np.all(branch[:, 0] < branch[:, 1]))
+		np.testing.assert_array_equal(np.sort(branch[:, 1]), np.arange(1, 200))
+		self.assertEqual(set(casedata["feeder"][1:]), set([0, 1, 2]))
+
+	def test_reproducible(self):
+		a = radial_feeder(100, mesh_links=3, seed=5)
+		b = radial_feeder(100, mesh_links=3, seed=5)
+		np.testing.assert_array_equal(a["branch"], b["branch"])
+		np.testing.assert_array_equal(a["bus"], b["bus"])
+
+	def test_mesh_links(self):
+		casedata = radial_feeder(200, n_feeders=3, mesh_links=5, seed=0)
+		links = casedata["branch"][199:, :2].astype(int)
+		self.assertEqual(len(links), 5)
+		self.assertEqual(len(set(map(tuple, links))), 5)
+		feeder = casedata["feeder"]
+		self.assertTrue(np.all(np.abs(feeder[links[:, 0]] - feeder[links[:, 1]]) <= 1))
+
+	def test_too_many_mesh_links(self):
+		self.assertRaises(ValueError, radial_feeder, 30, n_feeders=3, mesh_links=40, seed=0)
+
+
+class SimulationTest(unittest.TestCase):
+
+	def test_power_flow(self):
+		casedata = radial_feeder(40, mesh_links=2, seed=1)
+		load, load_forecast = load_profiles(casedata, 4, seed=2)
+		pv, pv_forecast = pv_profiles(casedata, 4, seed=3)
+		truth = simulate(casedata, load, pv)
+		nK = 39
+		V = np.r_[truth["Vs"][:1], truth["V"][:nK]] + 1j*np.r_[np.zeros((1, 4)), truth["V"][nK:]]
+		S = 3*V*np.conj(truth["Y"].dot(V))
+		np.testing.assert_allclose(S[1:].real, truth["S"][:nK], atol=1e-8)
+		np.testing.assert_allclose(S[1:].imag, truth["S"][nK:], atol=1e-8)
+		np.testing.assert_allclose(S[0].real, truth["S0"][0], atol=1e-8)
+
+	def test_measurements(self):
+		casedata = radial_feeder(40, seed=1)
+		load, load_forecast = load_profiles(casedata, 4, seed=2)
+		truth = simulate(casedata, load)
+		meas, meas_unc, meas_idx, pseudo_meas = measurements(truth, casedata, load_forecast, meter_density=0.2,
+															 uVm=0, uVa=0, seed=3)
+		metered = meas_idx["Vm"]
+		self.assertEqual(len(metered), 8)
+		self.assertEqual(pseudo_meas["Pk"].shape, (31, 4))
+		V = truth["V"][metered] + 1j*truth["V"][39 + metered]
+		np.testing.assert_allclose(meas["Vm"], np.abs(V))
+		np.testing.assert_allclose(meas["Va"], np.degrees(np.angle(V)))
+		np.testing.assert_allclose(meas["Pk"], truth["S"][metered])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -186,15 +186,31 @@ def UKGDS_to_casedata(filename,header=28):
 	return casedata
 
 
-def separate_Yslack(Y,slack_idx,**kwargs):
-	from scipy.sparse import issparse
-	if issparse(Y):
-		Y = Y.copy().toarray()
+def separate_Yslack(Y,slack_idx,sparse=False,**kwargs):
+	"""Remove the slack node from the nodal admittance matrix and return the real-valued block matrices
+	[[G,-B],[B,G]] of the remaining network and of the admittance to the slack node.
+
+	:param Y: complex nodal admittance matrix (numpy array or scipy.sparse matrix)
+	:param slack_idx: index of slack node
+	:param sparse: if True, both matrices are returned in scipy.sparse CSC format
+	:return: Y00, Yslack
+	"""
+	from scipy.sparse import issparse, csc_matrix, bmat
 	n = Y.shape[0]
-	Yslack = np.delete(Y[:,0],slack_idx)[:,np.newaxis]
-	Y = np.delete(np.delete(Y,slack_idx,0),slack_idx,1)
-	Yslack = np.vstack((np.hstack((Yslack.real, -Yslack.imag)), np.hstack((Yslack.imag, Yslack.real))))
-	Y = np.vstack((np.hstack((Y.real, -Y.imag)), np.hstack((Y.imag, Y.real))))
+	if sparse:
+		Y = csc_matrix(Y)
+		non_slack = np.delete(np.arange(n),slack_idx)
+		Yslack = Y[:,slack_idx][non_slack,:]
+		Y = Y[:,non_slack][non_slack,:]
+		Yslack = bmat([[Yslack.real, -Yslack.imag], [Yslack.imag, Yslack.real]], format="csc")
+		Y = bmat([[Y.real, -Y.imag], [Y.imag, Y.real]], format="csc")
+	else:
+		if issparse(Y):
+			Y = Y.copy().toarray()
+		Yslack = np.delete(Y[:,slack_idx],slack_idx)[:,np.newaxis]
+		Y = np.delete(np.delete(Y,slack_idx,0),slack_idx,1)
+		Yslack = np.vstack((np.hstack((Yslack.real, -Yslack.imag)), np.hstack((Yslack.imag, Yslack.real))))
+		Y = np.vstack((np.hstack((Y.real, -Y.imag)), np.hstack((Y.imag, Y.real))))
 
 	if not Y.shape == (2*(n-1),2*(n-1)):
 			raise ValueError("Shape of calculated admittance w/o slack is wrong!\nShould be (%s,%s), but is actually (%s,%s)"%(2*(n-1),2*(n-1),Y.shape[0],Y.shape[1]))
@@ -218,19 +234,21 @@ def admittance_from_UKGDS(filename,header=28,separate_Yslack=True):
 	return makeYbus(baseMVA,bus_matrix,branch_matrix,separate_Yslack)
 
 
-def process_admittance(Y,slack_idx=0):
+def process_admittance(Y,slack_idx=0,sparse=False):
 	"""Decompose nodal admittance matrix into blocks required for NLO
+
+	:param Y: complex nodal admittance matrix (numpy array or scipy.sparse matrix)
+	:param slack_idx: index of slack node
+	:param sparse: if True, all blocks are returned in scipy.sparse CSC format
+	:return: G, B, Gs, Bs, Y00, Ys
 	"""
-	from numpy import real,imag
-	# admittance at slack
-	Y,Ys = separate_Yslack(Y,slack_idx)
-	Gs = real(Ys[:])
-	Bs = imag(Ys[:])
-#    Ys = np.asarray(np.bmat([ [Gs, -Bs], [Bs, Gs] ]))
-	# admittance w/o slack
-	G = real(Y)
-	B = imag(Y)
-	Y00 = np.asarray(np.bmat([ [G, -B], [B, G] ]))
+	# real-valued block matrices [[G,-B],[B,G]] w/o slack and admittance at slack
+	Y00,Ys = separate_Yslack(Y,slack_idx,sparse=sparse)
+	n = Y00.shape[0]//2
+	G = Y00[:n,:n]
+	B = Y00[n:,:n]
+	Gs = Ys[:n,:1]
+	Bs = Ys[n:,:1]
 	return G,B,Gs,Bs,Y00,Ys
 
 
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Generator of synthetic distribution networks and time series for testing and profiling the nodal load observer
+on networks of arbitrary size (e.g. 1k-10k buses) without proprietary data.
+
+	- `radial_feeder`: radial or weakly meshed medium voltage network in PyPower format with one or more feeders
+	  starting at the slack bus 0. Each feeder consists of a trunk line with laterals and sub-laterals of typical
+	  cable and overhead line types, i.e. with realistic R/X ratios and line lengths. Loads are placed at a share
+	  of the buses with log-normally distributed peak power.
+	- `load_profiles` and `pv_profiles`: load and PV generation time series of the buses together with their
+	  forecasts (standard load profiles and clear-sky generation), which serve as pseudo-measurements
+	- `simulate`: ground truth nodal voltages and bus power from power flow calculations
+	- `measurements`: measurements, uncertainties, indices and pseudo-measurements as required by the estimators
+
+Example::
+
+	casedata = radial_feeder(2000, mesh_links=5, seed=1)
+	load, load_fc = load_profiles(casedata, 96, seed=2)
+	pv, pv_fc = pv_profiles(casedata, 96, seed=3)
+	truth = simulate(casedata, load, pv)
+	meas, meas_unc, meas_idx, pseudo_meas = measurements(truth, casedata, load_fc, pv_fc, seed=4)
+	LinearKalmanFilter(casedata, meas, meas_unc, meas_idx, pseudo_meas, model, V0, truth["Vs"], Y=truth["Y"])
+
+All power values are three-phase in MW (MVAr), voltages are phase-to-neutral in kV as in the examples.
+"""
+if __name__ == '__main__' and __package__ is None:
+	from os import sys, path
+	sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import numpy as np
+from pypower.idx_bus import BUS_I,BUS_TYPE,PD,QD,BUS_AREA,VM,BASE_KV,ZONE,VMAX,VMIN
+from pypower.idx_brch import F_BUS,T_BUS,BR_R,BR_X,BR_B,RATE_A,RATE_B,RATE_C,BR_STATUS,ANGMIN,ANGMAX
+from pypower.idx_gen import GEN_BUS,VG,MBASE,GEN_STATUS,PMAX,QMAX,QMIN
+
+# typical 11 kV line types: resistance and reactance in Ohm/km, capacitance in uF/km, rating in MVA
+line_types = {
+	"trunk":    {"r": 0.125, "x": 0.097, "c": 0.36, "rate": 7.0}, 	# 240 mm2 Al XLPE cable
+	"branch":   {"r": 0.206, "x": 0.104, "c": 0.30, "rate": 5.3}, 	# 150 mm2 Al XLPE cable
+	"lateral":  {"r": 0.320, "x": 0.110, "c": 0.26, "rate": 4.0}, 	# 95 mm2 Al XLPE cable
+	"overhead": {"r": 0.592, "x": 0.350, "c": 0.01, "rate": 3.0}, 	# 50 mm2 ACSR overhead line
+}
+# line length ranges in km
+segment_length = {"trunk": (0.3, 1.0), "branch": (0.1, 0.5), "lateral": (0.05, 0.3), "overhead": (0.1, 0.6)}
+
+
+def _grow_feeder(m, first, lateral_length, overhead_share, rng):
+	"""
+	Random tree of m buses numbered from `first` on, connected to the slack bus 0
+	:return: parent bus and line type of each bus
+	"""
+	n_trunk = min(m, max(1, int(round(1.5*np.sqrt(m)))))
+	parent = [0] + range(first, first + n_trunk - 1)
+	kind = ["trunk"]*n_trunk
+	while len(parent) < m:
+		# new lateral from a trunk bus or sub-lateral from a lateral bus
+		if rng.rand() < 0.7:
+			start = first + rng.randint(n_trunk)
+			typ = "branch" if rng.rand() < 0.5 else ("overhead" if rng.rand() < overhead_share else "lateral")
+		else:
+			start = first + n_trunk + rng.randint(len(parent) - n_trunk) if len(parent) > n_trunk else first
+			typ = "overhead" if rng.rand() < overhead_share else "lateral"
+		length = min(m - len(parent), rng.geometric(1.0/lateral_length), 3*lateral_length)
+		for j in range(length):
+			parent.append(start if j == 0 else first + len(parent) - 1)
+			kind.append(typ)
+	return parent, kind
+
+
+def radial_feeder(n_bus, n_feeders=None, buses_per_feeder=150, lateral_length=8, overhead_share=0.2, mesh_links=0,
+				  base_kV=11.0, baseMVA=100.0, peak_load=4.0, load_share=0.8, power_factor=(0.9, 0.98), seed=None):
+	"""
+	Synthetic radial (or weakly meshed) distribution network in PyPower format with Python indices.
+	Bus 0 is the slack bus (substation busbar) from which the feeders start. Buses are numbered such that the
+	upstream bus of each line has a lower number than its downstream bus.
+
+	:param n_bus: number of buses including the slack bus
+	:param n_feeders: (optional) number of feeders; default is one feeder per `buses_per_feeder` buses
+	:param buses_per_feeder: number of buses per feeder if n_feeders is not given
+	:param lateral_length: mean number of buses per lateral
+	:param overhead_share: probability of a lateral being an overhead line instead of a cable
+	:param mesh_links: number of additional lines between the ends of laterals of the same or neighbouring feeders
+			(normally open points which are closed), which make the network weakly meshed; ValueError is raised
+			if there are fewer such pairs of lateral ends
+	:param base_kV: nominal (line-to-line) voltage in kV
+	:param baseMVA: base power in MVA
+	:param peak_load: sum of the peak loads of each feeder in MW
+	:param load_share: fraction of the buses with load
+	:param power_factor: range of the power factors of the loads
+	:param seed: (optional) seed of the random number generator
+	:return: dict with "baseMVA", "bus", "branch" and "gen" in PyPower format, "feeder" index of each bus (-1 for
+			the slack bus) and "length" of each branch in km
+	"""
+	rng = np.random.RandomState(seed)
+	if n_feeders is None:
+		n_feeders = max(1, int(round((n_bus - 1)/float(buses_per_feeder))))
+	sizes = np.diff(np.round(np.linspace(0, n_bus - 1, n_feeders + 1)).astype(int))
+	parent, kind, feeder = [], [], [-1]
+	for f, m in enumerate(sizes):
+		p, k = _grow_feeder(m, len(parent) + 1, lateral_length, overhead_share, rng)
+		parent += p
+		kind += k
+		feeder += [f]*m
+	feeder = np.array(feeder)
+
+	# weakly meshed: connect ends of laterals of the same or a neighbouring feeder
+	from_bus = np.array(parent, dtype=int)
+	to_bus = np.arange(1, n_bus)
+	links = []
+	if mesh_links > 0:
+		leaves = np.setdiff1d(to_bus, from_bus)
+		pairs = []
+		for f in range(n_feeders):
+			own = leaves[feeder[leaves] == f]
+			i, j = np.triu_indices(len(own), 1)
+			pairs += zip(own[i], own[j])
+			pairs += [(a, b) for a in own for b in leaves[feeder[leaves] == f + 1]]
+		if mesh_links > len(pairs):
+			raise ValueError("Only %d mesh links are possible between the ends of laterals, %d requested."
+							 % (len(pairs), mesh_links))
+		links = sorted(pairs[i] for i in rng.choice(len(pairs), mesh_links, replace=False))
+	if links:
+		from_bus = np.r_[from_bus, [l[0] for l in links]]
+		to_bus = np.r_[to_bus, [l[1] for l in links]]
+		kind += ["lateral"]*len(links)
+
+	length = np.array([rng.uniform(*segment_length[k]) for k in kind])
+	Zbase = base_kV**2/baseMVA
+	branch = np.zeros((len(from_bus), 13))
+	branch[:, F_BUS] = from_bus
+	branch[:, T_BUS] = to_bus
+	branch[:, BR_R] = np.array([line_types[k]["r"] for k in kind])*length/Zbase
+	branch[:, BR_X] = np.array([line_types[k]["x"] for k in kind])*length/Zbase
+	branch[:, BR_B] = 2*np.pi*50*1e-6*np.array([line_types[k]["c"] for k in kind])*length*Zbase
+	branch[:, RATE_A] = branch[:, RATE_B] = branch[:, RATE_C] = [line_types[k]["rate"] for k in kind]
+	branch[:, BR_STATUS] = 1
+	branch[:, ANGMIN] = -360
+	branch[:, ANGMAX] = 360
+
+	# loads with log-normally distributed peak power, scaled to peak_load per feeder
+	has_load = rng.rand(n_bus) < load_share
+	has_load[0] = False
+	Pd = np.where(has_load, rng.lognormal(0.0, 0.5, n_bus), 0.0)
+	for f in range(n_feeders):
+		total = Pd[feeder == f].sum()
+		if total > 0:
+			Pd[feeder == f] *= peak_load/total
+	pf = rng.uniform(power_factor[0], power_factor[1], n_bus)
+
+	bus = np.zeros((n_bus, 13))
+	bus[:, BUS_I] = np.arange(n_bus)
+	bus[:, BUS_TYPE] = 1
+	bus[0, BUS_TYPE] = 3
+	bus[:, PD] = Pd
+	bus[:, QD] = Pd*np.tan(np.arccos(pf))
+	bus[:, BUS_AREA] = 1
+	bus[:, VM] = 1.0
+	bus[:, BASE_KV] = base_kV
+	bus[:, ZONE] = 1
+	bus[:, VMAX] = 1.1
+	bus[:, VMIN] = 0.9
+
+	gen = np.zeros((1, 21))
+	gen[0, GEN_BUS] = 0
+	gen[0, QMAX] = gen[0, PMAX] = n_feeders*peak_load*2
+	gen[0, QMIN] = -gen[0, QMAX]
+	gen[0, VG] = 1.0
+	gen[0, MBASE] = baseMVA
+	gen[0, GEN_STATUS] = 1
+	return {"version": "2", "baseMVA": baseMVA, "bus": bus, "branch": branch, "gen": gen, "feeder": feeder,
+			"length": length}
+
+
+def branch_in_ohm(casedata):
+	"""
+	Branch data with resistance and reactance in Ohm and line charging susceptance in S instead of p.u.,
+	as used by NLOextended and tools.data_tools.calc_admittance
+	"""
+	Zbase = casedata["bus"][0, BASE_KV]**2/casedata["baseMVA"]
+	branch = casedata["branch"].copy()
+	branch[:, BR_R] *= Zbase
+	branch[:, BR_X] *= Zbase
+	branch[:, BR_B] /= Zbase
+	return branch
+
+
+def admittance_matrix(casedata):
+	"""Nodal admittance matrix in S in scipy.sparse CSR format"""
+	from NLO.power_flow_equations import BranchList
+	return BranchList.from_branch_data(branch_in_ohm(casedata), casedata["bus"].shape[0]).admittance_matrix()
+
+
+def _ar1(shape, phi, sigma, rng):
+	"""Stationary AR(1) processes along the last axis with coefficient phi and standard deviation sigma"""
+	e = rng.randn(*shape)*sigma*np.sqrt(1 - phi**2)
+	x = np.zeros(shape)
+	x[..., 0] = rng.randn(*shape[:-1])*sigma
+	for k in range(1, shape[-1]):
+		x[..., k] = phi*x[..., k - 1] + e[..., k]
+	return x
+
+
+def load_profiles(casedata, nT, dt=15.0, commercial_share=0.2, noise=0.1, seed=None):
+	"""
+	Load time series of all buses based on standard load profiles of residential (morning and evening peak) and
+	commercial (working hours) loads with random variations
+
+	:param casedata: network as returned by `radial_feeder`
+	:param nT: number of time steps starting at midnight
+	:param dt: time step in minutes
+	:param commercial_share: fraction of commercial loads
+	:param noise: relative standard deviation of the (autocorrelated) deviations from the standard load profile
+	:param seed: (optional) seed of the random number generator
+	:return: load and its forecast from the standard load profiles, each of shape (2*n_bus,nT) with [P; Q] in MW
+	"""
+	rng = np.random.RandomState(seed)
+	t = (np.arange(nT)*dt/60.0) % 24
+	residential = 0.35 + 0.3*np.exp(-(t - 7.5)**2/2.0) + 0.65*np.exp(-(t - 19.0)**2/4.5)
+	commercial = 0.3 + 0.7/((1 + np.exp(-2*(t - 8))) * (1 + np.exp(2*(t - 18))))
+	profiles = np.vstack((residential/residential.max(), commercial/commercial.max()))
+	n_bus = casedata["bus"].shape[0]
+	profile = profiles[(rng.rand(n_bus) < commercial_share).astype(int)]
+	Pd, Qd = casedata["bus"][:, PD], casedata["bus"][:, QD]
+	forecast = np.r_[Pd[:, np.newaxis]*profile, Qd[:, np.newaxis]*profile]
+	variation = 1 + _ar1((n_bus, nT), 0.9, noise, rng)
+	load = forecast*np.tile(np.maximum(variation, 0), (2, 1))
+	return load, forecast
+
+
+def pv_profiles(casedata, nT, dt=15.0, penetration=0.3, capacity=1.0, season="Summer", location="Normal",
+				seed=None):
+	"""
+	PV generation time series as Gaussian daily profiles (see tools/profilesPV.py) reduced by passing clouds
+
+	:param casedata: network as returned by `radial_feeder`
+	:param nT: number of time steps starting at midnight
+	:param dt: time step in minutes
+	:param penetration: fraction of the load buses with PV
+	:param capacity: mean PV peak power relative to the peak load of the bus
+	:param season: "Winter", "Spring", "Summer" or "Autumn"
+	:param location: "High", "Normal" or "Low" irradiation
+	:param seed: (optional) seed of the random number generator
+	:return: generation and its clear-sky forecast, each of shape (2*n_bus,nT) with [P; Q] in MW (Q = 0)
+	"""
+	from tools.profilesPV import ProfilePower
+	rng = np.random.RandomState(seed)
+	Ampl, mu, std = ProfilePower(location, season)
+	t = (np.arange(nT)*dt/60.0) % 24
+	clear_sky = np.exp(-(t - mu/4.0)**2/(2*(std/4.0)**2)) 	# mu and std in quarter hours
+	Pd = casedata["bus"][:, PD]
+	has_pv = (Pd > 0) & (rng.rand(len(Pd)) < penetration)
+	Ppv = np.where(has_pv, capacity*Pd*rng.uniform(0.5, 1.5, len(Pd)), 0.0)
+	forecast = Ppv[:, np.newaxis]*clear_sky
+	clouds = np.clip(1 - np.abs(_ar1((len(Pd), nT), 0.95, 0.3, rng)), 0.1, 1)
+	zeros = np.zeros_like(forecast)
+	return np.r_[forecast*clouds, zeros], np.r_[forecast, zeros]
+
+
+def simulate(casedata, load, generation=None, Vslack=None, accuracy=1e-9):
+	"""
+	Ground truth nodal voltages for the given load and generation by power flow calculation for each time step
+
+	:param casedata: network as returned by `radial_feeder`
+	:param load: load of all buses, shape (2*n_bus,nT) with [P; Q] in MW
+	:param generation: (optional) generation of all buses, same shape as load
+	:param Vslack: (optional) slack voltage (phase-to-neutral) in kV, constant or of shape (nT,); default is nominal
+	:param accuracy: accuracy of the power flow calculation
+	:return: dict with bus power "S" (injections [P; Q] in MW) and nodal voltages "V" ([Re; Im] in kV) of all
+			non-slack buses, slack voltage "Vs" (magnitude and phase), slack bus power "S0" and admittance matrix
+			"Y" in S
+	"""
+	from tools.data_tools import separate_Yslack
+	from NLO.nodal_load_observer import newton_voltages, JacobianPattern
+	n_bus = casedata["bus"].shape[0]
+	nK = n_bus - 1
+	nT = load.shape[1]
+	injection = -load if generation is None else generation - load
+	S = np.r_[injection[1:n_bus], injection[n_bus + 1:]]
+	if Vslack is None:
+		Vslack = casedata["bus"][0, BASE_KV]/np.sqrt(3)
+	Vslack = Vslack*np.ones(nT)
+	Y = admittance_matrix(casedata)
+	Y00, Ys = separate_Yslack(Y, 0, sparse=True)
+	pattern = JacobianPattern(Y00, Ys)
+	V = np.zeros((2*nK, nT))
+	Vk = np.r_[Vslack[0]*np.ones(nK), np.zeros(nK)]
+	for k in range(nT):
+		Vk, info = newton_voltages(Y00, Ys, S[:, k], Vk, np.array([Vslack[k], 0.0]), accuracy=accuracy,
+								   pattern=pattern)
+		if info["reason"] == "maxiter":
+			raise ValueError("Power flow did not converge at time step %d." % k)
+		V[:, k] = Vk
+	# power at the slack bus from the currents into the network
+	Vfull = np.r_[Vslack[np.newaxis, :], V[:nK]] + 1j*np.r_[np.zeros((1, nT)), V[nK:]]
+	S0 = 3*Vfull[0]*np.conj(Y[0].dot(Vfull)).ravel()
+	return {"S": S, "V": V, "Vs": np.vstack((Vslack, np.zeros(nT))), "S0": np.vstack((S0.real, S0.imag)), "Y": Y}
+
+
+def measurements(truth, casedata, load_forecast, pv_forecast=None, meter_density=0.1, metered=None, uVm=1e-3,
+				 uVa=1e-2, uS=0.0, seed=None):
+	"""
+	Measurements of bus power and voltage magnitude and phase at a subset of the non-slack buses together with
+	pseudo-measurements (forecasts) of the bus power at all other buses, in the format of the estimators
+
+	:param truth: dict as returned by `simulate`
+	:param casedata: network as returned by `radial_feeder`
+	:param load_forecast: load forecast of all buses as returned by `load_profiles`
+	:param pv_forecast: (optional) generation forecast of all buses as returned by `pv_profiles`
+	:param meter_density: fraction of metered non-slack buses if `metered` is not given
+	:param metered: (optional) indices of the metered buses w/o slack bus
+	:param uVm: standard uncertainty of voltage magnitude measurements relative to the slack voltage
+	:param uVa: standard uncertainty of voltage phase measurements in degree
+	:param uS: standard uncertainty of bus power measurements in MW
+	:param seed: (optional) seed of the random number generator
+	:return: meas, meas_unc, meas_idx and pseudo_meas; voltage magnitudes in kV and phases in degree
+	"""
+	rng = np.random.RandomState(seed)
+	n_bus = casedata["bus"].shape[0]
+	nK = n_bus - 1
+	S, V = truth["S"], truth["V"]
+	nT = S.shape[1]
+	if metered is None:
+		metered = np.sort(rng.choice(nK, max(1, int(round(meter_density*nK))), replace=False))
+	metered = np.asarray(metered, dtype=int)
+	notmeas = np.setdiff1d(np.arange(nK), metered)
+	n = len(metered)
+	Vm = np.sqrt(V[:nK]**2 + V[nK:]**2)
+	Va = np.degrees(np.arctan2(V[nK:], V[:nK]))
+	uVm = uVm*truth["Vs"][0].mean()
+	meas_idx = {"Pk": metered, "Qk": metered, "Vm": metered, "Va": metered}
+	meas = {"Pk": S[:nK][metered] + uS*rng.randn(n, nT), "Qk": S[nK:][metered] + uS*rng.randn(n, nT),
+			"Vm": Vm[metered] + uVm*rng.randn(n, nT), "Va": Va[metered] + uVa*rng.randn(n, nT)}
+	meas_unc = {"Vm": uVm*np.ones(n), "Va": uVa*np.ones(n)}
+	if uS > 0:
+		meas_unc["Pk"] = uS*np.ones(n)
+		meas_unc["Qk"] = uS*np.ones(n)
+	forecast = -load_forecast if pv_forecast is None else pv_forecast - load_forecast
+	forecast = np.r_[forecast[1:n_bus], forecast[n_bus + 1:]]
+	pseudo_meas = {"Pk": forecast[:nK][notmeas], "Qk": forecast[nK:][notmeas]}
+	return meas, meas_unc, meas_idx, pseudo_meas